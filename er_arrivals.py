@@ -0,0 +1,166 @@
+import os, struct
+from datetime import datetime
+import numpy as np
+
+from er_state import PATIENT_TYPES, PATIENT_TYPE_CODES
+
+# Arrival trace file: header, then the sorted int64 arrival minutes (since 1970-01-01 00:00)
+# and one uint8 patient type code (see PATIENT_TYPES) per arrival
+TRACE_MAGIC = b'ERARRIVL'
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct('<8sHQ')  # magic, version, number of arrivals
+TRACE_COLUMNS = ['s_TRIAGEDATETIME', 's_DEPTCODE']
+DEPARTMENT_TYPES = {'SURG': 'trauma', 'DTRA': 'trauma', 'MED': 'med'}  # s_DEPTCODE -> patient type
+EPOCH = datetime(1970, 1, 1)
+
+
+def epoch_minute(moment):
+    """Minutes between 1970-01-01 00:00 and a datetime."""
+    return int((moment - EPOCH).total_seconds() // 60)
+
+
+class PoissonArrivals:
+    """
+    Synthetic arrivals: per-minute Poisson counts around the hourly mean/std of hourly_range
+    (see ERSimulation.draw_arrival_counts), each patient being 'med' with probability med_to_trauma_ratio.
+    """
+
+    def count_block(self, er, first, length):
+        """Arrival counts of the `length` minutes from simulation minute `first` on."""
+        return er.draw_arrival_counts(np.arange(first, first + length)).tolist()
+
+    def patient_types(self, er, count):
+        """Types of the `count` patients arriving in the current minute."""
+        stream = er.rng.patients
+        return ['med' if stream.random() < er.med_to_trauma_ratio else 'trauma' for _ in range(count)]
+
+
+class TraceArrivals:
+    """
+    Replay of recorded arrivals from an arrival trace file (see build_arrival_trace).
+
+    The file is memory-mapped, so years of history are replayed without reading them into memory;
+    the arrivals of a block of minutes are found by binary search on the sorted arrival minutes.
+    hourly_range, daily_patient_count and med_to_trauma_ratio are not used.
+
+    Parameters:
+    - path: arrival trace file
+    - trace_start: datetime (or "%Y-%m-%d %H:%M:%S" string) of the trace replayed at the simulation's
+      start, e.g. to replay another year; default: the simulation's start_datetime itself
+    """
+
+    def __init__(self, path, trace_start=None):
+        self.path = path
+        self.trace_start = datetime.strptime(trace_start, "%Y-%m-%d %H:%M:%S") if isinstance(trace_start, str) else trace_start
+        self.minutes, self.codes = read_arrival_trace(path)
+
+    def __getstate__(self):
+        return {'path': self.path, 'trace_start': self.trace_start}  # the memory maps are opened again
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['trace_start'])
+
+    def trace_minute(self, er, minute):
+        """The trace minute replayed at simulation minute `minute`."""
+        return epoch_minute(self.trace_start or er.start_datetime) + minute
+
+    def count_block(self, er, first, length):
+        start = self.trace_minute(er, first)
+        low, high = np.searchsorted(self.minutes, [start, start + length])
+        return np.bincount(self.minutes[low:high] - start, minlength=length).tolist()
+
+    def patient_types(self, er, count):
+        low = np.searchsorted(self.minutes, self.trace_minute(er, er.current_minute))
+        return [PATIENT_TYPES[code] for code in self.codes[low:low + count]]
+
+    def span(self):
+        """(first, last) arrival datetime of the trace, or None if it is empty."""
+        if not len(self.minutes):
+            return None
+        return tuple(np.datetime64(int(minute), 'm').astype(datetime) for minute in (self.minutes[0], self.minutes[-1]))
+
+
+def write_arrival_trace(path, minutes, codes):
+    """
+    Write an arrival trace file.
+
+    Parameters:
+    - path: output file
+    - minutes: arrival minutes since 1970-01-01 00:00 (sorted here)
+    - codes: patient type code of every arrival, see PATIENT_TYPE_CODES
+    """
+    minutes = np.asarray(minutes, dtype='<i8')
+    codes = np.asarray(codes, dtype=np.uint8)
+    order = np.argsort(minutes, kind='stable')
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'wb') as file:
+        file.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, len(minutes)))
+        file.write(minutes[order].tobytes())
+        file.write(codes[order].tobytes())
+    os.replace(path + '.tmp', path)
+
+
+def read_arrival_trace(path):
+    """Memory-mapped (minutes, codes) arrays of an arrival trace file."""
+    with open(path, 'rb') as file:
+        header = file.read(TRACE_HEADER.size)
+    if len(header) < TRACE_HEADER.size:
+        raise ValueError(f"{path} is not an arrival trace (too short).")
+    magic, version, count = TRACE_HEADER.unpack(header)
+    if magic != TRACE_MAGIC:
+        raise ValueError(f"{path} is not an arrival trace.")
+    if version > TRACE_VERSION:
+        raise ValueError(f"{path} is a version {version} arrival trace, this code reads up to version {TRACE_VERSION}.")
+    if os.path.getsize(path) != TRACE_HEADER.size + 9 * count:
+        raise ValueError(f"{path} is truncated.")
+    if not count:
+        return np.zeros(0, dtype='<i8'), np.zeros(0, dtype=np.uint8)
+    minutes = np.memmap(path, dtype='<i8', mode='r', offset=TRACE_HEADER.size, shape=(count,))
+    codes = np.memmap(path, dtype=np.uint8, mode='r', offset=TRACE_HEADER.size + 8 * count, shape=(count,))
+    return minutes, codes
+
+
+def build_arrival_trace(ehr_path, output, department_types=DEPARTMENT_TYPES, default_type='med',
+                        datetime_format="%Y-%m-%d %H:%M:%S", chunksize=500000, sep=','):
+    """
+    Preprocess the triage times and departments of an EHR extract (e.g. c548_T0_ERSim.parquet written by
+    get_ehrs.py) into an arrival trace file, reading the extract chunk by chunk.
+
+    Parameters:
+    - ehr_path: extract with the s_TRIAGEDATETIME and s_DEPTCODE columns (CSV or Parquet)
+    - output: arrival trace file
+    - department_types: {s_DEPTCODE: 'med' or 'trauma'} (default: DEPARTMENT_TYPES)
+    - default_type: patient type of departments missing from department_types
+    - datetime_format: strftime format of s_TRIAGEDATETIME
+    - chunksize: rows per chunk
+    - sep: field separator of a text extract
+
+    Returns:
+    - the number of arrivals written (rows without a valid triage time are skipped)
+    """
+    import pandas as pd
+    from er_calibration import read_chunks
+
+    codes_by_department = {department: PATIENT_TYPE_CODES[patient_type]
+                           for department, patient_type in department_types.items()}
+    default_code = PATIENT_TYPE_CODES[default_type]
+    minutes, codes = [], []
+    for chunk in read_chunks(ehr_path, TRACE_COLUMNS, chunksize, sep):
+        triage = pd.to_datetime(chunk['s_TRIAGEDATETIME'], format=datetime_format, errors='coerce')
+        valid = triage.notna().to_numpy()
+        minutes.append(triage.to_numpy(dtype='datetime64[ns]')[valid].astype('datetime64[m]').astype(np.int64))
+        departments = chunk['s_DEPTCODE'].to_numpy()[valid]
+        codes.append(np.array([codes_by_department.get(department, default_code) for department in departments], dtype=np.uint8))
+    minutes = np.concatenate(minutes) if minutes else np.zeros(0, dtype=np.int64)
+    codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.uint8)
+    write_arrival_trace(output, minutes, codes)
+    return len(minutes)
+
+
+if __name__ == '__main__':
+    import sys
+    ehr_path = sys.argv[1] if len(sys.argv) > 1 else '../data_ehr548/c548_T0_ERSim.parquet'
+    output = sys.argv[2] if len(sys.argv) > 2 else './settings/arrival_trace.bin'
+    print(f"{build_arrival_trace(ehr_path, output)} arrivals written to {output}.")
@@ -0,0 +1,207 @@
+import contextlib, copy, json, os, platform, resource, tempfile, time
+from concurrent.futures import ProcessPoolExecutor
+
+from er_replication import DEFAULT_SCENARIO, build_simulation
+
+# Simulated horizons from 2023-03-01 08:00
+HORIZONS = {'1d': "2023-03-02 07:59:00", '1w': "2023-03-08 07:59:00", '3m': "2023-06-01 07:59:00"}
+DAILY_PATIENTS = [100, 250, 500]
+VARIANTS = ['base', 'arrival_heavy', 'boarding_heavy', 'many_physicians']
+ENGINES = ['stepped', 'event']
+QUICK = {'horizons': ['1d', '1w'], 'daily_patients': [250]}
+
+
+def benchmark_cases(horizons=HORIZONS, daily_patients=DAILY_PATIENTS, variants=VARIANTS, engines=ENGINES):
+    """The cases of the suite: every engine, horizon, daily patient count and variant."""
+    return [{'engine': engine, 'horizon': horizon, 'daily_patients': count, 'variant': variant}
+            for engine in engines for horizon in horizons for count in daily_patients for variant in variants]
+
+
+def case_name(case):
+    return f"{case['engine']}-{case['horizon']}-{case['daily_patients']}-{case['variant']}"
+
+
+def build_case(case, seed=0):
+    """
+    The simulation of a benchmark case, from DEFAULT_SCENARIO.
+
+    Variants:
+    - base: the scenario as is
+    - arrival_heavy: twice the daily patients
+    - boarding_heavy: a quarter of the ward beds, so the admission queue grows long
+    - many_physicians: every shift doubled, with a clone of every physician and a generated roster
+    """
+    scenario = copy.deepcopy(DEFAULT_SCENARIO)
+    scenario['engine'] = case['engine']
+    scenario['simulation']['end_datetime'] = HORIZONS[case['horizon']]
+    scenario['simulation']['daily_patient_count'] = case['daily_patients'] * (2 if case['variant'] == 'arrival_heavy' else 1)
+    if case['variant'] == 'many_physicians':
+        csv_paths = sorted(os.path.join(scenario['physicians_dir'], name) for name in os.listdir(scenario['physicians_dir']) if name.endswith('.csv'))
+        scenario['physicians'] = [{'name': os.path.basename(path)[:-4] + suffix, 'csv': path} for suffix in ['', '_2'] for path in csv_paths]
+        scenario['shift_types'] += [dict(shift, name=shift['name'] + '_2') for shift in scenario['shift_types']]
+        scenario['shift_rules'].update({name + '_2': [None if shifts is None else [shift + '_2' for shift in shifts] for shifts in rule]
+                                        for name, rule in list(scenario['shift_rules'].items())})
+
+    er = build_simulation(scenario, seed)
+    if case['variant'] == 'many_physicians':
+        from er_roster_gen import RosterGenerator
+        linked_shifts = {'bn1': 'bn0', 'bn1_2': 'bn0_2'}
+        er.set_working_schedule(RosterGenerator.from_simulation(er, linked_shifts=linked_shifts).generate(seed))
+    if case['variant'] == 'boarding_heavy':
+        er.admission_count = {key: (mean / 4, std / 4) for key, (mean, std) in er.admission_count.items()}
+    return er
+
+
+def run_case(case, export=True, profile=True):
+    """
+    Run one benchmark case in this process and measure it.
+
+    The timed run is not profiled (the instrumentation slows the loop down); the phase times and
+    counters come from a second, profiled run of the same case (see ERSimulation.set_profiling).
+
+    Returns:
+    - {'case', the case keys, 'minutes' simulated, 'seconds', 'minutes_per_sec', 'peak_rss_mb',
+      'patients', 'phases': {phase: seconds}, 'counters'}; phases and counters come from the
+      profiled run's profile_report, the phases adding 'other' (the rest of its loop), then
+      'summary' (generate_summary) and 'export' (export_results, if pyarrow is installed) of the
+      timed run; without `profile` there are only these two phases and no counters
+    """
+    er = build_case(case)
+    first_minute = er.current_minute
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        er.start()
+    seconds = time.perf_counter() - start
+    minutes = er.current_minute - first_minute
+
+    phases = {}
+    start = time.perf_counter()
+    er.generate_summary()
+    summary_seconds = time.perf_counter() - start
+    export_seconds = None
+    if export:
+        try:
+            from er_export import export_results
+            with tempfile.TemporaryDirectory() as directory:
+                start = time.perf_counter()
+                export_results(er, directory)
+                export_seconds = time.perf_counter() - start
+        except ImportError:
+            pass
+    result = {
+        'case': case_name(case), **case,
+        'minutes': minutes,
+        'seconds': seconds,
+        'minutes_per_sec': minutes / seconds if seconds else float('inf'),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # ru_maxrss is in KiB on Linux
+        'patients': len(er.patient_records),
+        'phases': phases,
+        'counters': {},
+    }
+    del er
+
+    # The profiled run comes after the peak RSS is taken, and once the timed run is freed
+    if profile:
+        er = build_case(case)
+        er.set_profiling()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            er.start()
+        report = er.profile_report
+        phases.update((phase, timing['seconds']) for phase, timing in report['phases'].items())
+        phases['other'] = report['other_seconds']
+        result['counters'] = report['counters']
+    phases['summary'] = summary_seconds
+    if export_seconds is not None:
+        phases['export'] = export_seconds
+    return result
+
+
+def run_suite(cases, repeat=1, export=True, profile=True, verbose=True):
+    """
+    Run the cases one after the other, each in a fresh process (so peak RSS is the case's own);
+    of repeated runs the fastest is kept.
+
+    Returns:
+    - {case name: result of run_case}
+    """
+    results = {}
+    for case in cases:
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                runs.append(executor.submit(run_case, case, export, profile).result())
+        result = min(runs, key=lambda run: run['seconds'])
+        result['peak_rss_mb'] = max(run['peak_rss_mb'] for run in runs)
+        results[result['case']] = result
+        if verbose:
+            print(f"{result['case']}: {result['minutes_per_sec']:,.0f} simulated minutes/s, {result['seconds']:.2f} s, "
+                  f"peak RSS {result['peak_rss_mb']:.0f} MB, " + ", ".join(f"{phase} {value:.2f}" for phase, value in result['phases'].items()))
+    return results
+
+
+def save_baseline(results, path):
+    """Write suite results as a JSON baseline, with the interpreter and machine they were measured on."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, mode='w') as file:
+        json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'processor': platform.processor(),
+                   'created': time.strftime("%Y-%m-%d %H:%M:%S"), 'results': results}, file, indent=2)
+        file.write("\n")
+
+
+def load_baseline(path):
+    with open(path, mode='r') as file:
+        return json.load(file)['results']
+
+
+def compare_to_baseline(results, baseline, tolerance=0.2, min_seconds=0.05):
+    """
+    Regressions of suite results against a baseline.
+
+    Parameters:
+    - results, baseline: {case name: result}, see run_suite and load_baseline
+    - tolerance: relative slowdown or memory growth that is flagged
+    - min_seconds: phases shorter than this (in both) are not compared
+
+    Returns:
+    - list of messages, empty if nothing regressed
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if result['minutes_per_sec'] < reference['minutes_per_sec'] * (1 - tolerance):
+            regressions.append(f"{name}: {result['minutes_per_sec']:,.0f} simulated minutes/s, baseline {reference['minutes_per_sec']:,.0f}")
+        if result['peak_rss_mb'] > reference['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {result['peak_rss_mb']:.0f} MB, baseline {reference['peak_rss_mb']:.0f} MB")
+        for phase, seconds in result['phases'].items():
+            before = reference['phases'].get(phase)
+            if before is not None and max(seconds, before) >= min_seconds and seconds > before * (1 + tolerance):
+                regressions.append(f"{name}: {phase} {seconds:.2f} s, baseline {before:.2f} s")
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the ER simulation engines.")
+    parser.add_argument('--quick', action='store_true', help="only the 1-day and 1-week horizons at 250 daily patients")
+    parser.add_argument('--engine', choices=ENGINES, action='append', help="engines to run (default: both)")
+    parser.add_argument('--baseline', help="JSON baseline to compare with")
+    parser.add_argument('--save', help="write the results as a JSON baseline")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--no-profile', action='store_true', help="skip the profiled run giving the phase times and counters")
+    args = parser.parse_args()
+
+    from er_settings import ensure_default_settings
+    ensure_default_settings()
+    cases = benchmark_cases(engines=args.engine or ENGINES, **(QUICK if args.quick else {}))
+    results = run_suite(cases, repeat=args.repeat, profile=not args.no_profile)
+    if args.save:
+        save_baseline(results, args.save)
+    if args.baseline:
+        regressions = compare_to_baseline(results, load_baseline(args.baseline), args.tolerance)
+        print("\n".join(regressions) if regressions else "No regressions against the baseline.")
+        raise SystemExit(1 if regressions else 0)
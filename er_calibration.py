@@ -0,0 +1,113 @@
+import csv, os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+from er_state import DAY_NAMES
+
+EHR_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+CALIBRATION_COLUMNS = ['s_TRIAGEDATETIME', 's_DISCHARGEDATETIME', 's_disposition']
+
+
+def read_chunks(path, columns, chunksize=500000, sep=','):
+    """
+    Read only `columns` of a CSV (or tab-separated text) or Parquet file, chunksize rows at a time.
+
+    Parquet needs pyarrow; other files are read with pandas' chunked CSV reader.
+    """
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+    yield from pd.read_csv(path, sep=sep, usecols=columns, dtype=str, chunksize=chunksize)
+
+
+class HourlyCounts:
+    """
+    Number of events per calendar hour, accumulated chunk by chunk.
+
+    Only one counter per (date, hour) with events is kept, so the memory does not depend on the
+    number of rows. The statistics follow the pandas pivot the calibration used to build: per hour
+    of the day (and weekday), the mean and sample std (ddof=1) over the dates with at least one event.
+    """
+
+    def __init__(self):
+        self.counts = {}  # np.datetime64 hour -> number of events
+
+    def add(self, timestamps):
+        """Count a chunk of datetime64 values (NaT is skipped)."""
+        hours = timestamps.to_numpy(dtype='datetime64[ns]').astype('datetime64[h]')
+        hours = hours[~np.isnat(hours)]
+        values, counts = np.unique(hours, return_counts=True)
+        for hour, count in zip(values, counts):
+            self.counts[hour] = self.counts.get(hour, 0) + int(count)
+
+    def samples(self, by_weekday=False):
+        """{hour of day, or (weekday, hour of day): [count of every date with events]}"""
+        samples = {}
+        for hour, count in sorted(self.counts.items()):
+            moment = hour.astype(datetime)
+            key = (moment.weekday(), moment.hour) if by_weekday else moment.hour
+            samples.setdefault(key, []).append(count)
+        return samples
+
+
+def sample_mean_std(values):
+    """Mean and sample std as written to the settings files (empty when undefined, like pandas' to_csv)."""
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return '', ''
+    return values.mean(), values.std(ddof=1) if len(values) > 1 else ''
+
+
+def accumulate_ehr_counts(path, datetime_format=EHR_DATETIME_FORMAT, chunksize=500000, sep=','):
+    """
+    One pass over the EHR extract: hourly triage counts of all visits, and hourly discharge counts of admitted visits.
+
+    Parameters:
+    - path: extract with the s_TRIAGEDATETIME, s_DISCHARGEDATETIME and s_disposition columns (CSV or Parquet)
+    - datetime_format: strftime format of the datetime columns
+    - chunksize: rows per chunk
+    - sep: field separator of a text extract
+    """
+    arrivals, admissions = HourlyCounts(), HourlyCounts()
+    for chunk in read_chunks(path, CALIBRATION_COLUMNS, chunksize, sep):
+        arrivals.add(pd.to_datetime(chunk['s_TRIAGEDATETIME'], format=datetime_format, errors='coerce'))
+        admitted = chunk[chunk['s_disposition'] == 'admission']
+        admissions.add(pd.to_datetime(admitted['s_DISCHARGEDATETIME'], format=datetime_format, errors='coerce'))
+    return arrivals, admissions
+
+
+def write_hourly_arrivals(arrivals, csv_file_path):
+    """Write ersimulation_default.csv: mean and std of the hourly number of arrivals."""
+    samples = arrivals.samples()
+    with open(csv_file_path, mode='w', newline='') as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(['hour', 'mean', 'std'])
+        for hour in range(24):
+            mean, std = sample_mean_std(samples.get(hour, []))
+            writer.writerow([f"{hour:02d}:00-{hour:02d}:59", mean, std])
+
+
+def write_admissions(admissions, csv_file_path):
+    """Write admission_default.csv: mean and std of the number of admissions per weekday and hour."""
+    samples = admissions.samples(by_weekday=True)
+    with open(csv_file_path, mode='w', newline='') as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(['Day', 'Hour', 'Mean', 'Std'])
+        for (weekday, hour), counts in sorted(samples.items()):
+            mean, std = sample_mean_std(counts)
+            writer.writerow([DAY_NAMES[weekday], f"{hour:02d}:00-{hour:02d}:59", mean, std])
+
+
+def calibrate_from_ehr(ehr_path, ersimulation_csv="./settings/ersimulation_default.csv", admission_csv="./settings/admission_default.csv",
+                       datetime_format=EHR_DATETIME_FORMAT, chunksize=500000, sep=','):
+    """Build the arrival and admission settings files from an EHR extract in a single streaming pass."""
+    arrivals, admissions = accumulate_ehr_counts(ehr_path, datetime_format, chunksize, sep)
+    for path in [ersimulation_csv, admission_csv]:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    write_hourly_arrivals(arrivals, ersimulation_csv)
+    write_admissions(admissions, admission_csv)
@@ -0,0 +1,129 @@
+import os, pickle, struct, zlib
+
+from er_class import Patient
+
+# Snapshot file: header, then the zlib-compressed pickle of the simulation state
+CHECKPOINT_MAGIC = b'ERSIMCKP'
+CHECKPOINT_VERSION = 1
+HEADER = struct.Struct('<8sHHqQ')  # magic, version, compression level, minute, payload length
+
+
+def dump_state(er, level=1):
+    """
+    The compressed snapshot payload of a simulation; one using Patient's class-level defaults is
+    saved with a copy of them, which becomes its own defaults table when restored.
+    """
+    if er.trace is not None:
+        er.trace.flush()
+    if Patient.DEFAULT_TABLE is None:
+        Patient.compile_defaults()
+    state = {
+        'simulation': er,
+        'patient_defaults': Patient.DEFAULT_TABLE if er.patient_defaults is None else None,
+    }
+    return zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), level)
+
+
+def load_state(payload):
+    """Restore a simulation from a snapshot payload, see dump_state."""
+    state = pickle.loads(zlib.decompress(payload))
+    er, defaults = state['simulation'], state['patient_defaults']
+    if er.patient_defaults is None:
+        er.patient_defaults = defaults
+    return er
+
+
+def save_checkpoint(er, path, level=1):
+    """
+    Write a versioned binary snapshot of the complete simulation state: clock, patients and their
+    table, physicians, shift counters, roster inputs, random streams (with the values drawn ahead),
+    recorders, summary and, for the event-driven engine, the event queue.
+
+    A snapshot can be taken between two start() calls or, see ERSimulation.set_checkpoints, while
+    start() runs; the roster is left out and compiled again when the restored simulation starts.
+
+    Parameters:
+    - er: the simulation
+    - path: snapshot file
+    - level: zlib compression level (1 is fast enough to checkpoint every simulated day)
+
+    Returns:
+    - the number of bytes written
+    """
+    payload = dump_state(er, level)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as file:
+        file.write(HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, level, er.current_minute, len(payload)))
+        file.write(payload)
+    os.replace(temporary_path, path)  # a killed job never leaves a half-written snapshot
+    return HEADER.size + len(payload)
+
+
+def read_checkpoint_header(path):
+    """{'version', 'level', 'minute', 'size'} of a snapshot, without restoring it."""
+    with open(path, 'rb') as file:
+        header = file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"{path} is not an ER simulation checkpoint (too short).")
+    magic, version, level, minute, size = HEADER.unpack(header)
+    if magic != CHECKPOINT_MAGIC:
+        raise ValueError(f"{path} is not an ER simulation checkpoint.")
+    if version != CHECKPOINT_VERSION:
+        raise ValueError(f"{path} is a version {version} checkpoint, this code reads version {CHECKPOINT_VERSION}.")
+    return {'version': version, 'level': level, 'minute': minute, 'size': size}
+
+
+def read_payload(path):
+    header = read_checkpoint_header(path)
+    with open(path, 'rb') as file:
+        file.seek(HEADER.size)
+        payload = file.read(header['size'])
+    if len(payload) != header['size']:
+        raise ValueError(f"{path} is truncated.")
+    return payload
+
+
+def load_checkpoint(path):
+    """
+    Restore a simulation from a snapshot; start() continues it from the snapshot's minute.
+
+    A trace file and a patient history file (see ERSimulation.set_history_spill) are cut back to what
+    was written up to the snapshot, so that a restarted run appends to them without duplicates.
+    """
+    er = load_state(read_payload(path))
+    if er.trace is not None:
+        er.trace.truncate()
+    er.patient_records.truncate()
+    er.admission_records.truncate()
+    if er.verbose:
+        er.setup_logging()
+    return er
+
+
+def fork_checkpoint(source, seeds):
+    """
+    Independent continuations of one simulation state, e.g. what-if scenarios branched from a
+    warmed-up ER: the state is restored once per seed and reseeded with it (see ERSimulation.reseed).
+    The forks have no trace; give each its own EventTrace if needed. Their patient histories are
+    kept in memory, the chunks already written to a history file read back.
+
+    Parameters:
+    - source: snapshot file, or a simulation to snapshot in memory
+    - seeds: one seed per fork, e.g. from er_replication.replication_seeds
+
+    Returns:
+    - list of simulations, one per seed
+    """
+    payload = read_payload(source) if isinstance(source, (str, os.PathLike)) else dump_state(source)
+    forks = []
+    for seed in seeds:
+        er = load_state(payload)
+        er.trace = None
+        er.patient_records.detach()  # the forks do not share the history files
+        er.admission_records.detach()
+        er.reseed(seed)
+        forks.append(er)
+    return forks
@@ -1,71 +1,20 @@
-import random, os, csv, threading, time, glob, logging
+import os, csv, time, glob, logging
 from datetime import datetime, timedelta
 import numpy as np
-import pandas as pd
-
-def generate_patient_default_csv(filename="patient_default.csv"):
-    # Check if directory exists, if not create it
-    directory = os.path.dirname(filename)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-
-    # Check if the file already exists
-    if os.path.isfile(filename):
-        print(f"{filename} already exists. Skipping...")
-        return
-
-    with open(filename, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(["day", "hour", "patient_type", "boarding_blood", "disease_blood", "departure_blood", "increase_rate"])
-        days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        hours = ["{:02d}:00-{:02d}:59".format(i, i) for i in range(24)]
-        for day in days:
-            for hour in hours:
-                writer.writerow([day, hour, "med", 30, 100, 10, 1])
-                writer.writerow([day, hour, "trauma", 50, 150, 15, 2])
-
-def generate_physician_default_csv(filename="physician_default.csv"):
-    # Check if directory exists, if not create it
-    directory = os.path.dirname(filename)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-
-    # Check if the file already exists
-    if os.path.isfile(filename):
-        print(f"{filename} already exists. Skipping...")
-        return
-    
-    with open(filename, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(["hour", "med", "trauma"])
-        hours = ["{:02d}:00-{:02d}:59".format(i, i) for i in range(24)]
-        for hour in hours:
-            writer.writerow([hour, 5, 7])
-
+from er_state import PatientTable, PatientIndex, PhysicianRegistry, registry_column, STATUS_NAMES, STATUS_CODES, PATIENT_TYPES, PATIENT_TYPE_CODES, DAY_NAMES, HOUR_LABELS, HOUR_CODES, table_column
+from er_roster import RosterTimeline
+from er_trace import TRACE_KIND_CODES
+from er_recorders import CountRecorder, PhysicianRecorder, PatientHistory, AdmissionRecorder
+from er_summary import ShiftSummary
+from er_rng import SimulationRNG, default_rng
+from er_arrivals import PoissonArrivals
+from er_settings import ensure_default_settings
 
-def generate_ersimulation_default_csv(filename="ersimulation_default.csv"):
-    # Check if directory exists, if not create it
-    directory = os.path.dirname(filename)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-
-    # Check if the file already exists
-    if os.path.isfile(filename):
-        print(f"{filename} already exists. Skipping...")
-        return
-    
-    with open(filename, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(["hour", "min_patients", "max_patients"])
-        hours = ["{:02d}:00-{:02d}:59".format(i, i) for i in range(24)]
-        for hour in hours:
-            writer.writerow([hour, 5, 10])
-
-generate_patient_default_csv("settings/patient_default.csv")
-generate_physician_default_csv("settings/physician_default.csv")
-generate_ersimulation_default_csv("settings/ersimulation_default.csv")
 
 class Patient:
+    # No per-instance __dict__; the state lives in the PatientTable row, or in the _values dict while the
+    # patient has no table (see PatientTable.detached_values); _synced and _version are used by the event-driven engine
+    __slots__ = ('num', '_table', '_row', '_values', 'arrival_time', 'patient_type', 'type_code', '_synced', '_version')
     patient_counter = 0  # This is a class-level variable
     DEFAULT_BLOOD_VALUES = {
         'Monday': {
@@ -84,25 +33,52 @@ class Patient:
         },
         # ...
     }
+    DEFAULT_TABLE = None  # compiled from the two dicts above, see compile_defaults; used by patients without a simulation's defaults
+    DEFAULT_COLUMNS = ['boarding', 'disease', 'departure', 'increase_rate']
     
-    def __init__(self, arrival_time, patient_type, boarding_blood=None, disease_blood=None, departure_blood=None):
-        Patient.patient_counter += 1
-        self.num = Patient.patient_counter
+    def __init__(self, arrival_time, patient_type, boarding_blood=None, disease_blood=None, departure_blood=None, table=None, num=None,
+                 weekday=None, hour=None, rng=None, defaults=None):
+        # weekday, hour: clock indices of arrival_time, if the caller already has them
+        # rng: the simulation's SimulationRNG (the initial blood values come from its patients stream)
+        # defaults: the simulation's defaults table (ERSimulation.patient_defaults), else the class-level DEFAULT_TABLE
+        # Simulations number their own patients; standalone patients use the class-level counter
+        if num is None:
+            Patient.patient_counter += 1
+            num = Patient.patient_counter
+        self.num = num
+
+        # The patient's state lives in a row of a PatientTable (shared with the simulation's other patients)
+        self._table = table
+        if table is not None:
+            self._row, self._values = table.add(self), None
+        else:
+            self._row, self._values = None, PatientTable.detached_values()
         
         self.arrival_time = arrival_time
-        day_of_week = arrival_time.strftime('%A')
-        hour_of_day = arrival_time.strftime('%H:00-%H:59')
+        if weekday is None:
+            weekday, hour = arrival_time.weekday(), arrival_time.hour
         
         self.patient_type = patient_type
-        default_boarding_blood = Patient.DEFAULT_BLOOD_VALUES[day_of_week][hour_of_day][patient_type]['boarding']
-        default_disease_blood = Patient.DEFAULT_BLOOD_VALUES[day_of_week][hour_of_day][patient_type]['disease']
-        default_departure_blood = Patient.DEFAULT_BLOOD_VALUES[day_of_week][hour_of_day][patient_type]['departure']
-        default_increase_rate = Patient.DEFAULT_DISEASE_INCREASE_RATES[day_of_week][hour_of_day][patient_type]
-
-        self.boarding_blood = boarding_blood or max(10,int(random.gauss(default_boarding_blood, default_boarding_blood/2)))
-        self.disease_blood = disease_blood or max(50,int(random.gauss(default_disease_blood, default_disease_blood/2)))
-        self.departure_blood = departure_blood or max(5,int(random.gauss(default_departure_blood, default_departure_blood/2)))
-        self.disease_increase_rate = max(0,int(10*random.gauss(default_increase_rate, 2))/10)
+        self.type_code = PATIENT_TYPE_CODES[patient_type]
+        if table is not None:
+            table.patient_type[self._row] = self.type_code
+        else:
+            self._values['patient_type'] = self.type_code
+        if defaults is None:
+            if Patient.DEFAULT_TABLE is None:
+                Patient.compile_defaults()
+            defaults = Patient.DEFAULT_TABLE
+        defaults = defaults[weekday, hour, self.type_code].tolist()
+        if defaults[0] != defaults[0]:  # NaN: no defaults for this day and hour
+            raise KeyError(f"No patient defaults for {DAY_NAMES[weekday]} {HOUR_LABELS[hour]} {patient_type}, "
+                           f"see ERSimulation.load_patient_defaults_from_csv.")
+        default_boarding_blood, default_disease_blood, default_departure_blood, default_increase_rate = defaults
+
+        stream = (rng or default_rng()).patients
+        self.boarding_blood = boarding_blood or max(10,int(stream.gauss(default_boarding_blood, default_boarding_blood/2)))
+        self.disease_blood = disease_blood or max(50,int(stream.gauss(default_disease_blood, default_disease_blood/2)))
+        self.departure_blood = departure_blood or max(5,int(stream.gauss(default_departure_blood, default_departure_blood/2)))
+        self.disease_increase_rate = max(0,int(10*stream.gauss(default_increase_rate, 2))/10)
 
         self.status = 'triage'
         self.discharge_status = False
@@ -111,53 +87,107 @@ class Patient:
         self.underTreat = 0
         self.bedsideVisit = 0        
 
-    def update_disease_blood(self, elapsed_time):
-        if self.disease_blood > 0:
-            self.disease_blood += self.disease_increase_rate * elapsed_time
-
-    def update_blood_and_status(self, elapsed_time, current_time):
-        # Update disease blood based on elapsed time
-        self.update_disease_blood(elapsed_time)
-
-        if self.underTreat > 0:
-            self.underTreat = max(0, self.underTreat - elapsed_time)  # Decrement underTreat, but not below 0
-        
-        # Assuming the physician's mojo is a number indicating how much blood is reduced per second
-        if self.assigned_physician:
-            mojo = self.assigned_physician.get_mojo(self.patient_type, current_time)
-            blood_reduction = mojo * elapsed_time  #  elapsed_time is in minutes
-            
-            if self.underTreat > 0 and self.disease_blood > 0:
-                self.disease_blood = max(0, self.disease_blood - blood_reduction)  
-                print(f"Patient {self.num} disease blood reduced by {blood_reduction} to {self.disease_blood} by {self.assigned_physician.name}.")
-                logging.info(f"Patient {self.num} disease blood reduced by {blood_reduction} to {self.disease_blood} by {self.assigned_physician.name}.")             
-
-        # Update patient's status based on blood values
-        if self.status != 'admission':
-            if self.boarding_blood <= 0:
-                self.status = 'on-board'
-            if self.disease_blood <= 0:
-                self.status = 'wait-depart'
-                self.need_admission = False
-            if self.departure_blood <= 0:
-                self.status = 'discharge'
-                self.discharge_status = True
-                self.need_admission = False
+    def __setstate__(self, state):
+        _, state = state  # the (None, slots) pair pickled for a class with __slots__
+        self._values = None
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    boarding_blood = table_column('boarding_blood', float)
+    disease_blood = table_column('disease_blood', float)
+    departure_blood = table_column('departure_blood', float)
+    disease_increase_rate = table_column('increase_rate', float)
+    underTreat = table_column('under_treat', int)
+    need_admission = table_column('need_admission', bool)
+    discharge_status = table_column('discharged', bool)
+    bedsideVisit = table_column('bedside_visit', int)
+
+    @property
+    def status(self):
+        if self._table is None:
+            return STATUS_NAMES[self._values['status']]
+        return STATUS_NAMES[self._table.status[self._row]]
+
+    @status.setter
+    def status(self, value):
+        if self._table is None:
+            self._values['status'] = STATUS_CODES[value]
+        else:
+            self._table.status[self._row] = STATUS_CODES[value]
+
+    @property
+    def assigned_physician(self):
+        if self._table is None:
+            return self._values['physician_object']
+        return self._table.physician_objects[self._row]
+
+    @assigned_physician.setter
+    def assigned_physician(self, physician):
+        index = getattr(physician, 'index', None)
+        if self._table is None:
+            self._values['physician_object'], self._values['physician'] = physician, -1 if index is None else index
+        else:
+            self._table.physician_objects[self._row] = physician
+            self._table.physician[self._row] = -1 if index is None else index
 
-    @classmethod
-    def load_defaults_from_csv(cls, csv_file_path):
+    @staticmethod
+    def read_defaults_csv(csv_file_path, blood_values=None, increase_rates=None):
+        """
+        The (blood values, disease increase rates) dicts of a patient defaults CSV, keyed by day, hour
+        and patient type; the rows are merged into the given dicts, if any.
+        """
+        blood_values = {} if blood_values is None else blood_values
+        increase_rates = {} if increase_rates is None else increase_rates
         with open(csv_file_path, mode='r') as csv_file:
             csv_reader = csv.reader(csv_file)
             next(csv_reader)  # Skip the header row
             for row in csv_reader:
                 day, hour, patient_type, boarding_value, disease_value, departure_value, increase_rate = row
-                blood_values = {
+                values = {
                     'boarding': int(boarding_value),
                     'disease': int(disease_value),
                     'departure': int(departure_value)
                 }
-                cls.DEFAULT_BLOOD_VALUES.setdefault(day, {}).setdefault(hour, {})[patient_type] = blood_values
-                cls.DEFAULT_DISEASE_INCREASE_RATES.setdefault(day, {}).setdefault(hour, {})[patient_type] = int(increase_rate)
+                blood_values.setdefault(day, {}).setdefault(hour, {})[patient_type] = values
+                increase_rates.setdefault(day, {}).setdefault(hour, {})[patient_type] = int(increase_rate)
+        return blood_values, increase_rates
+
+    @classmethod
+    def load_defaults_from_csv(cls, csv_file_path):
+        """
+        Merge a patient defaults CSV into the class-level defaults, shared by every patient created
+        without a simulation's own table; simulations load theirs with ERSimulation.load_patient_defaults_from_csv.
+        """
+        cls.read_defaults_csv(csv_file_path, cls.DEFAULT_BLOOD_VALUES, cls.DEFAULT_DISEASE_INCREASE_RATES)
+        cls.compile_defaults()
+
+    @classmethod
+    def compile_defaults(cls):
+        """
+        Compile DEFAULT_BLOOD_VALUES and DEFAULT_DISEASE_INCREASE_RATES into DEFAULT_TABLE, see defaults_table.
+        Call again after changing the dicts directly; load_defaults_from_csv does it.
+        """
+        cls.DEFAULT_TABLE = cls.defaults_table(cls.DEFAULT_BLOOD_VALUES, cls.DEFAULT_DISEASE_INCREASE_RATES)
+
+    @staticmethod
+    def defaults_table(blood_values, increase_rates):
+        """
+        Array of patient defaults indexed by (weekday, hour, patient type code, DEFAULT_COLUMNS), from
+        the dicts of read_defaults_csv. Entries missing from the dicts are NaN.
+        """
+        table = np.full((len(DAY_NAMES), len(HOUR_LABELS), len(PATIENT_TYPES), len(Patient.DEFAULT_COLUMNS)), np.nan)
+        for weekday, day in enumerate(DAY_NAMES):
+            for hour_label, by_type in blood_values.get(day, {}).items():
+                hour = HOUR_CODES.get(hour_label)
+                if hour is None:
+                    continue
+                for patient_type, values in by_type.items():
+                    increase_rate = increase_rates.get(day, {}).get(hour_label, {}).get(patient_type)
+                    if increase_rate is None or patient_type not in PATIENT_TYPE_CODES:
+                        continue
+                    table[weekday, hour, PATIENT_TYPE_CODES[patient_type]] = [values['boarding'], values['disease'],
+                                                                              values['departure'], increase_rate]
+        return table
 
     '''
     CSV file should be structured as follows:
@@ -167,16 +197,18 @@ class Patient:
     '''
 
 class Physician:
-    used_names = set()  # This is a class-level set to store used names
-    
-    def __init__(self, name, abilities=None, energy=180):
-        if name in Physician.used_names:
-            raise ValueError(f"The name '{name}' is already in use. Please choose a different name.")
+    __slots__ = ('name', 'index', '_registry', '_row', '_values', 'abilities')  # the state lives in the PhysicianRegistry row
+
+    def __init__(self, name, abilities=None, energy=180, rng=None):
+        # Names are unique per simulation, see ERSimulation.add_physician
         self.name = name
-        Physician.used_names.add(name)  # Add the name to the set of used names
+        self.index = None  # id in ERSimulation.physicians, set when the physician joins a simulation
+        # The physician's state lives in a row of a PhysicianRegistry once it joins a simulation; until then, in a plain dict
+        self._registry, self._row = None, None
+        self._values = {'energy': 0, 'fatigue': 0, 'rest_tendency': 0.0, 'shift_type': None}
         
         if abilities is None:
-            self.abilities = self.default_abilities()
+            self.abilities = self.default_abilities(rng)
             # self.set_abilities_from_csv("./settings/physician_default.csv")
         else:
             self.abilities = abilities
@@ -185,12 +217,37 @@ class Physician:
         self.rest_tendency = 1  # Default rest tendency is 1, minimum is 1
         self.shift_type = None  # Initial shift type is None
 
+    def __setstate__(self, state):
+        _, state = state  # the (None, slots) pair pickled for a class with __slots__
+        self._values = None
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    energy = registry_column('energy', int)
+    fatigue = registry_column('fatigue', int)
+    rest_tendency = registry_column('rest_tendency', float)
+
+    @property
+    def shift_type(self):
+        if self._registry is None:
+            return self._values['shift_type']
+        return self._registry.shift_types[self._row]
+
+    @shift_type.setter
+    def shift_type(self, value):
+        if self._registry is None:
+            self._values['shift_type'] = value
+        else:
+            self._registry.set_shift(self._row, value)
+
     @staticmethod
-    def default_abilities():
+    def default_abilities(rng=None):
+        # rng: SimulationRNG whose abilities stream draws the mojo
+        stream = (rng or default_rng()).abilities
         abilities = {}
-        hours = ["{:02d}:00-{:02d}:59".format(i, i) for i in range(24)]
-        med_mojo = int(100*max(3,random.gauss(9, 2)))/100
-        trauma_mojo = int(100*max(3,random.gauss(9, 2)))/100
+        hours = HOUR_LABELS
+        med_mojo = int(100*max(3,stream.gauss(9, 2)))/100
+        trauma_mojo = int(100*max(3,stream.gauss(9, 2)))/100
         for hour in hours:
             abilities[hour] = {'med': med_mojo, 'trauma': trauma_mojo}
         return abilities
@@ -214,9 +271,7 @@ class Physician:
         Returns:
         - The mojo value
         """
-        hour_of_day = current_time.strftime('%H:00-%H:59')
-        
-        return self.abilities.get(hour_of_day, {}).get(patient_type, 0)
+        return self.abilities.get(HOUR_LABELS[current_time.hour], {}).get(patient_type, 0)
 
     '''
     CSV file should be structured as follows:
@@ -226,14 +281,14 @@ class Physician:
     '''
 
 class ShiftType:
-    used_names = set()  # This is a class-level set to store used names
-    all_shifts = []
+    all_shifts = []  # Registry of shifts created outside a simulation
 
-    def __init__(self, name, start_time_str, end_time_str, recieve_patient_type=['med', 'trauma'], new_patient=True):
-        if name in ShiftType.used_names:
+    def __init__(self, name, start_time_str, end_time_str, recieve_patient_type=['med', 'trauma'], new_patient=True, registry=None):
+        # Shift names are unique within a registry: the simulation's shift_types, or ShiftType.all_shifts
+        self.registry = ShiftType.all_shifts if registry is None else registry
+        if any(shift.name == name for shift in self.registry):
             raise ValueError(f"The name '{name}' is already in use. Please choose a different name.")
         self.name = name
-        ShiftType.used_names.add(name)  # Add the name to the set of used names
         
         self.start_time = self._convert_to_time(start_time_str)
         self.end_time = self._convert_to_time(end_time_str)
@@ -244,11 +299,12 @@ class ShiftType:
         else:
             self.end_day_offset = 0
         
+        self.index = len(self.registry)  # position in the registry, used by the compiled roster
         self.recieve_patient_type = recieve_patient_type
         self.recieve_patient_num = 0
         self.new_patient = new_patient
         self.shift_rule = None  # Initial rule is None
-        ShiftType.all_shifts.append(self)
+        self.registry.append(self)
 
 
     def _convert_to_time(self, time_str):
@@ -275,24 +331,25 @@ class ShiftType:
             'no_division': [self.get_shift_by_name(name) for name in no_division] if no_division else None
         }
     
-    def get_handoff_shift(self, arrival_datetime, current_time):
-        """Determine which shift to hand off a patient based on their arrival time."""
+    def get_handoff_shift(self, arrival_datetime, current_time, rng=None):
+        """Determine which shift to hand off a patient based on their arrival time (drawn from rng's assignment stream)."""
+        stream = (rng or default_rng()).assignment
         if self.shift_rule.get('no_division'):
-            return random.choice(self.shift_rule['no_division'])
+            return stream.choice(self.shift_rule['no_division'])
         if arrival_datetime.date() < current_time.date():
-            return random.choice(self.shift_rule['before_midnight'])
+            return stream.choice(self.shift_rule['before_midnight'])
         else:
-            return random.choice(self.shift_rule['after_midnight'])
+            return stream.choice(self.shift_rule['after_midnight'])
         
-    @classmethod
-    def get_shift_by_name(cls, name):
-        for shift in cls.all_shifts:
+    def get_shift_by_name(self, name):
+        for shift in self.registry:
             if shift.name == name:
                 return shift
         return None
 
 class ERSimulation:
     FRAME_RATE = 100  # Default frame rate is 100 frames per second
+    COUNT_BLOCK = 1440  # minutes of arrival and ward-bed counts drawn at once
     def __init__(self, 
                  start_datetime, 
                  end_datetime, 
@@ -300,8 +357,25 @@ class ERSimulation:
                  med_to_trauma_ratio, 
                  csv_file_path=None,
                  admission_csv_path=None,
-                 Simulate=False):
-        self.setup_logging()
+                 Simulate=False,
+                 verbose=0,
+                 trace=None,
+                 seed=None,
+                 crn_key=None,
+                 arrival_source=None):
+        # verbose: 0 runs silently (nothing is formatted, no log file), 1 writes the log file,
+        # 2 also prints the trace lines to the console
+        self.verbose = verbose
+        self.trace = trace  # optional EventTrace receiving structured events
+        # All random draws of the simulation; the same seed gives the same run. With a crn_key (e.g. the
+        # scenario name), runs of different scenarios with one seed share arrivals, patients and
+        # ward-bed releases (common random numbers), see SimulationRNG
+        self.rng = SimulationRNG(seed, behaviour_key=crn_key)
+        self._count_blocks = {}  # 'arrivals'/'admissions' -> (first minute, per-minute counts drawn ahead)
+        # Where arrivals come from: synthetic Poisson arrivals, or a recorded trace (see er_arrivals)
+        self.arrival_source = arrival_source or PoissonArrivals()
+        if self.verbose:
+            self.setup_logging()
         self.daily_patient_count = daily_patient_count
         self.med_to_trauma_ratio = med_to_trauma_ratio
         if csv_file_path:
@@ -316,29 +390,133 @@ class ERSimulation:
         self.adjust_hourly_range()
 
         self.patients = []
-        self.physicians = []
+        self.patient_counter = 0  # Patients are numbered per simulation
+        self.patient_table = PatientTable()
+        # This simulation's patient defaults, see load_patient_defaults_from_csv (Patient's class-level defaults if None)
+        self.patient_defaults = None
+        self.patient_index = PatientIndex()  # patients and counters per physician
+        self.bedside_patients = {}  # physician -> patient at whose bedside the physician is
+        self.physicians = PhysicianRegistry()  # the physicians by id, with their state arrays
         self.shift_types = []
         self.start_datetime = datetime.strptime(start_datetime, "%Y-%m-%d %H:%M:%S")
         self.end_datetime = datetime.strptime(end_datetime, "%Y-%m-%d %H:%M:%S")
-        self.current_time = self.start_datetime
+        self._start_mod = self.start_datetime.hour * 60 + self.start_datetime.minute  # minute of day of minute 0
+        self._start_weekday = self.start_datetime.weekday()
+        self.set_clock(0)  # current_time, current_minute (minutes since start_datetime), current_hour, current_weekday
+        self.roster = None  # RosterTimeline compiled by start()
         self.time_speed = 1  # Default is real-time
         self.running = False
-        self.patient_records = {}
+        self.patient_records = PatientHistory(self.start_datetime, self.physicians)  # transitions of every patient, see set_history_spill
+        self.admission_records = AdmissionRecorder()  # (patient num, minute admitted, minutes waited for the bed) of every ward admission
         self.Simulate = Simulate
 
         # attributes for recording
-        self.physician_records = {}  # Stores physician's actions every minute
-        self.shift_records = {}  # Stores shiftType's patient counts (status and underTreat) every minute
-        self.total_er_records = []  # Stores total ER patient counts (status and underTreat) every minute
+        # Columnar recorders, created by start() once the physicians and shift types are known
+        self.physician_records = None  # PhysicianRecorder: physician's actions every minute
+        self.shift_records = None  # CountRecorder: shiftType's patient counts (status and underTreat) every minute
+        self.total_er_records = None  # CountRecorder: total ER patient counts (status and underTreat) every minute
+        self.shift_summary = None  # ShiftSummary fed by record_patient_process
+
+        # Periodic checkpoints while start() runs, see set_checkpoints
+        self.checkpoint_path = None
+        self.checkpoint_every = None
+        self._next_checkpoint = None
+
+        # Optional per-phase timers and counters of start(), see set_profiling
+        self.profiler = None
+        self.profile_report = None
+
+    def __getstate__(self):
+        # The roster is compiled again by start(); left out, it does not weigh on every snapshot
+        state = self.__dict__.copy()
+        state['roster'] = None
+        if self.profiler is not None:
+            # Methods instrumented by a running profiler are the class's again when the snapshot is loaded
+            for name in self.profiler.wrapped:
+                state.pop(name, None)
+        return state
+
+    def set_checkpoints(self, path, every=1440):
+        """
+        Save a checkpoint (see er_checkpoint.save_checkpoint) every `every` simulated minutes while start() runs.
+
+        Parameters:
+        - path: snapshot file, formatted with the minute, e.g. "checkpoints/er_{minute:06d}.ckpt"
+          (a path without a {minute} field is overwritten by every checkpoint)
+        - every: minutes between checkpoints, None to stop checkpointing
+        """
+        self.checkpoint_path = path
+        self.checkpoint_every = every
+        self._next_checkpoint = (self.current_minute // every + 1) * every if every else None
+
+    def checkpoint_if_due(self):
+        """Save a checkpoint if the clock reached the next checkpoint minute."""
+        if self.current_minute >= self._next_checkpoint:
+            from er_checkpoint import save_checkpoint
+            save_checkpoint(self, self.checkpoint_path.format(minute=self.current_minute))
+            self._next_checkpoint = (self.current_minute // self.checkpoint_every + 1) * self.checkpoint_every
+
+    def set_history_spill(self, path, chunk_size=65536, admissions_path=None):
+        """
+        Write the histories of the patients who left the ER to `path`, and the ward admissions to
+        `admissions_path`, in chunks, instead of keeping them in memory (see er_recorders.PatientHistory
+        and AdmissionRecorder); call before any patient is recorded.
+
+        Parameters:
+        - path: binary history file, overwritten
+        - chunk_size: number of transitions (and of admissions) buffered before they are written out
+        - admissions_path: binary admissions file, overwritten (default: path with the extension
+          replaced by '_admissions.bin')
+        """
+        if len(self.patient_records) or len(self.admission_records):
+            raise ValueError("Set the history file before any patient is recorded.")
+        self.patient_records = PatientHistory(self.start_datetime, self.physicians, path, chunk_size)
+        self.admission_records = AdmissionRecorder(admissions_path or os.path.splitext(path)[0] + '_admissions.bin', chunk_size)
+
+    def set_profiling(self, enabled=True, sampler=None):
+        """
+        Time the phases of start() (arrival, treatment, admission, update, recording, handoff) and count
+        the work done (patients scanned, records appended, handoffs, ...); see er_profile.PhaseProfiler.
+        After every start(), profile_report holds the report of all runs so far. Without profiling,
+        start() runs uninstrumented.
+
+        Parameters:
+        - enabled: False removes the profiler
+        - sampler: optional sampling profiler run alongside, e.g. er_profile.StackSampler()
+
+        Returns:
+        - the PhaseProfiler, or None
+        """
+        if enabled:
+            from er_profile import PhaseProfiler
+            self.profiler = PhaseProfiler(sampler)
+        else:
+            self.profiler = None
+        self.profile_report = None
+        return self.profiler
+
+    def reseed(self, seed):
+        """Replace the random streams, e.g. in a fork of a checkpoint; counts drawn ahead are drawn again."""
+        self.rng = SimulationRNG(seed, behaviour_key=self.rng.behaviour_key)
+        self._count_blocks = {}
+
+    def set_clock(self, minute):
+        """Move the clock to minute index `minute`, with the hour and weekday indices of the settings tables."""
+        self.current_minute = minute
+        self.current_time = self.start_datetime + timedelta(minutes=minute)
+        minute_of_day = self._start_mod + minute
+        self.current_hour = (minute_of_day // 60) % 24
+        self.current_weekday = (self._start_weekday + minute_of_day // 1440) % 7
+        self.patient_index.minute = minute
 
     def setup_logging(self):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         # Remove existing log file (if it exists)
-        log_file_path = f"./log/ersimulation_{timestamp}.log"  
+        # The process id keeps simultaneous replications from sharing (and removing) a log file
+        log_file_path = f"./log/ersimulation_{timestamp}_{os.getpid()}.log"  
 
         # Ensure the log directory exists
-        if not os.path.exists("./log"):
-            os.makedirs("./log")
+        os.makedirs("./log", exist_ok=True)
         if os.path.exists(log_file_path):
             os.remove(log_file_path)
 
@@ -347,6 +525,12 @@ class ERSimulation:
                             format='%(asctime)s - %(message)s', 
                             datefmt='%Y-%m-%d %H:%M:%S')
 
+    def log(self, message, echo=True):
+        """Write a trace line to the log file, and to the console at verbose level 2 unless echo is False."""
+        logging.info(message)
+        if echo and self.verbose >= 2:
+            print(message)
+
     def set_time_speed(self, speed):
         """
         Set the time speed of the simulation.
@@ -367,7 +551,8 @@ class ERSimulation:
         else:
             self.time_speed = 1 / (1+ abs(speed))
 
-    def start(self):
+    def check_ready(self):
+        """Raise if the simulation is not fully configured (shifts, handoff rules and schedule)."""
         # Ensure that there's at least one ShiftType added before starting
         if not self.shift_types:
             raise RuntimeError("At least one ShiftType needs to be added before starting the simulation.")
@@ -380,72 +565,117 @@ class ERSimulation:
         if not hasattr(self, 'working_schedule') or not self.working_schedule:
             raise RuntimeError("Please create a working schedule before starting the simulation.")
 
-        self.running = True
-        while self.running and self.current_time < self.end_datetime:
-            frame_duration = 1 / (ERSimulation.FRAME_RATE * self.time_speed)  # duration of a frame in real-world seconds
-            self.current_time += timedelta(minutes=1)
-            print(self.current_time)
-            logging.info(self.current_time)
-
-            # Patient arrival logic
-            self.patient_arrival()
-
-            discharged_patients = []  # List to store patients who have been discharged this iteration
-            # Handle physician-patient interactions
-            # Determine which physicians are currently working
-            current_shift = [shift for shift in self.shift_types if shift.is_time_within_shift(self.current_time.time())]
-            current_physician_names = []
-            for shift in current_shift:
-                # Determine the date to use for looking up the schedule for this specific shift
-                if self.current_time.time() < shift.start_time:
-                    lookup_date = self.current_time.date() - timedelta(days=1)
-                else:
-                    lookup_date = self.current_time.date()
-
-                physician_name = self.working_schedule.get(lookup_date, {}).get(shift.name)
-                if physician_name:
-                    current_physician_names.append(physician_name)
-
-            current_physicians = [physician for physician in self.physicians if physician.name in current_physician_names]
-
-            discharged_patients = []  # List to store patients who have been discharged this iteration
-            # Handle physician-patient interactions for only those physicians currently working
-            for physician in current_physicians:
-                self.physician_treat_patient(physician)
-
-            self.ward_admission()
-
-            for patient in self.patients:
-                self.record_patient_process(patient)
-                patient.update_blood_and_status(1, self.current_time)
-                if patient.discharge_status:
-                    discharged_patients.append(patient)
-                self.record_patient_process(patient)
-
-            # Remove discharged patients from the active patient list
-            for patient in discharged_patients:
-                self.record_patient_process(patient)
-                print(f"Patient {patient.num} discharged at {self.current_time}.")
-                logging.info(f"Patient {patient.num} discharged at {self.current_time}.")
-                self.patients.remove(patient)
-                del patient  # Explicitly delete the patient object
-
-            # Record total ER patient counts for this frame (minute)
-            self.record_patient_counts()
-
-            # Check for shift change and handoff patients
-            self.check_shift_change_and_handoff()
+    def start(self):
+        self.check_ready()
+        self.roster = self.compile_roster()
+        self.compile_settings_tables()
+        self.set_clock(int((self.current_time - self.start_datetime).total_seconds() // 60))
+        self.prepare_recorders()
+        if self.profiler is not None:
+            self.profiler.begin(self)
 
-            if self.Simulate:    
-                time.sleep(frame_duration)
-        self.running = False
-        print("Simulation ending.")
-        logging.info("Simulation ending.")
+        self.running = True
+        try:
+            while self.running and self.current_time < self.end_datetime:
+                frame_duration = 1 / (ERSimulation.FRAME_RATE * self.time_speed)  # duration of a frame in real-world seconds
+                self.set_clock(self.current_minute + 1)
+                if self.verbose:
+                    self.log(self.current_time)
+
+                # Patient arrival logic
+                self.patient_arrival()
+
+                # Handle physician-patient interactions for only those physicians currently working
+                for physician in self.current_physicians():
+                    self.physician_treat_patient(physician)
+
+                self.ward_admission()
+
+                self.update_patients()
+
+                # Record total ER patient counts for this frame (minute)
+                self.record_patient_counts()
+
+                # Check for shift change and handoff patients
+                self.check_shift_change_and_handoff()
+
+                if self.checkpoint_every:
+                    self.checkpoint_if_due()
+
+                if self.Simulate:    
+                    time.sleep(frame_duration)
+        finally:
+            self.running = False
+            if self.trace is not None:
+                self.trace.flush()
+            if self.profiler is not None:
+                self.profiler.end(self)
+                self.profile_report = self.profiler.report()
+        if self.verbose:
+            self.log("Simulation ending.")
+
+    def update_patients(self):
+        """Advance the blood values and status of every patient by one minute, and let discharged patients leave."""
+        # Update blood values and status of every patient in one vectorized pass
+        table = self.patient_table
+        (reduced_rows, blood_reduction), changed_rows = table.update(1, self.current_hour, self.mojo_table)
+        if self.verbose:
+            for row, reduction in zip(reduced_rows, blood_reduction):
+                patient = table.patients[row]
+                self.log(f"Patient {patient.num} disease blood reduced by {reduction} to {patient.disease_blood} by {patient.assigned_physician.name}.")
+        if self.trace is not None and len(reduced_rows):
+            patient_nums = [table.patients[row].num for row in reduced_rows]
+            self.trace.record_many(self.current_minute, TRACE_KIND_CODES['blood-reduced'], table.physician[reduced_rows], patient_nums, blood_reduction)
+        for row in changed_rows:
+            self.record_patient_process(table.patients[row])
+            self.patient_index.update(table.patients[row])
+        discharged_patients = [table.patients[row] for row in table.discharged_rows()]
+
+        # Remove discharged patients from the active patient list
+        for patient in discharged_patients:
+            if self.verbose:
+                self.log(f"Patient {patient.num} discharged at {self.current_time}.")
+            if self.trace is not None:
+                self.trace.record(self.current_minute, TRACE_KIND_CODES['discharge'], patient=patient.num)
+            self.patients.remove(patient)
+            table.release(patient)
+            self.patient_records.finish(patient.num)
+
+    def prepare_recorders(self):
+        """Preallocate the record arrays for the rest of the horizon (kept when start() continues a stopped run)."""
+        if self.total_er_records is not None:
+            return
+        n_minutes = self.roster.n_minutes - self.current_minute
+        shift_names = [shift.name for shift in self.shift_types]
+        self.total_er_records = CountRecorder(self.start_datetime, n_minutes)
+        self.shift_records = CountRecorder(self.start_datetime, n_minutes, series=shift_names)
+        self.physician_records = PhysicianRecorder(self.start_datetime, self.roster.on_duty_count(self.current_minute + 1, self.roster.n_minutes),
+                                                   [physician.name for physician in self.physicians], shift_names)
+        self.shift_summary = ShiftSummary(self.working_schedule, self.shift_types, self.start_datetime)
+
+    def compile_roster(self):
+        """Compile the working schedule against the simulation clock, see RosterTimeline."""
+        roster = RosterTimeline(self.shift_types, self.physicians, self.working_schedule, self.start_datetime, self.end_datetime)
+        for problem in roster.problems:
+            logging.warning(problem)
+        return roster
+
+    def current_minute_of_day(self):
+        return self.roster.minute_of_day(self.current_minute)
+
+    def current_physicians(self):
+        """Return the physicians on duty at the current time, in the order of self.physicians."""
+        return self.roster.on_duty(self.current_minute)
+
+    def get_shift_physician(self, shift):
+        """Return the Physician scheduled for `shift` at the current time, or None."""
+        # Shifts spanning midnight are looked up under the date they started on
+        return self.roster.shift_physician(self.current_minute, shift)
 
     def stop(self):
         self.running = False
-        print("Simulation ending.")
-        logging.info("Simulation ending.")
+        if self.verbose:
+            self.log("Simulation ending.")
 
     def create_working_schedule(self):
         if not self.shift_types:
@@ -508,92 +738,81 @@ class ERSimulation:
                     if row[i+1]:  # If there's a physician assigned
                         self.working_schedule[date][shift_name] = row[i+1]
 
+    def set_working_schedule(self, working_schedule):
+        """
+        Use an in-memory working schedule {date: {shift name: physician name}}, e.g. from
+        er_roster_gen.RosterGenerator, instead of reading one with load_working_schedule_from_csv.
+        """
+        self.working_schedule = {date: dict(daily_schedule) for date, daily_schedule in working_schedule.items()}
 
     def verify_schedule(self):
-        for date, daily_schedule in self.working_schedule.items():
-            for shift, physician in daily_schedule.items():
-                if not physician:
-                    raise ValueError(f"No physician assigned to {shift} on {date}.")
+        """
+        Check the working schedule over the simulated horizon and raise a ValueError listing every problem:
+        shifts without a physician, unknown shift or physician names, minutes in which a running shift has
+        nobody or no physician takes new patients of a type, and physicians booked on overlapping shifts.
+        """
+        problems = self.compile_roster().problems
+        if problems:
+            raise ValueError("\n".join(problems))
 
     def check_shift_change_and_handoff(self):
         """Check if the current time matches any ShiftType end time and handle patient handoff."""
-        handoff_shifts = [shift for shift in self.shift_types if self.current_time.time() == shift.end_time]
-        for shift in handoff_shifts:
-            print(f"Shift {shift.name} ending at {self.current_time}.")
-            logging.info(f"Shift {shift.name} ending at {self.current_time}.")
-            patient_in_shift = [patient for patient in self.patients if patient.assigned_physician and patient.assigned_physician.shift_type == shift.name]
-            late_change_shift = []
-            for patient in patient_in_shift:
-                off_physician = patient.assigned_physician
-                off_physician.energy = 180
-                off_physician.fatigue = 0
-                # Determine the next shift based on the handoff rule
-                new_shift = shift.get_handoff_shift(patient.arrival_time, self.current_time)
-                
-                # Find the physician for the new shift from the working schedule
-                if new_shift.end_day_offset == 0:
-                    new_physician_name = self.working_schedule.get(self.current_time.date(), {}).get(new_shift.name)
-                else:
-                    if self.current_time.time() >= new_shift.start_time:
-                        new_physician_name = self.working_schedule.get(self.current_time.date(), {}).get(new_shift.name)
-                    else:
-                        new_physician_name = self.working_schedule.get(self.current_time.date() - timedelta(days=1), {}).get(new_shift.name)
-                
-                # Assign the new physician to the patient
-                patient.assigned_physician = next((physician for physician in self.physicians if physician.name == new_physician_name), None)
-                print(f"Patient {patient.num} assigned to {patient.assigned_physician.name} for {new_shift.name}.")
-                logging.info(f"Patient {patient.num} assigned to {patient.assigned_physician.name} for {new_shift.name}.")
-                
-                if patient.assigned_physician !=off_physician:
-                    patient.assigned_physician.shift_type = new_shift.name
-                else:
-                    late_change_shift.append([patient.assigned_physician,new_shift])
-                logging.info(f"Patient {patient.num}: {patient.assigned_physician.name}, shift:{patient.assigned_physician.shift_type}")
-                patient.bedsideVisit = 0
-
-                logging.info(f"{off_physician.name} off, shift:{off_physician.shift_type}")
-                self.record_patient_process(patient)
-            if len(patient_in_shift)>0 and off_physician.shift_type == shift.name:
-                off_physician.shift_type = None
-            if len(late_change_shift)>0:
-                for late_change in late_change_shift:
-                    late_change[0].shift_type = late_change[1].name
+        for shift in self.roster.ending_shifts[self.current_minute_of_day()]:
+            if self.verbose:
+                self.log(f"Shift {shift.name} ending at {self.current_time}.")
+            if self.trace is not None:
+                self.trace.record(self.current_minute, TRACE_KIND_CODES['shift-end'], value=shift.index)
+            patient_in_shift = self.patient_index.shift_patients(shift.name)
+            self.handoff_patients(shift, patient_in_shift)
+
+    def handoff_patients(self, shift, patient_in_shift):
+        """Hand the patients of an ending shift over to the physicians of the shifts named by its rule."""
+        late_change_shift = []
+        for patient in patient_in_shift:
+            off_physician = patient.assigned_physician
+            off_physician.energy = 180
+            off_physician.fatigue = 0
+            # Determine the next shift based on the handoff rule
+            new_shift = shift.get_handoff_shift(patient.arrival_time, self.current_time, self.rng)
+            
+            # Assign the physician of the new shift from the working schedule
+            patient.assigned_physician = self.get_shift_physician(new_shift)
+            if self.verbose:
+                self.log(f"Patient {patient.num} assigned to {patient.assigned_physician.name} for {new_shift.name}.")
+            if self.trace is not None:
+                self.trace.record(self.current_minute, TRACE_KIND_CODES['handoff'], patient.assigned_physician.index, patient.num, new_shift.index)
+            
+            if patient.assigned_physician !=off_physician:
+                patient.assigned_physician.shift_type = new_shift.name
+            else:
+                late_change_shift.append([patient.assigned_physician,new_shift])
+            if self.verbose:
+                self.log(f"Patient {patient.num}: {patient.assigned_physician.name}, shift:{patient.assigned_physician.shift_type}", echo=False)
+            patient.bedsideVisit = 0
+
+            if self.verbose:
+                self.log(f"{off_physician.name} off, shift:{off_physician.shift_type}", echo=False)
+            self.record_patient_process(patient)
+            self.patient_index.update(patient)
+        if len(patient_in_shift)>0 and off_physician.shift_type == shift.name:
+            off_physician.shift_type = None
+        if len(late_change_shift)>0:
+            for late_change in late_change_shift:
+                late_change[0].shift_type = late_change[1].name
 
     def record_patient_process(self, patient):
         """
-        Record the process of a patient at the current time.
+        Record the process of a patient at the current time: its first record, then every change of
+        physician or status, as transitions of the PatientHistory patient_records.
         """
-        if patient.num not in self.patient_records:
-            # First-time recording for this patient
-            self.patient_records[patient.num] = [{
-                'Patient_num': patient.num,
-                'Arrival_time': patient.arrival_time,
-                'Patient_type': patient.patient_type,
-                'Initial_boarding_blood': patient.boarding_blood,
-                'Initial_disease_blood': patient.disease_blood,
-                'Initial_departure_blood': patient.departure_blood,
-                'Status': patient.status,
-                'Assigned_physician': patient.assigned_physician.name if patient.assigned_physician else None,
-                'Timestamp': self.current_time
-            }]
+        change = self.patient_records.record(patient, self.current_minute)
+        if change is None or self.shift_summary is None:
             return
-
-        # Check if there's a change in physician or status
-        last_record = self.patient_records[patient.num][-1]
-        if (last_record['Assigned_physician'] != (patient.assigned_physician.name if patient.assigned_physician else None)) or \
-           (last_record['Status'] != patient.status):
-            new_record = {
-                'Patient_num': patient.num,
-                'Arrival_time': patient.arrival_time,
-                'Patient_type': patient.patient_type,
-                'Current_boarding_blood': patient.boarding_blood,
-                'Current_disease_blood': patient.disease_blood,
-                'Current_departure_blood': patient.departure_blood,
-                'Status': patient.status,
-                'Assigned_physician': patient.assigned_physician.name if patient.assigned_physician else None,
-                'Timestamp': self.current_time
-            }
-            self.patient_records[patient.num].append(new_record)
+        first, previous = change
+        physician = patient.assigned_physician
+        self.shift_summary.add_record(self.current_minute, patient.patient_type, physician.name if physician else None, patient.status,
+                                      patient.arrival_time == self.current_time, first=first,
+                                      previous_name=None if first or previous < 0 else self.physicians[previous].name)
 
     def generate_patient_chart(self):
         # Flatten the patient records to generate a chart
@@ -603,130 +822,23 @@ class ERSimulation:
         return chart
 
     def generate_summary(self):
-        summary = []
-        
-        # We'll go through each day in the working_schedule
-        for date, daily_schedule in self.working_schedule.items():
-            for shift_name, physician_name in daily_schedule.items():
-                # Retrieve the shift object by name
-                shift = next((s for s in self.shift_types if s.name == shift_name), None)
-                
-                # Initialize counters
-                metrics = {
-                    'total': {
-                        'new_arrivals': 0,
-                        'handoffs_received': 0,
-                        'handoffs_given': 0,
-                        'discharges': 0,
-                        'admissions': 0
-                    }
-                }
-                # Initialize counters for each patient type
-                for patient_type in ['med', 'trauma', ]:  # You can adjust this list as needed
-                    metrics[patient_type] = {
-                        'new_arrivals': 0,
-                        'handoffs_received': 0,
-                        'handoffs_given': 0,
-                        'discharges': 0,
-                        'admissions': 0
-                    }
-
-                # Calculate shift start and end datetime
-                start_datetime = datetime.combine(date, shift.start_time)
-                end_datetime = datetime.combine(date + timedelta(days=shift.end_day_offset), shift.end_time) + timedelta(minutes=1)
-                
-                # Go through patient records to count metrics
-                for patient_num, records in self.patient_records.items():
-                    for i, record in enumerate(records):
-                        timestamp = record['Timestamp']
-                        current_type = record['Patient_type']  # Assuming there's a 'Patient_type' field
-                        
-                        # Check if the record is within the current shift
-                        if start_datetime <= timestamp <= end_datetime:
-                            # Update metrics for both total and the respective patient type
-                            for key in ['total', current_type]:
-                                # Check for new arrivals
-                                if record['Arrival_time'] == timestamp and record['Assigned_physician'] == physician_name and record['Status'] == 'triage':
-                                    metrics[key]['new_arrivals'] += 1
-                                # Check for handoffs received by this physician
-                                if i != 0 and records[i-1]['Assigned_physician'] != physician_name and record['Assigned_physician'] == physician_name:
-                                    metrics[key]['handoffs_received'] += 1
-                                # Check for handoffs given by this physician
-                                if i != 0 and records[i-1]['Assigned_physician'] == physician_name and record['Assigned_physician'] != physician_name:
-                                    metrics[key]['handoffs_given'] += 1
-                                # Check for discharges
-                                if record['Status'] == 'discharge' and record['Assigned_physician'] == physician_name:
-                                    metrics[key]['discharges'] += 1
-                                # Check for admissions
-                                if record['Status'] == 'admission' and record['Assigned_physician'] == physician_name:
-                                    metrics[key]['admissions'] += 1
-
-                # Append the summary for this shift and physician (for total and each patient type)
-                for key, metric in metrics.items():
-                    summary.append({
-                        'Type': key,  # 'total' or patient type
-                        'Shift Type': shift_name,
-                        'Physician Name': physician_name,
-                        'Shift Start Timing': start_datetime,
-                        'Shift End Timing': end_datetime,
-                        'New Arrival Patients': metric['new_arrivals'],
-                        'Handoff Patients Received': metric['handoffs_received'],
-                        'Handoff Patients Given': metric['handoffs_given'],
-                        'Discharged Patients': metric['discharges'],
-                        'Admitted Patients': metric['admissions']
-                    })  
-        return summary
+        """
+        Per shift instance of the working schedule, in total and per patient type: new arrivals,
+        handoffs received and given, discharges and admissions of its physician.
+        """
+        if self.shift_summary is None:
+            # Records not written by start(): count them in one pass
+            shift_summary = ShiftSummary(self.working_schedule, self.shift_types, self.start_datetime)
+            for records in self.patient_records.values():
+                shift_summary.add_patient_records(records)
+            return shift_summary.rows()
+        return self.shift_summary.rows()
 
     def record_patient_counts(self):
         """Record the patient counts (status and underTreat) for each shift and the total ER at the current frame."""
-
-        # Initial setup
-        shift_dicts = {shift.name: {
-            'triage': 0,
-            'on-board': 0,
-            'wait-depart': 0,
-            'underTreat': 0,
-            'wait-admission': 0,
-        } for shift in self.shift_types}
-
-        total_er_dict = {
-            'triage': 0,
-            'on-board': 0,
-            'wait-depart': 0,
-            'underTreat': 0,
-            'wait-admission': 0,
-        }
-
-        # Iterating through each patient once
-        for patient in self.patients:
-            assigned_shift = patient.assigned_physician.shift_type if patient.assigned_physician else None
-            if assigned_shift and patient.status in shift_dicts[assigned_shift]:
-                shift_dicts[assigned_shift][patient.status] += 1
-                if patient.underTreat > 0:
-                    shift_dicts[assigned_shift]['underTreat'] += 1
-                if patient.need_admission:
-                    shift_dicts[assigned_shift]['wait-admission'] += 1
-
-            if patient.status in total_er_dict:
-                total_er_dict[patient.status] += 1
-                if patient.underTreat > 0:
-                    total_er_dict['underTreat'] += 1
-                if patient.need_admission:
-                    total_er_dict['wait-admission'] += 1
-
-        # Appending the current frame's data to the respective record lists
-        for shift_name, counts in shift_dicts.items():
-            if shift_name not in self.shift_records:
-                self.shift_records[shift_name] = []
-            self.shift_records[shift_name].append({
-                'Timestamp': self.current_time,
-                **counts
-            })
-
-        self.total_er_records.append({
-            'Timestamp': self.current_time,
-            **total_er_dict
-        })
+        shift_counts, total_counts = self.patient_index.patient_counts(self.shift_records.series_rows)
+        self.shift_records.record(self.current_minute, shift_counts)
+        self.total_er_records.record(self.current_minute, total_counts)
 
     def load_admission_data_from_csv(self, csv_file_path):
         with open(csv_file_path, mode='r') as csv_file:
@@ -739,6 +851,18 @@ class ERSimulation:
                 admission_data[key] = (float(mean_patients), float(std_patients))
         self.admission_count = admission_data
 
+    def load_patient_defaults_from_csv(self, csv_file_path):
+        """
+        Load the patient defaults (initial blood values and disease increase rate by day, hour and
+        patient type) of this simulation from a CSV in the format of Patient.load_defaults_from_csv.
+        They are not shared with other simulations of the process; rows of a later file override
+        those of an earlier one.
+        """
+        table = Patient.defaults_table(*Patient.read_defaults_csv(csv_file_path))
+        if self.patient_defaults is not None:
+            table = np.where(np.isnan(table), self.patient_defaults, table)
+        self.patient_defaults = table
+
     def load_hourly_range_from_csv(self, csv_file_path):
         with open(csv_file_path, mode='r') as csv_file:
             csv_reader = csv.reader(csv_file)
@@ -769,8 +893,8 @@ class ERSimulation:
             self.admission_count[dayhour] = (mean_val * scaling_factor, std_val * scaling_factor)
 
     def create_physician(self, name, abilities=None):
-        physician = Physician(name, abilities)
-        self.physicians.append(physician)
+        physician = Physician(name, abilities, rng=self.rng)
+        self.add_physician(physician)
 
         # Save to CSV
         self.save_physician_to_csv(physician)
@@ -802,172 +926,226 @@ class ERSimulation:
         csv_file_paths = glob.glob(os.path.join(file_paths,'*.csv'))
         for csv_file_path in csv_file_paths:
             name = os.path.basename(csv_file_path).split('.')[0]  # Use the filename (without extension) as the physician's name
-            physician = Physician(name)
+            physician = Physician(name, rng=self.rng)
             physician.set_abilities_from_csv(csv_file_path)
-            self.physicians.append(physician)
+            self.add_physician(physician)
+
+    def add_physician(self, physician):
+        physician.index = self.physicians.add(physician)
+
+    def get_physician(self, name):
+        """The physician called `name`, or None."""
+        return self.physicians.get(name)
+
+    def build_mojo_table(self):
+        """Return the physicians' mojo as an array indexed by (physician index, hour, patient type code)."""
+        mojo_table = np.zeros((len(self.physicians), 24, len(PATIENT_TYPES)))
+        for physician in self.physicians:
+            for hour in range(24):
+                for type_code, patient_type in enumerate(PATIENT_TYPES):
+                    mojo_table[physician.index, hour, type_code] = physician.abilities.get(HOUR_LABELS[hour], {}).get(patient_type, 0)
+        return mojo_table
+
+    def compile_settings_tables(self):
+        """
+        Compile the settings used every minute into tables indexed by the clock indices:
+        mojo_table (physician, hour, patient type), arrival_rates (hour, mean/std) and
+        admission_rates (weekday, hour, mean/std). The scalar lookups of the minute loop go
+        through nested-list copies of the same tables.
+        """
+        self.mojo_table = self.build_mojo_table()
+        self.arrival_rates = np.array([self.hourly_range.get(label, (0, 0)) for label in HOUR_LABELS], dtype=float)
+        self.admission_rates = np.array([[self.admission_count.get(f"{day}, {label}", (0, 0)) for label in HOUR_LABELS] for day in DAY_NAMES],
+                                        dtype=float)
+        self._mojo = self.mojo_table.tolist()
+        self._arrival_rates = self.arrival_rates.tolist()
+        self._admission_rates = self.admission_rates.tolist()
+
+    def next_patient_num(self):
+        self.patient_counter += 1
+        return self.patient_counter
 
     def create_shift_type(self, name, start_time, end_time, recieve_patient_type=['med',], new_patient=True):
-        shift_type = ShiftType(name, start_time, end_time, recieve_patient_type, new_patient)
-        self.shift_types.append(shift_type)
+        # The shift registers itself in self.shift_types, so handoff rules only see this simulation's shifts
+        ShiftType(name, start_time, end_time, recieve_patient_type, new_patient, registry=self.shift_types)
 
     def patient_arrival(self):
-        nowall_shifts = [shift for shift in self.shift_types 
-                        if shift.new_patient 
-                        and shift.is_time_within_shift(self.current_time.time())]
+        self.rebalance_new_patient_counts()
 
-        new_shift_in = [shift for shift in nowall_shifts if self.current_time.time() == shift.start_time]
+        # Number of arrivals for the current minute, taken a day ahead from the arrival source
+        num_arrivals = self.drawn_count('arrivals')
+
+        for patient_type in self.arrival_source.patient_types(self, num_arrivals):
+            patient = Patient(self.current_time, patient_type, table=self.patient_table, num=self.next_patient_num(),
+                              weekday=self.current_weekday, hour=self.current_hour, rng=self.rng, defaults=self.patient_defaults)
+            self.patients.append(patient)
+            self.assign_new_patient(patient)
+            if self.trace is not None:
+                self.trace_arrival(patient)
+            self.record_patient_process(patient)  # patients no shift could take are recorded here
+            self.patient_index.update(patient)
+
+    def trace_arrival(self, patient):
+        physician = patient.assigned_physician
+        self.trace.record(self.current_minute, TRACE_KIND_CODES['arrival'], physician.index if physician else -1,
+                          patient.num, PATIENT_TYPE_CODES[patient.patient_type])
+
+    def rebalance_new_patient_counts(self):
+        """When a new-patient shift starts, rebase the received-patient counters of the shifts already running."""
+        minute_of_day = self.current_minute_of_day()
+        nowall_shifts = self.roster.new_patient_shifts[minute_of_day]
+        new_shift_in = self.roster.starting_new_shifts[minute_of_day]
         if new_shift_in:
             temp_shift_counts = {shift: shift.recieve_patient_num for shift in nowall_shifts if shift not in new_shift_in}
             adjust_shift_count = min(temp_shift_counts.values())
             for shift in nowall_shifts:
                 if shift in new_shift_in:
-                    logging.info(f"Shift {shift.name} starting at {self.current_time}.")
+                    if self.verbose:
+                        self.log(f"Shift {shift.name} starting at {self.current_time}.", echo=False)
                     continue
-                logging.info(f'Patient number in {shift.name} from {shift.recieve_patient_num} - {adjust_shift_count}')
+                if self.verbose:
+                    self.log(f'Patient number in {shift.name} from {shift.recieve_patient_num} - {adjust_shift_count}', echo=False)
                 shift.recieve_patient_num -= adjust_shift_count
-                logging.info(f'Patient number in {shift.name} to {shift.recieve_patient_num}')
+                if self.verbose:
+                    self.log(f'Patient number in {shift.name} to {shift.recieve_patient_num}', echo=False)
+
+    def assign_new_patient(self, patient):
+        """Assign a newly arrived patient to the physician of the least loaded open shift for its type."""
+        # Determine the current shifts based on the current_time and patient type
+        current_shifts = self.roster.arrival_shifts[self.current_minute_of_day()][patient.patient_type]
+
+        # If there are no shifts available for new patients, we can't assign a physician
+        if not current_shifts:
+            if self.verbose:
+                self.log(f"Patient {patient.num} arrived at {patient.arrival_time} with type {patient.patient_type}, but no available shifts for new patients.")
+            return
 
-        current_hour_str = f"{self.current_time.hour:02d}:00-{(self.current_time.hour) % 24:02d}:59"
-        mean_patients, std_patients = self.hourly_range.get(current_hour_str, (0, 0))
+        # Count how many new patients each shift has received
+        shift_counts = {shift: shift.recieve_patient_num for shift in current_shifts}
+        shiftN_counts = {shift.name: shift.recieve_patient_num for shift in current_shifts}
+        if self.verbose:
+            self.log(f"Shift counts: {shiftN_counts}", echo=False)
 
-        # Calculate the average expected number of arrivals for the current minute
-        hour_patient_amount = max(0,mean_patients + random.gauss()*std_patients)
-        average_arrivals_this_minute = hour_patient_amount / 60.0
+        # Find the shift with the least number of new patients
+        min_count = min(shift_counts.values())
+        shifts_with_min_count = [shift for shift, count in shift_counts.items() if count == min_count]
 
-        # Use the Poisson distribution to get a random number of arrivals for this minute
-        num_arrivals = np.random.poisson(average_arrivals_this_minute)
+        # Randomly select one of the current shifts
+        selected_shift = self.rng.assignment.choice(shifts_with_min_count)
 
-        for _ in range(num_arrivals):
-            patient_type = 'med' if random.random() < self.med_to_trauma_ratio else 'trauma'
-            arrival_time = self.current_time
-            patient = Patient(arrival_time, patient_type)
-            self.patients.append(patient)
+        # Get the physician assigned to that shift from the working schedule
+        assigned_physician = self.get_shift_physician(selected_shift)
+        assigned_physician.shift_type = selected_shift.name
 
-            # Determine the current shifts based on the current_time and patient type
-            current_shifts = [shift for shift in self.shift_types 
-                            if shift.new_patient 
-                            and shift.is_time_within_shift(self.current_time.time())
-                            and patient_type in shift.recieve_patient_type]
-
-            # If there are no shifts available for new patients, we can't assign a physician
-            if not current_shifts:
-                print(f"Patient {patient.num} arrived at {patient.arrival_time} with type {patient.patient_type}, but no available shifts for new patients.")
-                logging.info(f"Patient {patient.num} arrived at {patient.arrival_time} with type {patient.patient_type}, but no available shifts for new patients.")
-                continue
-
-            # Count how many new patients each shift has received
-            shift_counts = {shift: shift.recieve_patient_num for shift in current_shifts}
-            shiftN_counts = {shift.name: shift.recieve_patient_num for shift in current_shifts}
-            logging.info(f"Shift counts: {shiftN_counts}")
-
-            # Find the shift with the least number of new patients
-            min_count = min(shift_counts.values())
-            shifts_with_min_count = [shift for shift, count in shift_counts.items() if count == min_count]
-
-            # Randomly select one of the current shifts
-            selected_shift = random.choice(shifts_with_min_count)
-
-            # Get the physician assigned to that shift from the working schedule
-            if selected_shift.end_day_offset ==0:
-                assigned_physician_name = self.working_schedule.get(self.current_time.date(), {}).get(selected_shift.name)
-            else:
-                if self.current_time.time() >= selected_shift.start_time:
-                    assigned_physician_name = self.working_schedule.get(self.current_time.date(), {}).get(selected_shift.name)
-                else:
-                    assigned_physician_name = self.working_schedule.get(self.current_time.date() - timedelta(days=1), {}).get(selected_shift.name)
-
-            # Find the physician object based on the name
-            assigned_physician = next((physician for physician in self.physicians if physician.name == assigned_physician_name), None)
-            assigned_physician.shift_type = selected_shift.name
-
-            # Assign the patient to the physician
-            patient.assigned_physician = assigned_physician
-            selected_shift.recieve_patient_num += 1
-            print(f"Patient {patient.num} arrived at {patient.arrival_time} with type {patient.patient_type} and was assigned to {assigned_physician.name}.")
-            logging.info(f"Patient {patient.num} arrived at {patient.arrival_time} with type {patient.patient_type} and was assigned to {assigned_physician.name}.")
-            self.record_patient_process(patient)
+        # Assign the patient to the physician
+        patient.assigned_physician = assigned_physician
+        selected_shift.recieve_patient_num += 1
+        if self.verbose:
+            self.log(f"Patient {patient.num} arrived at {patient.arrival_time} with type {patient.patient_type} and was assigned to {assigned_physician.name}.")
+        self.record_patient_process(patient)
 
     def physician_treat_patient(self, physician):
         all_status = ['triage', 'on-board', 'wait-depart']
-        # Filter out the patients assigned to the current physician
-        physician_patients = [p for p in self.patients if p.assigned_physician == physician]
-        # Count the number of patients in each status
-        status_counts = {status: sum(1 for p in physician_patients if p.status == status) for status in all_status}
-        underTreat_count = sum(1 for p in physician_patients if p.underTreat > 0)
-        needAdm_count = sum(1 for p in physician_patients if p.need_admission)
+        # The patients assigned to the current physician and their counts come from the patient index
+        physician_patients = self.patient_index.patients_of(physician)
+        counts = self.patient_index.counts.get(physician)
+        status_counts = {status: counts[status] if counts else 0 for status in all_status}
+        underTreat_count = counts['underTreat'] if counts else 0
+        needAdm_count = counts['wait-admission'] if counts else 0
         
-        print(f"Physician {physician.name} has {len(physician_patients)} patients. Status counts: {status_counts}. underTreat: {underTreat_count}. needAdm: {needAdm_count}")
-        logging.info(f'physician {physician.name} has {len(physician_patients)} patients. Status counts: {status_counts}. underTreat: {underTreat_count}. needAdm: {needAdm_count}')
+        if self.verbose:
+            self.log(f"Physician {physician.name} has {len(physician_patients)} patients. Status counts: {status_counts}. underTreat: {underTreat_count}. needAdm: {needAdm_count}")
 
         # Check if any patient is currently being visited by the physician
-        visited_patient = next((p for p in physician_patients if p.bedsideVisit == 1), None)
+        visited_patient = self.bedside_patient(physician)
         if visited_patient:
-            print(f"Physician {physician.name} keep visiting patient {visited_patient.num}.")
-            logging.info(f"Physician {physician.name} keep visiting patient {visited_patient.num}.")               
+            if self.verbose:
+                self.log(f"Physician {physician.name} keep visiting patient {visited_patient.num}.")
         # If no patient is being visited, select a patient to visit based on some criteria (e.g., arrival time)
         else:
-            status_weight = [1 if status_counts[status] > 0 else 0 for status in all_status]
-            # Adjust the selection probability based on the physician's energy
-            weights = [*status_weight, physician.rest_tendency/(1+physician.energy)]  # Increasing the weight for 'rest' as energy decreases
-            select_status = random.choices([*all_status, 'rest'], weights=weights, k=1)[0]
-
-            potential_patients = [p for p in physician_patients if p.status == select_status]
+            select_status = self.select_status(physician, status_counts)
+            potential_patients = list(self.patient_index.by_status[physician].get(select_status, ())) if status_counts.get(select_status) else []
 
             if potential_patients:
                 if select_status != 'on-board':
-                    visited_patient = random.choice(potential_patients)
+                    visited_patient = self.rng.physicians.choice(potential_patients)
                 else:
                     # Filter potential patients with underTreat = 0
                     potential_underTreat_zero = [p for p in potential_patients if p.underTreat == 0]
                     if potential_underTreat_zero:
-                        visited_patient = random.choice(potential_underTreat_zero)
+                        visited_patient = self.rng.physicians.choice(potential_underTreat_zero)
                     else:
-                        visited_patient = random.choice(potential_patients)
+                        visited_patient = self.rng.physicians.choice(potential_patients)
             if visited_patient:
-                print(f"Physician {physician.name} is visiting patient {visited_patient.num}." )
-                logging.info(f"Physician {physician.name} is visiting patient {visited_patient.num}." )
+                if self.verbose:
+                    self.log(f"Physician {physician.name} is visiting patient {visited_patient.num}.")
 
-        """Record the physician's action for the current frame."""
-        action = 1 if visited_patient else 0
-        physician.energy = min(physician.energy + 1, 200) if action == 0 else max(physician.energy - 1, 0)
-        physician.fatigue = physician.fatigue + 1 if action == 1 and physician.energy==0 else physician.fatigue
-        physician.fatigue = max(physician.fatigue - 1, 0) if action == 0 else physician.fatigue
-
-        if physician.name not in self.physician_records:
-            self.physician_records[physician.name] = []
-        self.physician_records[physician.name].append({
-            'ShiftType': physician.shift_type,
-            'Timestamp': self.current_time,
-            'energy':physician.energy,
-            'fatigue':physician.fatigue,
-            'Action': action,
-            'patient': visited_patient.num if visited_patient else None,
-            'underTreat': underTreat_count,
-            **status_counts,
-        })
+        self.record_physician_action(physician, visited_patient, underTreat_count, status_counts)
+
+        if self.trace is not None:
+            self.trace.record(self.current_minute, TRACE_KIND_CODES['visit' if visited_patient else 'rest'],
+                              physician.index, visited_patient.num if visited_patient else -1)
 
         # If we still don't have a patient to visit (e.g., all are discharged), exit the function
         if not visited_patient:
-            print(f"Physician {physician.name} rest in this minute.")
-            logging.info(f"Physician {physician.name} rest in this minute, no visit any patient.")
+            if self.verbose:
+                self.log(f"Physician {physician.name} rest in this minute.")
             return
-        
+
+        self.treat_visited_patient(physician, visited_patient)
+        self.patient_index.update(visited_patient)
+
+    def bedside_patient(self, physician):
+        """The patient the physician is still at the bedside of, if any."""
+        patient = self.bedside_patients.get(physician)
+        if patient is not None and patient.bedsideVisit == 1 and patient.assigned_physician is physician and not patient.discharge_status:
+            return patient
+        return None
+
+    def select_status(self, physician, status_counts):
+        """Draw which patient status the physician attends to next, or 'rest'."""
+        all_status = ['triage', 'on-board', 'wait-depart']
+        status_weight = [1 if status_counts[status] > 0 else 0 for status in all_status]
+        # Adjust the selection probability based on the physician's energy
+        weights = [*status_weight, physician.rest_tendency/(1+physician.energy)]  # Increasing the weight for 'rest' as energy decreases
+        return self.rng.physicians.choices([*all_status, 'rest'], weights)
+
+    def record_physician_action(self, physician, visited_patient, underTreat_count, status_counts):
+        """Record the physician's action for the current frame."""
+        action = 1 if visited_patient else 0
+        registry, row = physician._registry, physician._row
+        energy, fatigue = registry.energy.item(row), registry.fatigue.item(row)
+        if action == 0:
+            energy, fatigue = min(energy + 1, 200), max(fatigue - 1, 0)
+        else:
+            energy = max(energy - 1, 0)
+            fatigue = fatigue + 1 if energy == 0 else fatigue
+        registry.energy[row], registry.fatigue[row] = energy, fatigue
+
+        self.physician_records.record(physician.index, self.current_minute, physician.shift_type, energy, fatigue, action,
+                                      visited_patient.num if visited_patient else None, underTreat_count,
+                                      status_counts['triage'], status_counts['on-board'], status_counts['wait-depart'])
+
+    def treat_visited_patient(self, physician, visited_patient):
+        """Apply one minute of bedside treatment by `physician` to `visited_patient`."""
         # Set bedsideVisit to 1 for the visited patient
         visited_patient.bedsideVisit = 1
         
         # Calculate the physician's mojo for the patient type
-        mojo = physician.get_mojo(visited_patient.patient_type, self.current_time)
+        mojo = self._mojo[physician.index][self.current_hour][visited_patient.type_code]
         blood_reduction = mojo  # Blood reduction rate when bedsideVisit = 1
         
         # If boarding blood is still positive, reduce it
         if visited_patient.boarding_blood > 0:
             visited_patient.boarding_blood = max(0, visited_patient.boarding_blood - 2*blood_reduction)
-            print(f'physician {physician.name} is treating patient {visited_patient.num}, decrease boarding blood by {2*blood_reduction}')
-            logging.info(f'physician {physician.name} is treating patient {visited_patient.num}, decrease boarding blood by {2*blood_reduction}')
+            if self.verbose:
+                self.log(f'physician {physician.name} is treating patient {visited_patient.num}, decrease boarding blood by {2*blood_reduction}')
+            if self.trace is not None:
+                self.trace.record(self.current_minute, TRACE_KIND_CODES['treat-boarding'], physician.index, visited_patient.num, 2*blood_reduction)
             if visited_patient.boarding_blood <= 0:
                 visited_patient.underTreat += 60  # Increase underTreat by 60 minutes when status becomes on-board
-                print(f'patient {visited_patient.num} status becomes on-board')
-                logging.info(f'patient {visited_patient.num} status becomes on-board')
+                if self.verbose:
+                    self.log(f'patient {visited_patient.num} status becomes on-board')
                 if visited_patient.need_admission == False and visited_patient.disease_blood/(1+blood_reduction) > 30:
                     visited_patient.need_admission = True
 
@@ -976,8 +1154,10 @@ class ERSimulation:
             visited_patient.disease_blood = max(0, visited_patient.disease_blood - blood_reduction)
             visited_patient.underTreat = visited_patient.underTreat + 720 if visited_patient.need_admission else visited_patient.underTreat + 10
             # Increase by 10 for each minute the physician visits the patient
-            print(f'physician {physician.name} is treating patient {visited_patient.num}, decrease disease blood by {blood_reduction} and increase underTreat by 10')
-            logging.info(f'physician {physician.name} is treating patient {visited_patient.num}, decrease disease blood by {blood_reduction} and increase underTreat by 10')
+            if self.verbose:
+                self.log(f'physician {physician.name} is treating patient {visited_patient.num}, decrease disease blood by {blood_reduction} and increase underTreat by 10')
+            if self.trace is not None:
+                self.trace.record(self.current_minute, TRACE_KIND_CODES['treat-disease'], physician.index, visited_patient.num, blood_reduction)
             if visited_patient.need_admission == False and visited_patient.disease_blood/(1e-6+blood_reduction) > 30:
                 visited_patient.need_admission = True
 
@@ -985,8 +1165,10 @@ class ERSimulation:
         elif visited_patient.disease_blood <= 0 and visited_patient.departure_blood > 0:
             visited_patient.need_admission = False
             visited_patient.departure_blood = max(0, visited_patient.departure_blood - 2*blood_reduction)
-            print(f'physician {physician.name} is treating patient {visited_patient.num}, decrease departure blood by {2*blood_reduction}')
-            logging.info(f'physician {physician.name} is treating patient {visited_patient.num}, decrease departure blood by {2*blood_reduction}')
+            if self.verbose:
+                self.log(f'physician {physician.name} is treating patient {visited_patient.num}, decrease departure blood by {2*blood_reduction}')
+            if self.trace is not None:
+                self.trace.record(self.current_minute, TRACE_KIND_CODES['treat-departure'], physician.index, visited_patient.num, 2*blood_reduction)
             
         # Update the patient's status based on blood values
         if visited_patient.boarding_blood <= 0:
@@ -1002,56 +1184,88 @@ class ERSimulation:
         # If the patient's boarding blood has reduced to 0, set bedsideVisit back to 0
         if visited_patient.boarding_blood <= 0:
             visited_patient.bedsideVisit = 0
+            self.bedside_patients.pop(physician, None)
+        else:
+            self.bedside_patients[physician] = visited_patient
         self.record_patient_process(visited_patient)
 
+    def draw_arrival_counts(self, minutes):
+        """
+        Draw the number of arrivals of every minute in `minutes` at once: the hour's mean plus normal
+        noise times its std (at least 0), spread over 60 minutes, as the mean of a Poisson count.
+        """
+        generator = self.rng.arrivals.generator
+        hours = ((self._start_mod + minutes) // 60) % 24
+        amount = np.maximum(0, self.arrival_rates[hours, 0] + generator.standard_normal(len(minutes)) * self.arrival_rates[hours, 1])
+        return generator.poisson(amount / 60.0)
+
+    def draw_admission_counts(self, minutes):
+        """Draw the number of ward beds released in every minute in `minutes` at once (same model per weekday and hour)."""
+        generator = self.rng.admissions.generator
+        hours = ((self._start_mod + minutes) // 60) % 24
+        days = (self._start_weekday + (self._start_mod + minutes) // 1440) % 7
+        amount = np.maximum(0, self.admission_rates[days, hours, 0] + generator.standard_normal(len(minutes)) * self.admission_rates[days, hours, 1])
+        return generator.poisson(amount / 60.0)
+
+    def count_block(self, kind, first):
+        """Counts of 'arrivals' (from the arrival source) or 'admissions' for the COUNT_BLOCK minutes from `first` on, drawn at once."""
+        if kind == 'arrivals':
+            return self.arrival_source.count_block(self, first, ERSimulation.COUNT_BLOCK)
+        return self.draw_admission_counts(np.arange(first, first + ERSimulation.COUNT_BLOCK)).tolist()
+
+    def drawn_count(self, kind):
+        """The 'arrivals' or 'admissions' count of the current minute, from the block drawn ahead."""
+        first, counts = self._count_blocks.get(kind, (0, []))
+        offset = self.current_minute - first
+        if not 0 <= offset < len(counts):
+            first, offset = self.current_minute, 0
+            counts = self.count_block(kind, first)
+            self._count_blocks[kind] = (first, counts)
+        return counts[offset]
+
     def ward_admission(self):
         # Calculate possible admission patient number for the current time
-        current_day_str = self.current_time.strftime('%A')  # e.g., "Monday"
-        current_hour_str = f"{self.current_time.hour:02d}:00-{(self.current_time.hour) % 24:02d}:59"
-        key = f"{current_day_str}, {current_hour_str}"
-        mean_adm, std_adm = self.admission_count.get(key, (0, 0))
-        
-        # Calculate the average expected number of admissions for the current minute
-        hour_adm_amount = max(0, mean_adm + random.gauss(0, 1) * std_adm)
-        average_admissions_this_minute = hour_adm_amount / 60.0
-        # Use the Poisson distribution to get a random number of admissions for this minute
-        num_admissions = np.random.poisson(average_admissions_this_minute)  
+        # Number of ward beds released in the current minute, drawn a day ahead (see draw_admission_counts)
+        num_admissions = self.drawn_count('admissions')
 
-        needAdmission_patients = [p for p in self.patients if p.need_admission and p.discharge_status == False]
+        self.admit_patients(self.patient_index.admission_pool, num_admissions)
+
+    def admit_patients(self, admission_pool, num_admissions):
+        """Admit up to `num_admissions` of the patients waiting in the AdmissionPool to the ward."""
         # If there are more patients needing admission than the number of admissions, randomly select patients to be admitted
-        print(f"Number of patients needing admission: {len(needAdmission_patients)}. Number of admissions: {num_admissions}")
-        logging.info(f"Number of patients needing admission: {len(needAdmission_patients)}. Number of admissions: {num_admissions}")
-        if len(needAdmission_patients) > num_admissions:
-            patients_to_admit = random.sample(needAdmission_patients, num_admissions)
+        if self.verbose:
+            self.log(f"Number of patients needing admission: {len(admission_pool)}. Number of admissions: {num_admissions}")
+        if len(admission_pool) > num_admissions:
+            patients_to_admit = admission_pool.sample(num_admissions, self.rng.ward)
         else:
-            patients_to_admit = needAdmission_patients
+            patients_to_admit = list(admission_pool)
         
-        if len(patients_to_admit) > 0:
-            for patient in patients_to_admit:
-                patient.status = 'admission'
-                self.record_patient_process(patient)
-                patient.discharge_status = True
-                print(f"Patient {patient.num} admitted at {self.current_time}.")
-                logging.info(f"Patient {patient.num} admitted at {self.current_time}.")
-
+        for patient in patients_to_admit:
+            self.admit_patient(admission_pool, patient)
+        return patients_to_admit
+
+    def admit_patient(self, admission_pool, patient):
+        """Move one patient waiting in the AdmissionPool to the ward."""
+        self.admission_records.record(patient.num, self.current_minute, self.current_minute - admission_pool.since[patient])
+        patient.status = 'admission'
+        self.record_patient_process(patient)
+        patient.discharge_status = True
+        self.patient_index.update(patient)
+        if self.verbose:
+            self.log(f"Patient {patient.num} admitted at {self.current_time}.")
+        if self.trace is not None:
+            self.trace.record(self.current_minute, TRACE_KIND_CODES['admission'], patient=patient.num)
 
     # ... other methods to handle game mechanics
 
 def save_to_excel(data, filename):
-    """
-    Save a dictionary of dictionaries to an Excel file with separate sheets.
-    
-    Parameters:
-    - data: The dictionary of dictionaries.
-    - filename: The filename for the Excel file.
-    """
-    with pd.ExcelWriter(filename) as writer:
-        for key, records in data.items():
-            df = pd.DataFrame(records)
-            df.to_excel(writer, sheet_name=str(key), index=False)
+    """Save a dictionary of dictionaries (or a recorder) to an Excel file, see er_export.save_to_excel."""
+    from er_export import save_to_excel as export_to_excel
+    export_to_excel(data, filename)
 
 
 if __name__ == '__main__':
+    ensure_default_settings()
     er=ERSimulation("2023-03-01 08:00:00", 
                     "2023-06-01 07:59:00",
                     250, 0.852, 
@@ -1115,17 +1329,21 @@ if __name__ == '__main__':
 
     # input("Please complete the schedule CSV and press Enter to continue...")
     er.load_working_schedule_from_csv(csv_file_path='./playGround/working_schedule_filled.csv')
-    Patient.load_defaults_from_csv('./settings/patient_default.csv')
+    er.load_patient_defaults_from_csv('./settings/patient_default.csv')
     
     er.start()
 
-    result = pd.DataFrame(er.generate_patient_chart())
-    summary_physician = pd.DataFrame(er.generate_summary())
-    summary_er = pd.DataFrame(er.total_er_records)
-
-    result.to_excel('./results/result.xlsx', index=False)
-    summary_physician.to_excel('./results/summary_physician.xlsx', index=False)
-    summary_er.to_excel('./results/summary_er.xlsx', index=False)
-    save_to_excel(er.shift_records,'./results/summary_shift.xlsx')
-    save_to_excel(er.physician_records,'./results/physician_records.xlsx')
+    from er_export import export_results, pa
+    if pa is not None:
+        # Parquet tables under ./results/<table>/, and the shift summary also as Excel (needs openpyxl)
+        export_results(er, './results', fmt='parquet', excel_summary=True)
+    else:
+        # Without pyarrow, the results are written as Excel workbooks only
+        import pandas as pd
+        os.makedirs('./results', exist_ok=True)
+        pd.DataFrame(er.generate_patient_chart()).to_excel('./results/result.xlsx', index=False)
+        pd.DataFrame(er.generate_summary()).to_excel('./results/summary_physician.xlsx', index=False)
+        er.total_er_records.to_dataframe().to_excel('./results/summary_er.xlsx', index=False)
+        save_to_excel(er.shift_records, './results/summary_shift.xlsx')
+        save_to_excel(er.physician_records, './results/physician_records.xlsx')
 
@@ -0,0 +1,543 @@
+import heapq, math
+import numpy as np
+
+from er_class import ERSimulation, Patient
+from er_trace import TRACE_KIND_CODES
+
+# Event phases, handled in this order inside one simulated minute (same order as ERSimulation.start)
+ROSTER = 0       # the set of on-duty physicians may change
+SHIFT_START = 1  # a new-patient shift starts, rebase the received-patient counters
+ARRIVAL = 2      # pre-drawn number of arrivals for this minute
+TREAT = 3        # an on-duty physician acts: every minute while choosing among its patients, at the end of a bedside visit
+ADMISSION = 4    # pre-drawn number of ward beds released this minute
+UPDATE = 5       # passive patient changes: disease blood exhausted, underTreat expired
+RECORD = 6       # per-minute patient counts (not queued, run every processed minute)
+HANDOFF = 7      # a shift ends, patients are handed to the next shift
+
+
+
+class EventDrivenERSimulation(ERSimulation):
+    """
+    Next-event version of ERSimulation.
+
+    Instead of rescanning every shift, physician and patient each minute, arrivals, shift
+    start/end, handoffs, ward admissions, underTreat expiry, disease blood running out and
+    physician actions are scheduled events in a priority queue, and the clock jumps over the
+    minutes in which no event is due. A patient's blood values are only brought up to date (in
+    closed form, one hour at a time) when the patient is touched.
+
+    A physician choosing which patient to see next acts every minute. A physician without
+    patients rests and one at a bedside keeps visiting the same patient until its boarding blood
+    runs out, without any decision; one whose only choices are resting and visiting an on-board
+    patient that needs nothing (see is_idle) changes no patient. These minutes are recorded (and
+    the boarding blood reduced, the idle choices drawn) in one block when the physician's
+    patients, shift or energy change, or when the bedside visit ends (a scheduled action), see
+    settle_physician.
+
+    The per-physician patient sets and counters are the simulation's PatientIndex, with patients
+    counted as under treatment from their lazily evaluated underTreat.
+
+    The model is the same as ERSimulation.start, up to floating point rounding, the order in
+    which random numbers are drawn and the order of the patients a physician picks from. With the same seed, both engines draw the same arrivals
+    (counts, types and initial blood values) and ward-bed counts. patient_records, total_er_records, shift_records and
+    physician_records have the same shape, so the Excel export works unchanged.
+    Simulate (real-time playback) is ignored by this engine, and a trace has no 'blood-reduced'
+    events, since passive blood changes are not evaluated minute by minute.
+    """
+
+    def start(self):
+        self.check_ready()
+        self.roster = self.compile_roster()
+        self.compile_settings_tables()
+        self.prepare_events()
+        self.prepare_recorders()
+        if self.profiler is not None:
+            self.profiler.begin(self)
+
+        self.running = True
+        try:
+            minute = self.current_minute
+            while self.running and minute < self._last_minute:
+                next_minute = max(minute + 1, min(self._events[0][0], self._last_minute) if self._events else self._last_minute)
+                self.fill_quiet_minutes(minute + 1, next_minute)
+                minute = next_minute
+                self.run_minute(minute)
+                if self.checkpoint_every:
+                    self.checkpoint_if_due()
+
+            self.settle_physicians(self.current_minute)
+            self.patients = list(self._active.values())
+            for patient in self.patients:
+                self.advance_patient(patient, self.current_minute)
+        finally:
+            self.running = False
+            if self.trace is not None:
+                self.trace.flush()
+            if self.profiler is not None:
+                self.profiler.end(self)
+                self.profile_report = self.profiler.report()
+        if self.verbose:
+            self.log("Simulation ending.")
+
+    def prepare_events(self):
+        """Set up the event queue, the patient index and the pre-drawn arrival/admission streams."""
+        if getattr(self, '_events', None) is not None:
+            return  # already prepared, continue where the last start() stopped
+        self.set_clock(int((self.current_time - self.start_datetime).total_seconds() // 60))
+        self._last_minute = int((self.end_datetime - self.start_datetime).total_seconds() // 60)
+        self._events = []
+        self._seq = 0  # tie-breaker of events of the same minute and phase, in push order
+        self._on_duty = []
+        self._active = {}
+        self._leaving = []
+        self.prepare_actions()
+
+        self.push_count_events()
+
+        # Boundary minutes from the compiled roster
+        first, last = self.current_minute + 1, self._last_minute
+        roster_minutes = [first] + [minute for minute in self.roster.roster_change_minutes() if minute > first]
+        for phase, phase_minutes in [(ROSTER, roster_minutes),
+                                     (SHIFT_START, self.roster.minutes_where(self.roster.shift_start_mask, first, last)),
+                                     (HANDOFF, self.roster.minutes_where(self.roster.shift_end_mask, first, last))]:
+            for minute in phase_minutes:
+                if first <= minute <= last:
+                    self.push(minute, phase, None)
+
+        # Patients already in the ER (e.g. after stop()) join the index as they are
+        for patient in self.patients:
+            patient._synced = self.current_minute
+            patient._version = 0
+            self._active[patient.num] = patient
+            self.refresh_patient(patient)
+
+    def prepare_actions(self):
+        """Schedule the on-duty physicians, whose minutes are recorded up to the current one."""
+        self._actions = {}        # physician -> seq of its queued TREAT event, while on duty with patients
+        self._resting = {}        # physician -> first minute of its rest not recorded yet, while on duty without patients
+        self._bedside_runs = {}   # physician -> [patient, first minute not applied yet, minute the visit ends]
+        self._idle_runs = {}      # physician -> first minute not applied yet of its idle choices, see handle_actions
+        self._phase = HANDOFF     # phase of the event being handled, see action_minute
+        self._duty_order = {physician: i for i, physician in enumerate(self._on_duty)}
+        for physician in self._on_duty:
+            self.schedule_action(physician)
+
+    def push_count_events(self):
+        """Queue the arrivals and ward-bed releases of the rest of the horizon, drawn in the same blocks as the stepped engine draws them."""
+        for block_first in range(self.current_minute + 1, self._last_minute + 1, ERSimulation.COUNT_BLOCK):
+            for kind, phase in [('arrivals', ARRIVAL), ('admissions', ADMISSION)]:
+                for offset, count in enumerate(self.count_block(kind, block_first)):
+                    if count and block_first + offset <= self._last_minute:
+                        self.push(block_first + offset, phase, count)
+
+    def reseed(self, seed):
+        super().reseed(seed)
+        if getattr(self, '_events', None) is not None:
+            # The queued arrivals and ward-bed releases came from the old streams
+            self._events = [event for event in self._events if event[1] not in (ARRIVAL, ADMISSION)]
+            heapq.heapify(self._events)
+            self.push_count_events()
+
+    def push(self, minute, phase, arg):
+        self._seq += 1
+        heapq.heappush(self._events, (minute, phase, self._seq, arg))
+        return self._seq
+
+    def handle_events(self, minute, before_phase):
+        """Handle the queued events of `minute` whose phase comes before `before_phase`."""
+        events = self._events
+        while events and (events[0][0] < minute or (events[0][0] == minute and events[0][1] < before_phase)):
+            _, phase, _, arg = heapq.heappop(events)
+            self._phase = phase
+            if phase == ROSTER:
+                self.handle_roster()
+            elif phase == SHIFT_START:
+                self.rebalance_new_patient_counts()
+            elif phase == ARRIVAL:
+                self.handle_arrivals(arg)
+            elif phase == ADMISSION:
+                self.handle_admissions(arg)
+            elif phase == UPDATE:
+                self.handle_patient_update(*arg)
+            elif phase == HANDOFF:
+                self.handle_handoffs()
+
+    def run_minute(self, minute):
+        self.set_clock(minute)
+        self.handle_events(minute, TREAT)
+        self.handle_actions(minute)
+        self.handle_events(minute, RECORD)
+        for patient in self._leaving:
+            if self.verbose:
+                self.log(f"Patient {patient.num} discharged at {self.current_time}.")
+            if self.trace is not None:
+                self.trace.record(minute, TRACE_KIND_CODES['discharge'], patient=patient.num)
+            del self._active[patient.num]
+            self.patient_table.release(patient)
+            self.patient_records.finish(patient.num)
+        self._leaving = []
+        self.record_patient_counts()
+        self.handle_events(minute, HANDOFF + 1)
+
+    def fill_quiet_minutes(self, first, last):
+        """Record the patient counts of the minutes first..last-1, in which no event is due."""
+        if last <= first:
+            return
+        # No event is due, so the counts stay as they are
+        shift_counts, total_counts = self.patient_index.patient_counts(self.shift_records.series_rows)
+        self.shift_records.record_block(first, last, shift_counts)
+        self.total_er_records.record_block(first, last, total_counts)
+
+    # Patient state ---------------------------------------------------------------------------
+
+    def under_treat_at(self, patient, minute):
+        return max(0, patient.underTreat - (minute - patient._synced))
+
+    def evolve_disease_blood(self, patient, until):
+        """
+        Disease blood of `patient` after the passive updates of minutes _synced+1..until.
+
+        Returns (disease_blood, zero_minute), zero_minute being the minute the blood ran out, if it did.
+        Mirrors PatientTable.update: blood grows every minute and, while underTreat is
+        still positive after the decrement, the assigned physician's hourly mojo is taken off.
+        """
+        synced = patient._synced
+        disease_blood = patient.disease_blood
+        if disease_blood <= 0 or until <= synced:
+            return disease_blood, None
+        rate = patient.disease_increase_rate
+        minute = synced
+        if patient.assigned_physician is not None and patient.underTreat > 1:
+            mojo = self._mojo[patient.assigned_physician.index]
+            type_code = patient.type_code
+            reduce_until = min(until, synced + patient.underTreat - 1)
+            while minute < reduce_until:
+                minute_of_day = self._start_mod + minute + 1
+                segment_end = min(reduce_until, minute + 60 - minute_of_day % 60)
+                steps = segment_end - minute
+                net_reduction = mojo[(minute_of_day // 60) % 24][type_code] - rate
+                if net_reduction > 0 and math.ceil(disease_blood / net_reduction) <= steps:
+                    return 0, minute + math.ceil(disease_blood / net_reduction)
+                disease_blood -= steps * net_reduction
+                minute = segment_end
+        disease_blood += rate * (until - minute)
+        return disease_blood, None
+
+    def advance_patient(self, patient, minute):
+        """Bring a patient's blood values and status up to the end of `minute`."""
+        if minute <= patient._synced:
+            return
+        disease_blood, zero_minute = self.evolve_disease_blood(patient, minute)
+        patient.disease_blood = 0 if zero_minute is not None else disease_blood
+        patient.underTreat = self.under_treat_at(patient, minute)
+        patient._synced = minute
+
+        if patient.status != 'admission':
+            if patient.boarding_blood <= 0:
+                patient.status = 'on-board'
+            if patient.disease_blood <= 0:
+                patient.status = 'wait-depart'
+                patient.need_admission = False
+            if patient.departure_blood <= 0:
+                patient.status = 'discharge'
+                patient.discharge_status = True
+                patient.need_admission = False
+
+    def refresh_patient(self, patient):
+        """Re-index a patient after its state changed, reschedule its passive events and wake up its physician."""
+        patient._version += 1
+        self.patient_index.update(patient, under_treat=self.under_treat_at(patient, self.current_minute) > 0)
+        if patient.discharge_status:
+            self._leaving.append(patient)
+            return
+
+        if patient.assigned_physician is not None:
+            self.schedule_action(patient.assigned_physician)
+
+        expiry_minute = patient._synced + patient.underTreat
+        if expiry_minute > self.current_minute:
+            self.push(expiry_minute, UPDATE, (patient, patient._version))
+        if patient.status != 'admission' and patient.underTreat > 1:
+            zero_minute = self.evolve_disease_blood(patient, patient._synced + patient.underTreat - 1)[1]
+            if zero_minute is not None:
+                self.push(zero_minute, UPDATE, (patient, patient._version))
+
+    # Physician actions -----------------------------------------------------------------------
+
+    def action_minute(self):
+        """The first minute whose physician actions are not handled yet."""
+        return self.current_minute + 1 if self._phase >= TREAT else self.current_minute
+
+    def schedule_action(self, physician):
+        """Queue the next action of an on-duty physician, unless one is queued; one without patients rests until it gets one."""
+        if physician in self._actions or physician in self._idle_runs or physician not in self._duty_order:
+            return
+        minute = self.action_minute()
+        if not self.patient_index.patients_of(physician):
+            self._resting.setdefault(physician, minute)
+            return
+        if physician in self._resting:
+            self.settle_physician(physician, minute - 1)
+            del self._resting[physician]
+        self._actions[physician] = self.push(minute, TREAT, physician)
+
+    def settle_physician(self, physician, until):
+        """
+        Record the rest, or apply the bedside visit or idle choices, of `physician` up to minute `until`,
+        before its patients, shift or energy change. An idle run ends there: the physician acts again
+        from the next minute on.
+        """
+        resting_since = self._resting.get(physician)
+        if resting_since is not None:
+            if until >= resting_since:
+                self.rest_physician(physician, resting_since, until + 1)
+                self._resting[physician] = until + 1
+            return
+        run = self._bedside_runs.get(physician)
+        if run is not None:
+            self.apply_bedside_run(physician, run, until)
+            return
+        first = self._idle_runs.pop(physician, None)
+        if first is not None:
+            self.apply_idle_run(physician, first, until)
+            self.schedule_action(physician)
+
+    def settle_physicians(self, until):
+        for physician in self._on_duty:
+            self.settle_physician(physician, until)
+
+    def rest_physician(self, physician, first, last):
+        """Record the minutes first..last-1 of a physician resting without patients."""
+        # Resting raises energy and lowers fatigue by one per minute (see record_physician_action)
+        steps = np.arange(1, last - first + 1)
+        energies = np.minimum(physician.energy + steps, 200)
+        fatigues = np.maximum(physician.fatigue - steps, 0)
+        self.physician_records.record_rest_block(physician.index, first, physician.shift_type, energies, fatigues)
+        physician.energy, physician.fatigue = int(energies[-1]), int(fatigues[-1])
+        if self.trace is not None:
+            for minute in range(first, last):
+                self.trace.record(minute, TRACE_KIND_CODES['rest'], physician.index)
+
+    def bedside_end(self, physician, patient):
+        """The minute after the current one in which the physician's visits bring the patient's boarding blood to 0 (past the horizon if never)."""
+        mojo = self._mojo[physician.index]
+        type_code = patient.type_code
+        boarding_blood = patient.boarding_blood
+        minute = self.current_minute
+        while minute < self._last_minute:
+            minute += 1
+            # Same arithmetic as treat_visited_patient, minute by minute
+            boarding_blood = max(0, boarding_blood - 2*mojo[((self._start_mod + minute) // 60) % 24][type_code])
+            if boarding_blood <= 0:
+                return minute
+        return self._last_minute + 1
+
+    def apply_bedside_run(self, physician, run, until):
+        """Apply and record the bedside visits of a run (see handle_actions) from its first pending minute up to `until`."""
+        patient, first, end = run
+        last = min(until, end - 1) + 1
+        if last <= first:
+            return
+        mojo = self._mojo[physician.index]
+        type_code = patient.type_code
+        boarding_blood = patient.boarding_blood
+        for minute in range(first, last):
+            blood_reduction = mojo[((self._start_mod + minute) // 60) % 24][type_code]
+            boarding_blood = max(0, boarding_blood - 2*blood_reduction)
+            if self.trace is not None:
+                self.trace.record(minute, TRACE_KIND_CODES['visit'], physician.index, patient.num)
+                self.trace.record(minute, TRACE_KIND_CODES['treat-boarding'], physician.index, patient.num, 2*blood_reduction)
+        patient.boarding_blood = boarding_blood
+
+        # A visit lowers energy by one per minute, and raises fatigue while energy is 0 (see record_physician_action)
+        energies = np.maximum(physician.energy - np.arange(1, last - first + 1), 0)
+        fatigues = physician.fatigue + np.cumsum(energies == 0)
+        counts = self.patient_index.counts[physician]
+        self.physician_records.record_visit_block(physician.index, first, physician.shift_type, energies, fatigues, patient.num,
+                                                  counts['underTreat'], counts['triage'], counts['on-board'], counts['wait-depart'])
+        physician.energy, physician.fatigue = int(energies[-1]), int(fatigues[-1])
+        run[1] = last
+
+    def is_idle(self, physician):
+        """Whether no choice of the physician changes a patient: it only has on-board patients, one of them counted without underTreat."""
+        counts = self.patient_index.counts[physician]
+        return not counts['triage'] and not counts['wait-depart'] and counts['on-board'] > counts['underTreat']
+
+    def apply_idle_run(self, physician, first, until):
+        """Draw, apply and record the choices of an idle physician (see is_idle) in the minutes first..until."""
+        if until < first:
+            return
+        counted = self.patient_index.counted
+        idle_patients = [patient.num for patient in self.patient_index.by_status[physician]['on-board'] if not counted[patient][2]]
+        rest_tendency = physician.rest_tendency
+        energy, fatigue = physician.energy, physician.fatigue
+        random = self.rng.physicians.random
+        energies, fatigues, patients = [], [], []
+        for _ in range(until + 1 - first):
+            # Same draws as select_status with only 'on-board' and 'rest' weighted, then the choice of the patient
+            rest_weight = rest_tendency/(1+energy)
+            if random() * (1 + rest_weight) < 1:
+                patients.append(idle_patients[int(random() * len(idle_patients))])
+                energy = max(energy - 1, 0)
+                fatigue = fatigue + 1 if energy == 0 else fatigue
+            else:
+                patients.append(-1)
+                energy, fatigue = min(energy + 1, 200), max(fatigue - 1, 0)
+            energies.append(energy)
+            fatigues.append(fatigue)
+
+        counts = self.patient_index.counts[physician]
+        self.physician_records.record_choice_block(physician.index, first, physician.shift_type, energies, fatigues, patients,
+                                                   counts['underTreat'], counts['triage'], counts['on-board'], counts['wait-depart'])
+        physician.energy, physician.fatigue = energy, fatigue
+        if self.trace is not None:
+            for minute, patient in enumerate(patients, first):
+                self.trace.record(minute, TRACE_KIND_CODES['visit' if patient >= 0 else 'rest'], physician.index, patient)
+
+    def handle_roster(self):
+        """Change the on-duty physicians; those going off duty first record their pending minutes."""
+        on_duty = self.current_physicians()
+        for physician in self._on_duty:
+            if physician not in on_duty:
+                self.settle_physician(physician, self.current_minute - 1)
+                self._actions.pop(physician, None)
+                self._resting.pop(physician, None)
+                self._bedside_runs.pop(physician, None)
+        self._on_duty = on_duty
+        self._duty_order = {physician: i for i, physician in enumerate(on_duty)}
+        for physician in on_duty:
+            self.schedule_action(physician)
+
+    def handle_actions(self, minute):
+        """Handle the physician actions due this minute, in on-duty order (the order the stepped engine draws in)."""
+        self._phase = TREAT
+        events, actions = self._events, self._actions
+        acting = []
+        while events and events[0][0] == minute and events[0][1] == TREAT:
+            _, _, seq, physician = heapq.heappop(events)
+            if actions.get(physician) == seq:
+                acting.append(physician)
+        if len(acting) > 1:
+            acting.sort(key=self._duty_order.__getitem__)
+        for physician in acting:
+            run = self._bedside_runs.pop(physician, None)
+            if run is not None:
+                self.apply_bedside_run(physician, run, minute - 1)
+            if not self.patient_index.patients_of(physician):
+                del actions[physician]
+                self._resting[physician] = minute
+                continue
+            self.physician_treat_patient(physician)
+            del actions[physician]
+
+            # A visit at the bedside goes on without a decision until the boarding blood runs out, and the
+            # choices of an idle physician are drawn when it is settled (verbose runs log every minute of
+            # these, so they keep acting minute by minute)
+            patient = self.bedside_patient(physician)
+            if self.verbose:
+                self.schedule_action(physician)
+            elif patient is not None:
+                end = self.bedside_end(physician, patient)
+                self._bedside_runs[physician] = [patient, minute + 1, end]
+                actions[physician] = self.push(end, TREAT, physician)
+            elif self.is_idle(physician):
+                self._idle_runs[physician] = minute + 1
+            else:
+                self.schedule_action(physician)
+
+    def get_shift_physician(self, shift):
+        # A new patient may change the physician's shift type, which its pending minutes are recorded with
+        physician = super().get_shift_physician(shift)
+        if physician is not None:
+            self.settle_physician(physician, self.action_minute() - 1)
+        return physician
+
+    # Event handlers --------------------------------------------------------------------------
+
+    def handle_arrivals(self, num_arrivals):
+        for patient_type in self.arrival_source.patient_types(self, num_arrivals):
+            patient = Patient(self.current_time, patient_type, table=self.patient_table, num=self.next_patient_num(),
+                              weekday=self.current_weekday, hour=self.current_hour, rng=self.rng, defaults=self.patient_defaults)
+            patient._synced = self.current_minute - 1
+            patient._version = 0
+            self._active[patient.num] = patient
+            self.assign_new_patient(patient)
+            if self.trace is not None:
+                self.trace_arrival(patient)
+            self.record_patient_process(patient)  # patients no shift could take are recorded here
+            self.refresh_patient(patient)
+
+    def physician_treat_patient(self, physician):
+        """One minute of an on-duty physician who has patients, see handle_actions."""
+        counts = self.patient_index.counts[physician]
+        visited_patient = self.bedside_patient(physician)
+        if visited_patient is None:
+            select_status = self.select_status(physician, counts)
+            potential_patients = self.patient_index.by_status[physician].get(select_status)
+            if potential_patients:
+                potential_patients = list(potential_patients)
+                if select_status == 'on-board':
+                    # Prefer patients whose underTreat has run out
+                    # (one stays counted as under treatment until its expiry UPDATE event, after the actions of that minute)
+                    counted = self.patient_index.counted
+                    potential_underTreat_zero = [p for p in potential_patients if not counted[p][2]]
+                    potential_patients = potential_underTreat_zero or potential_patients
+                visited_patient = self.rng.physicians.choice(potential_patients)
+
+        self.record_physician_action(physician, visited_patient, counts['underTreat'], counts)
+        if self.trace is not None:
+            self.trace.record(self.current_minute, TRACE_KIND_CODES['visit' if visited_patient else 'rest'],
+                              physician.index, visited_patient.num if visited_patient else -1)
+        if not visited_patient:
+            return
+        if visited_patient.status == 'on-board' and not self.patient_index.counted[visited_patient][2]:
+            return  # treat_visited_patient changes nothing for an on-board patient whose underTreat ran out
+
+        self.advance_patient(visited_patient, self.current_minute - 1)
+        self.treat_visited_patient(physician, visited_patient)
+        self.refresh_patient(visited_patient)
+
+    def handle_admissions(self, num_admissions):
+        admission_pool = self.patient_index.admission_pool
+        if not admission_pool:
+            return
+        # Patients whose disease blood runs out leave the pool at that minute (see refresh_patient),
+        # so only the admitted ones need bringing up to date, in admit_patient
+        for patient in self.admit_patients(admission_pool, num_admissions):
+            self.refresh_patient(patient)
+
+    def admit_patient(self, admission_pool, patient):
+        # The physician's pending minutes are recorded with the patient still on its list
+        self.settle_physician(patient.assigned_physician, self.current_minute)
+        self.advance_patient(patient, self.current_minute - 1)
+        super().admit_patient(admission_pool, patient)
+
+    def handle_patient_update(self, patient, version):
+        if patient._version != version or patient not in self.patient_index:
+            return  # stale event, the patient was touched or left since it was scheduled
+        if patient.assigned_physician is not None:
+            self.settle_physician(patient.assigned_physician, self.current_minute)
+        self.advance_patient(patient, self.current_minute)
+        self.record_patient_process(patient)
+        self.refresh_patient(patient)
+
+    def handle_handoffs(self):
+        # Handoffs move patients, change shift types and reset energy
+        self.settle_physicians(self.current_minute)
+        for shift in self.roster.ending_shifts[self.current_minute_of_day()]:
+            if self.verbose:
+                self.log(f"Shift {shift.name} ending at {self.current_time}.")
+            if self.trace is not None:
+                self.trace.record(self.current_minute, TRACE_KIND_CODES['shift-end'], value=shift.index)
+            patient_in_shift = self.patient_index.shift_patients(shift.name)
+            for patient in patient_in_shift:
+                self.advance_patient(patient, self.current_minute)
+            self.handoff_patients(shift, patient_in_shift)
+            for patient in patient_in_shift:
+                self.refresh_patient(patient)
+        # Bedside visits of handed off patients stop
+        for physician, run in list(self._bedside_runs.items()):
+            if self.bedside_patient(physician) is not run[0]:
+                del self._bedside_runs[physician]
+                del self._actions[physician]
+                self.schedule_action(physician)
@@ -0,0 +1,243 @@
+import os
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.feather  # noqa: F401  (Feather v2 is the Arrow IPC file format)
+except ImportError:  # optional, only needed for Parquet/Feather export
+    pa = None
+
+from er_recorders import minute_timestamps, PhysicianRecorder
+from er_state import STATUS_NAMES, PATIENT_TYPES
+
+PATIENT_CHART_COLUMNS = {
+    'Patient_num': 'int64',
+    'Arrival_time': 'timestamp',
+    'Patient_type': 'string',
+    'Initial_boarding_blood': 'float64',
+    'Initial_disease_blood': 'float64',
+    'Initial_departure_blood': 'float64',
+    'Status': 'string',
+    'Assigned_physician': 'string',
+    'Timestamp': 'timestamp',
+    'Current_boarding_blood': 'float64',
+    'Current_disease_blood': 'float64',
+    'Current_departure_blood': 'float64',
+}
+FORMATS = {'parquet': '.parquet', 'feather': '.feather'}
+
+
+class ChunkedTableWriter:
+    """
+    Write one table as a sequence of column chunks to a Parquet or Feather file.
+
+    Parameters:
+    - path: output file
+    - fmt: 'parquet' or 'feather'
+    - schema: {column name: arrow type name}, if the types cannot be inferred from the first chunk
+    """
+
+    def __init__(self, path, fmt='parquet', schema=None):
+        if pa is None:
+            raise ImportError("pyarrow is required for Parquet/Feather export (pip install pyarrow).")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}', expected one of {list(FORMATS)}.")
+        self.path = path
+        self.fmt = fmt
+        self.schema = None
+        if schema is not None:
+            types = {'int64': pa.int64(), 'float64': pa.float64(), 'string': pa.string(), 'timestamp': pa.timestamp('us')}
+            self.schema = pa.schema([(name, types[type_name]) for name, type_name in schema.items()])
+        self.writer = None
+        self.sink = None
+        self.rows = 0
+
+    def write(self, columns):
+        """Append a chunk given as {column name: list or array}."""
+        table = pa.table(columns, schema=self.schema)
+        if self.writer is None:
+            self.schema = table.schema  # later chunks are cast to the schema of the first
+            if self.fmt == 'parquet':
+                self.writer = pq.ParquetWriter(self.path, self.schema)
+            else:
+                self.sink = pa.OSFile(self.path, 'wb')
+                self.writer = pa.ipc.new_file(self.sink, self.schema)
+        elif table.schema != self.schema:
+            table = table.cast(self.schema)
+        self.writer.write_table(table)
+        self.rows += len(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.sink is not None:
+            self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def partition_dir(directory, table_name, scenario=None, replication=None):
+    """Hive-style partition directory: directory/table/scenario=.../replication=..."""
+    parts = [directory, table_name]
+    if scenario is not None:
+        parts.append(f"scenario={scenario}")
+    if replication is not None:
+        parts.append(f"replication={replication}")
+    path = os.path.join(*parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def patient_chart_chunks(patient_records, chunk_size):
+    """The flattened patient chart as column chunks, from the typed arrays of the PatientHistory, chunk by chunk."""
+    start_datetime = patient_records.start_datetime
+    physician_names = np.array([physician.name for physician in patient_records.physicians] + [None], dtype=object)
+    status_names = np.array(STATUS_NAMES, dtype=object)
+    type_names = np.array(PATIENT_TYPES, dtype=object)
+    for patients, transitions in patient_records.chunks_iter():
+        rows = np.searchsorted(patients['patient'], transitions['patient'])  # patient row of every transition
+        first = np.ones(len(transitions), dtype=bool)  # first record of its patient: Initial_ blood values
+        first[1:] = transitions['patient'][1:] != transitions['patient'][:-1]
+        for begin in range(0, len(transitions), chunk_size):
+            part, patient_rows, is_first = transitions[begin:begin + chunk_size], rows[begin:begin + chunk_size], first[begin:begin + chunk_size]
+            chunk = {
+                'Patient_num': part['patient'].astype(np.int64),
+                'Arrival_time': minute_timestamps(start_datetime, patients['arrival'][patient_rows]),
+                'Patient_type': type_names[patients['patient_type'][patient_rows]],
+                'Status': status_names[part['status']],
+                'Assigned_physician': physician_names[part['physician']],
+                'Timestamp': minute_timestamps(start_datetime, part['minute']),
+            }
+            for blood in ['boarding', 'disease', 'departure']:
+                values = part[f'{blood}_blood'].astype(object)
+                chunk[f'Initial_{blood}_blood'] = np.where(is_first, values, None)
+                chunk[f'Current_{blood}_blood'] = np.where(is_first, None, values)
+            yield {column: chunk[column] for column in PATIENT_CHART_COLUMNS}
+
+
+def count_chunks(recorder, chunk_size):
+    """Rows of a CountRecorder as column chunks; a recorder with series gets a long 'Series' column."""
+    for start in range(0, recorder.size, chunk_size):
+        stop = min(start + chunk_size, recorder.size)
+        minutes = recorder.minutes[start:stop]
+        counts = recorder.counts[start:stop]
+        if recorder.series is None:
+            chunk = {'Timestamp': minute_timestamps(recorder.start_datetime, minutes)}
+            for i, key in enumerate(recorder.keys):
+                chunk[key] = counts[:, i]
+        else:
+            n_series = len(recorder.series)
+            chunk = {'Series': np.tile(np.array(recorder.series, dtype=object), len(minutes)),
+                     'Timestamp': minute_timestamps(recorder.start_datetime, np.repeat(minutes, n_series))}
+            for i, key in enumerate(recorder.keys):
+                chunk[key] = counts[:, :, i].reshape(-1)
+        yield chunk
+
+
+def physician_chunks(recorder, chunk_size):
+    """Rows of a PhysicianRecorder as column chunks, with a 'Physician' column."""
+    physician_names = np.array(recorder.physician_names, dtype=object)
+    shift_names = np.array(recorder.shift_names + [None], dtype=object)
+    for start in range(0, recorder.size, chunk_size):
+        values = recorder.values[start:min(start + chunk_size, recorder.size)]
+        chunk = {
+            'Physician': physician_names[values[:, 0]],
+            'ShiftType': shift_names[values[:, 2]],
+            'Timestamp': minute_timestamps(recorder.start_datetime, values[:, 1]),
+            'energy': values[:, 3],
+            'fatigue': values[:, 4],
+            'Action': values[:, 5],
+            'patient': pa.array(values[:, 6], mask=values[:, 6] < 0),
+        }
+        for i, column in enumerate(PhysicianRecorder.COLUMNS[7:], start=7):
+            chunk[column] = values[:, i]
+        yield chunk
+
+
+def admission_chunks(er, chunk_size):
+    """The ward admissions (admission_records) as column chunks: patient, admission time and boarding minutes."""
+    for rows in er.admission_records.chunks_iter():
+        for start in range(0, len(rows), chunk_size):
+            values = rows[start:start + chunk_size]
+            yield {
+                'Patient_num': values['patient'].astype(np.int64),
+                'Timestamp': minute_timestamps(er.start_datetime, values['minute']),
+                'wait_minutes': values['wait'].astype(np.int64),
+            }
+
+
+def rows_to_columns(rows):
+    """A list of dicts with the same keys as columns."""
+    return {key: [row[key] for row in rows] for key in rows[0]} if rows else {}
+
+
+def save_to_excel(data, filename):
+    """
+    Save a dictionary of dictionaries to an Excel file with separate sheets.
+    
+    Parameters:
+    - data: The dictionary of dictionaries, or a recorder (er.shift_records, er.physician_records).
+    - filename: The filename for the Excel file.
+    """
+    import pandas as pd
+    if hasattr(data, 'to_dataframes'):
+        data = data.to_dataframes()  # a recorder
+    with pd.ExcelWriter(filename) as writer:
+        for key, records in data.items():
+            df = pd.DataFrame(records)
+            df.to_excel(writer, sheet_name=str(key), index=False)
+
+
+def export_results(er, directory="./results", fmt='parquet', scenario=None, replication=None,
+                   chunk_size=100000, excel_summary=False):
+    """
+    Write the results of a finished simulation as Parquet or Feather tables.
+
+    Each table goes to directory/<table>/[scenario=<scenario>/][replication=<replication>/]part-0<ext>,
+    so the output of many replications and scenarios can be read back as one partitioned dataset.
+    Tables: patient_chart (generate_patient_chart), summary_physician (generate_summary), summary_er
+    (total_er_records, whose 'wait-admission' column is the admission queue length), summary_shift
+    (shift_records, long format), physician_records (long format) and admissions (admission_records).
+    Large tables are written in chunks of chunk_size rows.
+
+    Parameters:
+    - er: the finished ERSimulation
+    - directory: root directory of the dataset
+    - fmt: 'parquet' or 'feather'
+    - scenario, replication: partition values (omitted from the path if None)
+    - chunk_size: rows per written chunk
+    - excel_summary: also write the shift summary to summary_physician.xlsx in the partition directory
+
+    Returns:
+    - {table name: path of the written file}
+    """
+    ext = FORMATS.get(fmt, '')
+    tables = {
+        'patient_chart': (patient_chart_chunks(er.patient_records, chunk_size), PATIENT_CHART_COLUMNS),
+        'summary_physician': (iter([rows_to_columns(er.generate_summary())]), None),
+        'summary_er': (count_chunks(er.total_er_records, chunk_size), None),
+        'summary_shift': (count_chunks(er.shift_records, chunk_size), None),
+        'physician_records': (physician_chunks(er.physician_records, chunk_size), None),
+        'admissions': (admission_chunks(er, chunk_size), None),
+    }
+    paths = {}
+    for table_name, (chunks, schema) in tables.items():
+        path = os.path.join(partition_dir(directory, table_name, scenario, replication), f"part-0{ext}")
+        with ChunkedTableWriter(path, fmt, schema) as writer:
+            for chunk in chunks:
+                if chunk:
+                    writer.write(chunk)
+        if writer.rows:
+            paths[table_name] = path
+
+    if excel_summary:
+        import pandas as pd
+        path = os.path.join(partition_dir(directory, 'summary_physician', scenario, replication), "summary_physician.xlsx")
+        pd.DataFrame(er.generate_summary()).to_excel(path, index=False)
+        paths['summary_physician.xlsx'] = path
+    return paths
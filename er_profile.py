@@ -0,0 +1,199 @@
+import os, signal, sys, threading, time
+from collections import Counter
+
+# Simulation methods instrumented by PhaseProfiler, of the stepped and of the event-driven engine:
+# method name: (phase the call's time counts for, or None; [(counter, number counted from the call's arguments)])
+INSTRUMENTED = {
+    'patient_arrival': ('arrival', []),
+    'handle_arrivals': ('arrival', []),
+    'physician_treat_patient': ('treatment', [('patients_scanned', lambda er, physician: len(er.patient_index.patients_of(physician)))]),
+    'ward_admission': ('admission', []),
+    'handle_admissions': ('admission', []),
+    'admit_patients': (None, [('patients_scanned', lambda er, admission_pool, num_admissions: len(admission_pool))]),
+    'update_patients': ('update', [('patients_scanned', lambda er: len(er.patients))]),
+    'handle_patient_update': ('update', [('patients_scanned', lambda er, patient, version: 1)]),
+    'record_patient_counts': ('recording', [('count_rows_recorded', lambda er: 1)]),
+    'fill_quiet_minutes': ('recording', [('count_rows_recorded', lambda er, first, last: max(last - first, 0))]),
+    'rest_physician': (None, [('physician_rows_recorded', lambda er, physician, first, last: last - first)]),
+    'apply_bedside_run': (None, [('physician_rows_recorded', lambda er, physician, run, until: max(min(until, run[2] - 1) + 1 - run[1], 0))]),
+    'apply_idle_run': (None, [('physician_rows_recorded', lambda er, physician, first, until: max(until + 1 - first, 0))]),
+    'record_physician_action': (None, [('physician_rows_recorded', lambda er, *args: 1)]),
+    'check_shift_change_and_handoff': ('handoff', []),
+    'handle_handoffs': ('handoff', []),
+    'handoff_patients': (None, [('handoffs', lambda er, shift, patient_in_shift: len(patient_in_shift))]),
+}
+PHASES = ['arrival', 'treatment', 'admission', 'update', 'recording', 'handoff']
+
+
+class PhaseProfiler:
+    """
+    Per-phase timers and work counters of ERSimulation.start (either engine), see ERSimulation.set_profiling.
+
+    While start() runs, the methods of INSTRUMENTED are replaced by timing/counting wrappers set as
+    attributes of the simulation object only; they are removed when start() returns, so a simulation
+    without a profiler runs the plain methods. Times come from the monotonic time.perf_counter.
+    Totals add up over successive start() calls.
+
+    Parameters:
+    - sampler: optional sampling profiler, any object with start() and stop() (e.g. StackSampler,
+      or pyinstrument.Profiler); running while start() runs, its report() (if any) is part of the report
+    """
+
+    def __init__(self, sampler=None):
+        self.sampler = sampler
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.calls = dict.fromkeys(PHASES, 0)
+        self.counters = Counter()
+        self.wall_seconds = 0.0
+        self.minutes = 0
+        self.wrapped = []
+        self._begin = None
+
+    def __getstate__(self):
+        # A checkpoint keeps the totals; the sampler (a thread) and a running measurement are left out
+        state = self.__dict__.copy()
+        state['sampler'] = None
+        state['wrapped'] = []
+        state['_begin'] = None
+        return state
+
+    def instrument(self, er, name, phase, counts):
+        method = getattr(er, name)
+        seconds, calls, counters = self.seconds, self.calls, self.counters
+        clock = time.perf_counter
+
+        if phase is None:
+            def wrapper(*args):
+                for counter, count in counts:
+                    counters[counter] += count(er, *args)
+                return method(*args)
+        else:
+            def wrapper(*args):
+                for counter, count in counts:
+                    counters[counter] += count(er, *args)
+                start = clock()
+                try:
+                    return method(*args)
+                finally:
+                    seconds[phase] += clock() - start
+                    calls[phase] += 1
+        setattr(er, name, wrapper)
+        self.wrapped.append(name)
+
+    def begin(self, er):
+        """Instrument the simulation and start the clocks (and the sampler); called by start()."""
+        for name, (phase, counts) in INSTRUMENTED.items():
+            if name not in self.wrapped and hasattr(er, name):
+                self.instrument(er, name, phase, counts)
+        self._begin = (time.perf_counter(), er.current_minute, er.patient_counter, len(er.admission_records),
+                       er.patient_records.transition_count)
+        if self.sampler is not None:
+            self.sampler.start()
+
+    def end(self, er):
+        """Stop the clocks (and the sampler), add up the run and remove the wrappers; called by start()."""
+        if self.sampler is not None:
+            self.sampler.stop()
+        start, minute, patient_counter, admissions, patient_records = self._begin
+        self.wall_seconds += time.perf_counter() - start
+        self.minutes += er.current_minute - minute
+        self.counters['arrivals'] += er.patient_counter - patient_counter
+        self.counters['admissions'] += len(er.admission_records) - admissions
+        self.counters['patient_records_appended'] += er.patient_records.transition_count - patient_records
+        for name in self.wrapped:
+            er.__dict__.pop(name, None)
+        self.wrapped = []
+        self._begin = None
+
+    def report(self):
+        """
+        Returns:
+        - {'wall_seconds', 'minutes' simulated, 'minutes_per_second',
+           'phases': {phase: {'seconds', 'calls', 'share' of wall_seconds}}, 'other_seconds' (the rest of the loop),
+           'counters': {'arrivals', 'patients_scanned', 'patient_records_appended', 'physician_rows_recorded',
+                        'count_rows_recorded', 'handoffs', 'admissions'},
+           'samples': the sampler's report, or None}
+        """
+        wall_seconds = self.wall_seconds
+        report_samples = getattr(self.sampler, 'report', None)
+        return {
+            'wall_seconds': wall_seconds,
+            'minutes': self.minutes,
+            'minutes_per_second': self.minutes / wall_seconds if wall_seconds else 0.0,
+            'phases': {phase: {'seconds': self.seconds[phase], 'calls': self.calls[phase],
+                               'share': self.seconds[phase] / wall_seconds if wall_seconds else 0.0} for phase in PHASES},
+            'other_seconds': wall_seconds - sum(self.seconds.values()),
+            'counters': {counter: self.counters[counter] for counter in ['arrivals', 'patients_scanned', 'patient_records_appended',
+                                                                          'physician_rows_recorded', 'count_rows_recorded',
+                                                                          'handoffs', 'admissions']},
+            'samples': report_samples() if report_samples else None,
+        }
+
+
+class StackSampler:
+    """
+    Minimal sampling profiler: every `interval` seconds of CPU time the stack of the profiled thread
+    is sampled, and the samples are counted per function it was running (own) or that was anywhere
+    on the stack (cumulative).
+
+    Where possible (POSIX, start() called from the main thread) a SIGPROF interval timer interrupts
+    the profiled code between two bytecodes, so samples are not biased towards code releasing the
+    GIL. Otherwise a background thread samples the stack of the thread that called start().
+
+    Parameters:
+    - interval: seconds between samples
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self.own = Counter()
+        self.cumulative = Counter()
+        self._stop = None
+        self._thread = None
+        self._previous_handler = None
+
+    def start(self):
+        if hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread():
+            self._previous_handler = signal.signal(signal.SIGPROF, lambda signum, frame: self.sample(frame))
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self._target = threading.get_ident()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        else:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+            self._previous_handler = None
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                self.sample(frame)
+
+    def sample(self, frame):
+        self.samples += 1
+        self.own[self.function_name(frame)] += 1
+        seen = set()
+        while frame is not None:
+            seen.add(self.function_name(frame))
+            frame = frame.f_back
+        self.cumulative.update(seen)
+
+    @staticmethod
+    def function_name(frame):
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+
+    def report(self, top=20):
+        """{'samples', 'interval', 'own': [(function, samples)], 'cumulative': [(function, samples)]}, the `top` functions each."""
+        return {'samples': self.samples, 'interval': self.interval,
+                'own': self.own.most_common(top), 'cumulative': self.cumulative.most_common(top)}
@@ -0,0 +1,565 @@
+import os, struct
+from datetime import timedelta
+import numpy as np
+
+from er_state import COUNT_KEYS, STATUS_NAMES, PATIENT_TYPES
+
+# Patient history (see PatientHistory): one row per change of a patient's status or physician
+TRANSITION_DTYPE = np.dtype([
+    ('patient', np.int32),     # patient number
+    ('minute', np.int32),      # minutes since start_datetime
+    ('status', np.int8),       # index in STATUS_NAMES
+    ('physician', np.int16),   # index in ERSimulation.physicians, -1 if none
+    ('boarding_blood', np.float64),
+    ('disease_blood', np.float64),
+    ('departure_blood', np.float64),
+])
+# ... and one row per patient for what does not change
+PATIENT_DTYPE = np.dtype([
+    ('patient', np.int32),
+    ('arrival', np.int32),       # arrival minute (minutes since start_datetime)
+    ('patient_type', np.int8),   # index in PATIENT_TYPES
+])
+CHUNK_HEADER = struct.Struct('<QQ')  # patients, transitions of a chunk in a history file
+# Ward admissions (see AdmissionRecorder)
+ADMISSION_DTYPE = np.dtype([
+    ('patient', np.int32),   # patient number
+    ('minute', np.int32),    # minute admitted (minutes since start_datetime)
+    ('wait', np.int32),      # minutes waited for the ward bed
+])
+
+
+def minute_timestamps(start_datetime, minutes):
+    """Timestamps of minute indices (minutes since start_datetime)."""
+    return (np.datetime64(start_datetime, 'm') + np.asarray(minutes).astype('timedelta64[m]')).astype('datetime64[ns]')
+
+
+class CountRecorder:
+    """
+    Per-minute patient counts (COUNT_KEYS) of the total ER, or of one series per shift.
+
+    Each record is one row of a preallocated int32 array, with the minute index (minutes since
+    start_datetime) kept alongside instead of a Timestamp; rows become DataFrames only on export.
+
+    Parameters:
+    - start_datetime: the simulation start, minute 0
+    - capacity: number of minutes to preallocate (grown if exceeded)
+    - series: names of the series (e.g. shift names), or None for a single series
+    """
+
+    def __init__(self, start_datetime, capacity, series=None):
+        self.start_datetime = start_datetime
+        self.keys = list(COUNT_KEYS)
+        self.series = list(series) if series is not None else None
+        self.series_rows = {name: i for i, name in enumerate(self.series)} if self.series is not None else None
+        shape = (len(self.series), len(self.keys)) if self.series is not None else (len(self.keys),)
+        self.minutes = np.zeros(max(capacity, 1), dtype=np.int32)
+        self.counts = np.zeros((max(capacity, 1), *shape), dtype=np.int32)
+        self.size = 0
+
+    def _reserve(self, n):
+        if self.size + n <= len(self.minutes):
+            return
+        capacity = max(2 * len(self.minutes), self.size + n)
+        minutes = np.zeros(capacity, dtype=np.int32)
+        minutes[:self.size] = self.minutes[:self.size]
+        counts = np.zeros((capacity, *self.counts.shape[1:]), dtype=np.int32)
+        counts[:self.size] = self.counts[:self.size]
+        self.minutes, self.counts = minutes, counts
+
+    def record(self, minute, counts):
+        """Record the counts of one minute (per series, in COUNT_KEYS order)."""
+        if self.size == len(self.minutes):
+            self._reserve(1)
+        self.minutes[self.size] = minute
+        self.counts[self.size] = counts
+        self.size += 1
+
+    def record_block(self, first, last, counts):
+        """Record the same counts for the minutes first..last-1."""
+        n = last - first
+        if n <= 0:
+            return
+        self._reserve(n)
+        self.minutes[self.size:self.size + n] = np.arange(first, last)
+        self.counts[self.size:self.size + n] = counts
+        self.size += n
+
+    def __len__(self):
+        return self.size
+
+    def __getstate__(self):
+        # Snapshots keep only the recorded rows; the preallocated rest is restored empty
+        state = self.__dict__.copy()
+        state['minutes'], state['counts'] = self.minutes[:self.size], self.counts[:self.size]
+        state['capacity'] = len(self.minutes)
+        return state
+
+    def __setstate__(self, state):
+        capacity = state.pop('capacity')
+        self.__dict__.update(state)
+        minutes, counts = self.minutes, self.counts
+        self.minutes = np.zeros(capacity, dtype=np.int32)
+        self.minutes[:self.size] = minutes
+        self.counts = np.zeros((capacity, *counts.shape[1:]), dtype=np.int32)
+        self.counts[:self.size] = counts
+
+    def column(self, key, series=None):
+        """Recorded values of one count key (of one series, if the recorder has several)."""
+        counts = self.counts[:self.size]
+        if series is not None:
+            counts = counts[:, self.series_rows[series]]
+        return counts[..., self.keys.index(key)]
+
+    def to_dataframe(self, series=None):
+        import pandas as pd
+        counts = self.counts[:self.size]
+        if series is not None:
+            counts = counts[:, self.series_rows[series]]
+        df = pd.DataFrame(counts, columns=self.keys)
+        df.insert(0, 'Timestamp', minute_timestamps(self.start_datetime, self.minutes[:self.size]))
+        return df
+
+    def to_dataframes(self):
+        """{series name: DataFrame}, e.g. for save_to_excel."""
+        return {name: self.to_dataframe(name) for name in self.series}
+
+
+class PhysicianRecorder:
+    """
+    Per-minute actions of the on-duty physicians, one int32 row per physician and minute.
+
+    Parameters:
+    - start_datetime: the simulation start, minute 0
+    - capacity: number of rows to preallocate (grown if exceeded)
+    - physician_names: names of the physicians, by physician index
+    - shift_names: names of the shift types, by shift index
+    """
+    COLUMNS = ['physician', 'minute', 'ShiftType', 'energy', 'fatigue', 'Action', 'patient', 'underTreat',
+               'triage', 'on-board', 'wait-depart']
+
+    def __init__(self, start_datetime, capacity, physician_names, shift_names):
+        self.start_datetime = start_datetime
+        self.physician_names = list(physician_names)
+        self.shift_names = list(shift_names)
+        self.shift_codes = {name: code for code, name in enumerate(self.shift_names)}
+        self.values = np.zeros((max(capacity, 1), len(PhysicianRecorder.COLUMNS)), dtype=np.int32)
+        self.size = 0
+
+    def _reserve(self, n):
+        if self.size + n <= len(self.values):
+            return
+        values = np.zeros((max(2 * len(self.values), self.size + n), self.values.shape[1]), dtype=np.int32)
+        values[:self.size] = self.values[:self.size]
+        self.values = values
+
+    def record(self, physician, minute, shift_type, energy, fatigue, action, patient, under_treat, triage, on_board, wait_depart):
+        """Record one minute of a physician (index); shift_type is a shift name or None, patient a number or None."""
+        if self.size == len(self.values):
+            self._reserve(1)
+        self.values[self.size] = (physician, minute, self.shift_codes.get(shift_type, -1), energy, fatigue, action,
+                                  -1 if patient is None else patient, under_treat, triage, on_board, wait_depart)
+        self.size += 1
+
+    def record_rest_block(self, physician, first, shift_type, energies, fatigues):
+        """Record a physician resting, without patients, from minute `first` on (one minute per energy value)."""
+        n = len(energies)
+        self._reserve(n)
+        block = self.values[self.size:self.size + n]
+        block[:] = 0
+        block[:, 0] = physician
+        block[:, 1] = np.arange(first, first + n)
+        block[:, 2] = self.shift_codes.get(shift_type, -1)
+        block[:, 3] = energies
+        block[:, 4] = fatigues
+        block[:, 6] = -1
+        self.size += n
+
+    def record_visit_block(self, physician, first, shift_type, energies, fatigues, patient, under_treat, triage, on_board, wait_depart):
+        """Record a physician visiting the same patient, with the same patient counts, from minute `first` on (one minute per energy value)."""
+        n = len(energies)
+        self._reserve(n)
+        block = self.values[self.size:self.size + n]
+        block[:] = (physician, 0, self.shift_codes.get(shift_type, -1), 0, 0, 1, patient, under_treat, triage, on_board, wait_depart)
+        block[:, 1] = np.arange(first, first + n)
+        block[:, 3] = energies
+        block[:, 4] = fatigues
+        self.size += n
+
+    def record_choice_block(self, physician, first, shift_type, energies, fatigues, patients, under_treat, triage, on_board, wait_depart):
+        """Record a physician visiting a patient (number) or resting (-1) each minute, with the same patient counts, from minute `first` on."""
+        n = len(patients)
+        self._reserve(n)
+        patients = np.asarray(patients)
+        block = self.values[self.size:self.size + n]
+        block[:] = (physician, 0, self.shift_codes.get(shift_type, -1), 0, 0, 0, 0, under_treat, triage, on_board, wait_depart)
+        block[:, 1] = np.arange(first, first + n)
+        block[:, 3] = energies
+        block[:, 4] = fatigues
+        block[:, 5] = patients >= 0
+        block[:, 6] = patients
+        self.size += n
+
+    def __len__(self):
+        return self.size
+
+    def __getstate__(self):
+        # Snapshots keep only the recorded rows; the preallocated rest is restored empty
+        state = self.__dict__.copy()
+        state['values'] = self.values[:self.size]
+        state['capacity'] = len(self.values)
+        return state
+
+    def __setstate__(self, state):
+        capacity = state.pop('capacity')
+        self.__dict__.update(state)
+        values = self.values
+        self.values = np.zeros((capacity, values.shape[1]), dtype=np.int32)
+        self.values[:self.size] = values
+
+    def __contains__(self, name):
+        return name in self.keys()
+
+    def keys(self):
+        """Names of the recorded physicians, in order of their first record."""
+        physicians = self.values[:self.size, 0]
+        ids, first_rows = np.unique(physicians, return_index=True)
+        return [self.physician_names[i] for i in ids[np.argsort(first_rows)]]
+
+    def to_dataframe(self, name):
+        import pandas as pd
+        values = self.values[:self.size]
+        values = values[values[:, 0] == self.physician_names.index(name)]
+        shift_names = np.array(self.shift_names + [None], dtype=object)
+        patients = values[:, 6].astype(float)
+        patients[values[:, 6] < 0] = np.nan
+        df = pd.DataFrame({
+            'ShiftType': shift_names[values[:, 2]],
+            'Timestamp': minute_timestamps(self.start_datetime, values[:, 1]),
+            'energy': values[:, 3],
+            'fatigue': values[:, 4],
+            'Action': values[:, 5],
+            'patient': patients,
+        })
+        for i, column in enumerate(PhysicianRecorder.COLUMNS[7:], start=7):
+            df[column] = values[:, i]
+        return df
+
+    def to_dataframes(self):
+        """{physician name: DataFrame}, e.g. for save_to_excel."""
+        return {name: self.to_dataframe(name) for name in self.keys()}
+
+
+class PatientHistory:
+    """
+    The recorded process of every patient: one compact TRANSITION_DTYPE row per change of status or
+    physician, the arrival time and type kept once per patient (PATIENT_DTYPE).
+
+    Transitions are appended to a preallocated buffer. When it is full, the histories of the patients
+    who left (discharged or admitted, see finish) are moved out as one chunk, sorted by patient: appended to the
+    file `path` (the history's resident memory then does not grow with the horizon; the per-minute
+    count and physician recorders still do), or kept in memory as typed arrays if no path is given.
+    Only the buffer grows, when the patients still in the ER fill more than half of it.
+
+    For the code reading patient_records as {patient number: list of record dicts}, the history is a
+    read-only mapping building those dicts on access; patients come grouped by chunk, in the order
+    they left, the patients still in the ER last. chunks() gives the typed arrays.
+
+    Parameters:
+    - start_datetime: the simulation start, minute 0
+    - physicians: the simulation's PhysicianRegistry, for the physician names
+    - path: binary file the chunks of finished patients are appended to (None keeps them in memory)
+    - chunk_size: number of transitions buffered before finished patients are moved out
+    """
+
+    def __init__(self, start_datetime, physicians, path=None, chunk_size=65536):
+        self.start_datetime = start_datetime
+        self.physicians = physicians
+        self.path = path
+        self.chunk_size = chunk_size
+        self.buffer = np.zeros(chunk_size, dtype=TRANSITION_DTYPE)
+        self.size = 0
+        self.last = {}  # patient number -> (status, physician) of the last transition, for patients in the buffer
+        self.arrivals = {}  # patient number -> (arrival minute, patient type code), for patients in the buffer
+        self.finished = set()  # patients in the buffer who left the ER
+        self.chunks = []  # (patients, transitions) moved out, if there is no path
+        self.spilled = []  # (offset, patients, transitions) of the chunks written to path
+        self.spilled_bytes = 0
+        self.patient_count = 0
+        self.transition_count = 0
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            open(path, 'wb').close()
+
+    def record(self, patient, minute):
+        """
+        Add a transition of `patient` at `minute` if its status or physician changed (always for its first record).
+
+        Returns:
+        - None if nothing changed, else (first, index of the previous physician or -1)
+        """
+        table, row = patient._table, patient._row
+        status, physician = table.status.item(row), table.physician.item(row)
+        num = patient.num
+        last = self.last.get(num)
+        if last is None:
+            self.arrivals[num] = (int((patient.arrival_time - self.start_datetime).total_seconds() // 60), patient.type_code)
+            self.patient_count += 1
+            change = (True, -1)
+        elif last[0] == status and last[1] == physician:
+            return None
+        else:
+            change = (False, last[1])
+
+        if self.size == len(self.buffer):
+            self.compact()
+        self.buffer[self.size] = (num, minute, status, physician, table.boarding_blood.item(row),
+                                  table.disease_blood.item(row), table.departure_blood.item(row))
+        self.size += 1
+        self.transition_count += 1
+        self.last[num] = (status, physician)
+        return change
+
+    def finish(self, num):
+        """Mark a patient as gone from the ER: no transitions follow, its history can be moved out."""
+        if num in self.last:
+            self.finished.add(num)
+
+    def compact(self):
+        """Move the finished patients out of the full buffer; grow it if it stays more than half full."""
+        self.flush()
+        if self.size > len(self.buffer) // 2:
+            buffer = np.zeros(2 * len(self.buffer), dtype=TRANSITION_DTYPE)
+            buffer[:self.size] = self.buffer[:self.size]
+            self.buffer = buffer
+
+    def flush(self):
+        """Move the histories of the patients who left out of the buffer, as one chunk."""
+        if not self.finished:
+            return
+        transitions = self.buffer[:self.size]
+        finished = np.fromiter(self.finished, dtype=np.int32, count=len(self.finished))
+        done = np.isin(transitions['patient'], finished)
+        self.write_chunk(*self.sorted_chunk(transitions[done], self.finished))
+        kept = transitions[~done]
+        self.buffer[:len(kept)] = kept
+        self.size = len(kept)
+        for num in self.finished:
+            del self.last[num]
+            del self.arrivals[num]
+        self.finished = set()
+
+    def sorted_chunk(self, transitions, nums):
+        """(patients, transitions) of some patients of the buffer, sorted by patient number."""
+        transitions = transitions[np.argsort(transitions['patient'], kind='stable')]
+        patients = np.zeros(len(nums), dtype=PATIENT_DTYPE)
+        patients['patient'] = sorted(nums)
+        for i, num in enumerate(patients['patient'].tolist()):
+            patients['arrival'][i], patients['patient_type'][i] = self.arrivals[num]
+        return patients, transitions
+
+    def write_chunk(self, patients, transitions):
+        if not self.path:
+            self.chunks.append((patients, transitions))
+            return
+        with open(self.path, 'ab') as file:
+            file.write(CHUNK_HEADER.pack(len(patients), len(transitions)))
+            file.write(patients.tobytes())
+            file.write(transitions.tobytes())
+        self.spilled.append((self.spilled_bytes, len(patients), len(transitions)))
+        self.spilled_bytes += CHUNK_HEADER.size + patients.nbytes + transitions.nbytes
+
+    def read_chunk(self, offset, n_patients, n_transitions):
+        offset += CHUNK_HEADER.size
+        patients = np.fromfile(self.path, dtype=PATIENT_DTYPE, count=n_patients, offset=offset)
+        transitions = np.fromfile(self.path, dtype=TRANSITION_DTYPE, count=n_transitions, offset=offset + patients.nbytes)
+        return patients, transitions
+
+    def chunks_iter(self):
+        """All (patients, transitions) chunks: written to the file, kept in memory, then the buffer's patients."""
+        for chunk in self.spilled:
+            yield self.read_chunk(*chunk)
+        yield from self.chunks
+        if self.size:
+            yield self.sorted_chunk(self.buffer[:self.size], self.arrivals)
+
+    def truncate(self):
+        """Cut the history file back to the chunks written by this object (e.g. after restoring a checkpoint)."""
+        if self.path:
+            with open(self.path, 'ab') as file:
+                file.truncate(self.spilled_bytes)
+
+    def detach(self):
+        """Read the chunks written to the file back into memory and stop writing to it (e.g. for a fork of a checkpoint)."""
+        self.chunks = [self.read_chunk(*chunk) for chunk in self.spilled] + self.chunks
+        self.path = None
+        self.spilled = []
+        self.spilled_bytes = 0
+
+    def __getstate__(self):
+        # Snapshots keep only the buffered transitions; the preallocated rest is restored empty
+        state = self.__dict__.copy()
+        state['buffer'] = self.buffer[:self.size]
+        state['capacity'] = len(self.buffer)
+        return state
+
+    def __setstate__(self, state):
+        capacity = state.pop('capacity')
+        self.__dict__.update(state)
+        buffer = self.buffer
+        self.buffer = np.zeros(capacity, dtype=TRANSITION_DTYPE)
+        self.buffer[:self.size] = buffer
+
+    # Read-only mapping {patient number: list of record dicts} -------------------------------
+
+    def records(self, patient, transitions):
+        """The record dicts of one patient (a PATIENT_DTYPE row and its transitions), as ERSimulation wrote them before."""
+        num, arrival, type_code = patient.item()
+        arrival_time = self.start_datetime + timedelta(minutes=arrival)
+        patient_type = PATIENT_TYPES[type_code]
+        records = []
+        for minute, status, physician, boarding, disease, departure in zip(*(transitions[name].tolist() for name in TRANSITION_DTYPE.names[1:])):
+            blood = 'Current' if records else 'Initial'
+            records.append({
+                'Patient_num': num,
+                'Arrival_time': arrival_time,
+                'Patient_type': patient_type,
+                f'{blood}_boarding_blood': boarding,
+                f'{blood}_disease_blood': disease,
+                f'{blood}_departure_blood': departure,
+                'Status': STATUS_NAMES[status],
+                'Assigned_physician': self.physicians[physician].name if physician >= 0 else None,
+                'Timestamp': self.start_datetime + timedelta(minutes=minute),
+            })
+        return records
+
+    def items(self):
+        for patients, transitions in self.chunks_iter():
+            bounds = np.searchsorted(transitions['patient'], patients['patient'], side='right')
+            for i in range(len(patients)):
+                yield int(patients['patient'][i]), self.records(patients[i], transitions[bounds[i - 1] if i else 0:bounds[i]])
+
+    def keys(self):
+        for patients, _ in self.chunks_iter():
+            yield from patients['patient'].tolist()
+
+    def values(self):
+        for _, records in self.items():
+            yield records
+
+    def __iter__(self):
+        return self.keys()
+
+    def __len__(self):
+        return self.patient_count
+
+    def __contains__(self, num):
+        return num in self.last or any(num in patients['patient'] for patients, _ in self.chunks_iter())
+
+    def __getitem__(self, num):
+        for patients, transitions in self.chunks_iter():
+            i = np.searchsorted(patients['patient'], num)
+            if i < len(patients) and patients['patient'][i] == num:
+                rows = transitions['patient'] == num
+                return self.records(patients[i], transitions[rows])
+        raise KeyError(num)
+
+    def get(self, num, default=None):
+        try:
+            return self[num]
+        except KeyError:
+            return default
+
+
+class AdmissionRecorder:
+    """
+    The ward admissions, one ADMISSION_DTYPE row each (patient, minute admitted, minutes waited).
+
+    Rows are appended to a preallocated buffer; when it is full they are moved out as one chunk,
+    as PatientHistory does: appended to the file `path` (a flat array of rows), or kept in memory
+    as typed arrays if no path is given. Iterating gives (patient, minute, wait) tuples.
+
+    Parameters:
+    - path: binary file the full buffers are appended to (None keeps them in memory)
+    - chunk_size: number of admissions buffered
+    """
+
+    def __init__(self, path=None, chunk_size=65536):
+        self.path = path
+        self.buffer = np.zeros(chunk_size, dtype=ADMISSION_DTYPE)
+        self.size = 0
+        self.chunks = []  # rows moved out, if there is no path
+        self.spilled = 0  # rows written to path
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            open(path, 'wb').close()
+
+    def record(self, patient, minute, wait):
+        if self.size == len(self.buffer):
+            self.flush()
+        self.buffer[self.size] = (patient, minute, wait)
+        self.size += 1
+
+    def flush(self):
+        """Move the buffered rows out, as one chunk."""
+        if not self.size:
+            return
+        rows = self.buffer[:self.size].copy()
+        if self.path:
+            with open(self.path, 'ab') as file:
+                file.write(rows.tobytes())
+            self.spilled += len(rows)
+        else:
+            self.chunks.append(rows)
+        self.size = 0
+
+    def chunks_iter(self):
+        """All rows in chunks: read back from the file, kept in memory, then the buffer."""
+        for start in range(0, self.spilled, len(self.buffer)):
+            yield np.fromfile(self.path, dtype=ADMISSION_DTYPE, count=min(len(self.buffer), self.spilled - start),
+                              offset=start * ADMISSION_DTYPE.itemsize)
+        yield from self.chunks
+        if self.size:
+            yield self.buffer[:self.size]
+
+    def to_array(self):
+        chunks = list(self.chunks_iter())
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=ADMISSION_DTYPE)
+
+    def truncate(self):
+        """Cut the file back to the rows written by this object (e.g. after restoring a checkpoint)."""
+        if self.path:
+            with open(self.path, 'ab') as file:
+                file.truncate(self.spilled * ADMISSION_DTYPE.itemsize)
+
+    def detach(self):
+        """Read the rows written to the file back into memory and stop writing to it (e.g. for a fork of a checkpoint)."""
+        if self.path:
+            self.chunks = [np.fromfile(self.path, dtype=ADMISSION_DTYPE, count=self.spilled)] + self.chunks
+        self.path = None
+        self.spilled = 0
+
+    def __getstate__(self):
+        # Snapshots keep only the buffered rows; the preallocated rest is restored empty
+        state = self.__dict__.copy()
+        state['buffer'] = self.buffer[:self.size]
+        state['capacity'] = len(self.buffer)
+        return state
+
+    def __setstate__(self, state):
+        capacity = state.pop('capacity')
+        self.__dict__.update(state)
+        buffer = self.buffer
+        self.buffer = np.zeros(capacity, dtype=ADMISSION_DTYPE)
+        self.buffer[:self.size] = buffer
+
+    def __len__(self):
+        return self.spilled + sum(map(len, self.chunks)) + self.size
+
+    def __iter__(self):
+        for rows in self.chunks_iter():
+            yield from rows.tolist()
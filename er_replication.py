@@ -0,0 +1,298 @@
+import contextlib, os, json
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from er_class import ERSimulation, Physician
+from er_engine import EventDrivenERSimulation
+from er_arrivals import TraceArrivals
+from er_state import COUNT_KEYS, TRIAGE, DISCHARGE, ADMISSION
+
+ENGINES = {
+    'stepped': ERSimulation,
+    'event': EventDrivenERSimulation,
+}
+
+# The configuration of the er_class.py __main__ block, as a scenario
+DEFAULT_SCENARIO = {
+    'simulation': {
+        'start_datetime': "2023-03-01 08:00:00",
+        'end_datetime': "2023-06-01 07:59:00",
+        'daily_patient_count': 250,
+        'med_to_trauma_ratio': 0.852,
+        'csv_file_path': "settings/ersimulation_default.csv",
+        'admission_csv_path': "settings/admission_default.csv",
+    },
+    'patient_defaults': "settings/patient_default.csv",
+    'physicians_dir': "settings/physicians",
+    'working_schedule': "playGround/working_schedule_filled.csv",
+    'shift_types': [
+        {'name': 'a', 'start_time': '08:00', 'end_time': '20:00', 'recieve_patient_type': ['med'], 'new_patient': True},
+        {'name': 'b', 'start_time': '08:00', 'end_time': '20:00', 'recieve_patient_type': ['med'], 'new_patient': True},
+        {'name': 'c', 'start_time': '08:00', 'end_time': '20:00', 'recieve_patient_type': ['med', 'trauma'], 'new_patient': True},
+        {'name': 'ea', 'start_time': '08:00', 'end_time': '20:00', 'recieve_patient_type': ['med', 'trauma'], 'new_patient': False},
+        {'name': 'eb', 'start_time': '08:00', 'end_time': '20:00', 'recieve_patient_type': ['med', 'trauma'], 'new_patient': False},
+        {'name': 'd', 'start_time': '14:00', 'end_time': '21:30', 'recieve_patient_type': ['med'], 'new_patient': True},
+        {'name': 'an', 'start_time': '20:00', 'end_time': '08:00', 'recieve_patient_type': ['med', 'trauma'], 'new_patient': True},
+        {'name': 'bn0', 'start_time': '20:00', 'end_time': '23:00', 'recieve_patient_type': ['med', 'trauma'], 'new_patient': True},
+        {'name': 'bn1', 'start_time': '23:00', 'end_time': '08:00', 'recieve_patient_type': ['med', 'trauma'], 'new_patient': False},
+        {'name': 'cn', 'start_time': '20:00', 'end_time': '08:00', 'recieve_patient_type': ['med', 'trauma'], 'new_patient': True},
+    ],
+    # shift name: [before_midnight_shifts, after_midnight_shifts, no_division]
+    'shift_rules': {
+        'a': [['an'], ['an'], ['an']],
+        'b': [['bn0'], ['bn0'], ['bn0']],
+        'c': [['cn'], ['cn'], ['cn']],
+        'ea': [['bn0'], ['bn0', 'bn0'], None],
+        'eb': [['bn0'], ['bn0'], ['bn0']],
+        'd': [['bn0'], ['bn0'], ['bn0']],
+        'an': [['ea', 'eb'], ['a'], None],
+        'bn0': [['bn1'], ['bn1'], ['bn1']],
+        'bn1': [['ea', 'eb'], ['b'], None],
+        'cn': [['ea', 'eb'], ['c'], None],
+    },
+    'engine': 'stepped',
+}
+
+
+def build_simulation(scenario, seed=None):
+    """
+    Create a ready-to-start simulation from a scenario definition.
+
+    Parameters:
+    - scenario: dict with the ERSimulation.__init__ arguments ('simulation'), the
+      'shift_types' and 'shift_rules', the 'physicians_dir' of physician CSVs (or a 'physicians'
+      list of names, or of {'name', 'csv'} dicts), the 'working_schedule' CSV, optionally
+      'patient_defaults', the 'engine' ('stepped' or 'event'), a 'crn_key' for common random
+      numbers (see compare_scenarios) and an 'arrival_trace' file to replay instead of synthetic
+      arrivals (with 'arrival_trace_start', see er_arrivals.TraceArrivals). See DEFAULT_SCENARIO.
+      Schedule entries of shifts the scenario does not define are left out.
+    - seed: seed of the simulation's SimulationRNG
+    """
+    arrival_source = None
+    if scenario.get('arrival_trace'):
+        arrival_source = TraceArrivals(scenario['arrival_trace'], scenario.get('arrival_trace_start'))
+    er = ENGINES[scenario.get('engine', 'stepped')](**scenario['simulation'], seed=seed, crn_key=scenario.get('crn_key'),
+                                                    arrival_source=arrival_source)
+    if scenario.get('patient_defaults'):
+        er.load_patient_defaults_from_csv(scenario['patient_defaults'])
+    if scenario.get('physicians'):
+        for entry in scenario['physicians']:
+            entry = {'name': entry} if isinstance(entry, str) else entry
+            physician = Physician(entry['name'], rng=er.rng)
+            if entry.get('csv'):
+                physician.set_abilities_from_csv(entry['csv'])
+            er.add_physician(physician)
+    else:
+        er.create_physicians_from_csvs(scenario['physicians_dir'])
+    for shift in scenario['shift_types']:
+        er.create_shift_type(**shift)
+    for shift in er.shift_types:
+        before_midnight, after_midnight, no_division = scenario['shift_rules'][shift.name]
+        shift.set_shift_rule(before_midnight, after_midnight, no_division)
+
+    er.create_working_schedule()
+    er.load_working_schedule_from_csv(csv_file_path=scenario['working_schedule'])
+    shift_names = {shift.name for shift in er.shift_types}
+    for daily_schedule in er.working_schedule.values():
+        for shift_name in [name for name in daily_schedule if name not in shift_names]:
+            del daily_schedule[shift_name]
+    return er
+
+
+def read_definition(path):
+    """Read a JSON file, or a YAML file (.yaml/.yml, needs PyYAML)."""
+    with open(path, mode='r') as file:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            return yaml.safe_load(file)
+        return json.load(file)
+
+
+def load_scenario(path):
+    """
+    Read a scenario file (JSON or YAML) with the structure of DEFAULT_SCENARIO.
+    Keys missing from the file are taken from DEFAULT_SCENARIO ('simulation' key by key).
+    """
+    scenario = dict(DEFAULT_SCENARIO, **read_definition(path))
+    scenario['simulation'] = dict(DEFAULT_SCENARIO['simulation'], **scenario['simulation'])
+    return scenario
+
+
+def save_scenario(scenario, path):
+    """Write a scenario as a JSON file (see load_scenario)."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, mode='w') as file:
+        json.dump(scenario, file, indent=2)
+        file.write("\n")
+
+
+def replication_metrics(er):
+    """Summary metrics of one finished simulation run."""
+    metrics = {
+        'arrivals': len(er.patient_records),
+        'discharges': 0,
+        'admissions': 0,
+    }
+    waits, stays = [], []
+    for patients, transitions in er.patient_records.chunks_iter():
+        nums = transitions['patient']
+        first = np.searchsorted(nums, patients['patient'])
+        last = np.searchsorted(nums, patients['patient'], side='right') - 1
+        # Wait: from arrival to the first record out of triage
+        seen = np.flatnonzero(transitions['status'] != TRIAGE)
+        first_seen = np.searchsorted(seen, first)
+        has_seen = first_seen < len(seen)
+        has_seen[has_seen] = seen[first_seen[has_seen]] <= last[has_seen]
+        waits.extend((transitions['minute'][seen[first_seen[has_seen]]] - patients['arrival'][has_seen]).tolist())
+        last_status = transitions['status'][last]
+        discharged = last_status == DISCHARGE
+        metrics['discharges'] += int(discharged.sum())
+        metrics['admissions'] += int((last_status == ADMISSION).sum())
+        stays.extend((transitions['minute'][last[discharged]] - patients['arrival'][discharged]).tolist())
+    metrics['mean_wait_minutes'] = float(np.mean(waits)) if waits else float('nan')
+    metrics['mean_stay_minutes'] = float(np.mean(stays)) if stays else float('nan')
+
+    for key in COUNT_KEYS:
+        counts = er.total_er_records.column(key)
+        metrics[f'mean_{key}'] = float(counts.mean()) if len(counts) else float('nan')
+        metrics[f'peak_{key}'] = int(counts.max()) if len(counts) else 0
+
+    # Admission queue: patients waiting for a ward bed, and how long the admitted ones waited
+    queue = er.total_er_records.column('wait-admission')
+    metrics['p90_admission_queue'] = float(np.percentile(queue, 90)) if len(queue) else float('nan')
+    admission_waits = er.admission_records.to_array()['wait']
+    metrics['mean_admission_wait_minutes'] = float(np.mean(admission_waits)) if len(admission_waits) else float('nan')
+    metrics['p90_admission_wait_minutes'] = float(np.percentile(admission_waits, 90)) if len(admission_waits) else float('nan')
+    return metrics
+
+
+def run_replication(scenario, seed, export_dir=None, replication=None):
+    """
+    Build, seed and run one replication; return its metrics.
+
+    Parameters:
+    - scenario: scenario definition, see build_simulation
+    - seed: seed of the simulation's random streams
+    - export_dir: if given, the results are exported (Parquet) there, partitioned by the
+      scenario's 'name' and the replication number
+    - replication: replication number used as partition value
+    """
+    er = build_simulation(scenario, seed)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        er.start()
+    metrics = replication_metrics(er)
+    metrics['seed'] = seed
+    if export_dir:
+        from er_export import export_results
+        export_results(er, export_dir, scenario=scenario.get('name', 'default'), replication=replication)
+    return metrics
+
+
+def replication_seeds(n_replications, base_seed=0):
+    """Independent 32-bit seeds for n replications, derived from one base seed."""
+    return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(base_seed).spawn(n_replications)]
+
+
+def run_replications(scenario, n_replications, base_seed=0, max_workers=None, export_dir=None):
+    """
+    Run independent seeded replications of a scenario across a process pool.
+
+    Parameters:
+    - scenario: scenario definition, see build_simulation
+    - n_replications: number of replications
+    - base_seed: seed from which the replication seeds are derived
+    - max_workers: number of worker processes (default: number of CPUs)
+    - export_dir: if given, every replication exports its results there, see run_replication
+
+    Returns:
+    - list of per-replication metric dicts, in replication order
+    """
+    seeds = replication_seeds(n_replications, base_seed)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(run_replication, [scenario] * n_replications, seeds,
+                                 [export_dir] * n_replications, range(n_replications)))
+
+
+def summarize_replications(results, z=1.96):
+    """Mean, standard deviation and normal-approximation confidence half-width of every metric."""
+    summary = {}
+    for key in results[0]:
+        if key == 'seed':
+            continue
+        values = np.array([result[key] for result in results], dtype=float)
+        std = float(values.std(ddof=1)) if len(values) > 1 else 0.0
+        summary[key] = {
+            'mean': float(values.mean()),
+            'std': std,
+            'ci_half_width': float(z * std / np.sqrt(len(values))),
+        }
+    return summary
+
+
+def compare_scenarios(scenario_a, scenario_b, n_replications, base_seed=0, crn=True, max_workers=None, z=1.96):
+    """
+    Paired comparison of two scenarios over n replications.
+
+    With crn (common random numbers), replication i of both scenarios uses the same seed, so both
+    see the same arrivals, patients and ward-bed releases; only the physician behaviour streams
+    differ (each scenario gets its own crn_key, see SimulationRNG). Without crn, the scenarios use
+    independent seeds. The variance of the paired differences is compared with that of independent
+    sampling (var_a + var_b) to show what the pairing saves.
+
+    Parameters:
+    - scenario_a, scenario_b: scenario definitions, see build_simulation
+    - n_replications: number of replications of each scenario
+    - base_seed: seed from which the replication seeds are derived
+    - crn: use common random numbers
+    - max_workers: number of worker processes (default: number of CPUs)
+    - z: quantile of the confidence interval
+
+    Returns:
+    - {metric: {'mean_a', 'mean_b', 'mean_diff', 'std_diff', 'ci_half_width', 'variance_ratio'}},
+      the differences being b - a and variance_ratio (var_a + var_b) / var_diff
+    """
+    seeds = replication_seeds(2 * n_replications, base_seed)
+    seeds_a = seeds[:n_replications]
+    seeds_b = seeds_a if crn else seeds[n_replications:]
+    if crn:
+        scenario_a = dict(scenario_a, crn_key=scenario_a.get('crn_key') or scenario_a.get('name') or 'a')
+        scenario_b = dict(scenario_b, crn_key=scenario_b.get('crn_key') or scenario_b.get('name') or 'b')
+        if scenario_a['crn_key'] == scenario_b['crn_key']:
+            scenario_b['crn_key'] += '_b'
+
+    scenarios = [scenario_a] * n_replications + [scenario_b] * n_replications
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(run_replication, scenarios, seeds_a + seeds_b))
+    results_a, results_b = results[:n_replications], results[n_replications:]
+
+    comparison = {}
+    for key in results_a[0]:
+        if key == 'seed':
+            continue
+        values_a = np.array([result[key] for result in results_a], dtype=float)
+        values_b = np.array([result[key] for result in results_b], dtype=float)
+        differences = values_b - values_a
+        ddof = 1 if n_replications > 1 else 0
+        std_diff = float(differences.std(ddof=ddof))
+        independent = float(values_a.var(ddof=ddof) + values_b.var(ddof=ddof))
+        comparison[key] = {
+            'mean_a': float(values_a.mean()),
+            'mean_b': float(values_b.mean()),
+            'mean_diff': float(differences.mean()),
+            'std_diff': std_diff,
+            'ci_half_width': float(z * std_diff / np.sqrt(n_replications)),
+            'variance_ratio': independent / std_diff ** 2 if std_diff > 0 else float('inf'),
+        }
+    return comparison
+
+
+if __name__ == '__main__':
+    from er_settings import ensure_default_settings
+    ensure_default_settings()
+    scenario = dict(DEFAULT_SCENARIO, engine='event')
+    scenario['simulation'] = dict(scenario['simulation'], end_datetime="2023-03-08 07:59:00")
+    results = run_replications(scenario, 8)
+    for key, stats in summarize_replications(results).items():
+        print(f"{key}: {stats['mean']:.2f} ± {stats['ci_half_width']:.2f}")
@@ -0,0 +1,120 @@
+import hashlib
+from bisect import bisect_right
+from itertools import accumulate
+import numpy as np
+
+# One independent substream per random process of the simulation, so that changing how often
+# one process draws (e.g. more physicians choosing patients) leaves the others untouched
+STREAMS = [
+    'arrivals',     # per-minute arrival counts
+    'patients',     # patient type and initial blood values
+    'assignment',   # shift of a new patient, handoff shift
+    'physicians',   # a physician's choice of status and patient
+    'abilities',    # default mojo of new physicians
+    'admissions',   # per-minute number of released ward beds
+    'ward',         # which waiting patients get the beds
+    'census',       # warm start: the census drawn from a pool and the seeded patients, see er_warmstart
+]
+# Streams that do not depend on how the ER is staffed; with common random numbers (see
+# SimulationRNG) scenarios replay them identically and only the other, behaviour streams differ
+COMMON_STREAMS = ['arrivals', 'patients', 'abilities', 'admissions', 'census']
+
+
+class RandomStream:
+    """
+    Scalar draws from a numpy Generator, taken from blocks drawn ahead of time.
+
+    random() and gauss() hand out values of a block of block_size uniforms or standard normals,
+    drawn with one Generator call when the previous block is used up, so the minute loop does
+    not pay a Generator call per value. Vectorized draws use `generator` directly.
+
+    Parameters:
+    - generator: the numpy Generator of this stream
+    - block_size: number of values drawn per block
+    """
+
+    def __init__(self, generator, block_size=4096):
+        self.generator = generator
+        self.block_size = block_size
+        self._uniforms = []
+        self._next_uniform = 0
+        self._normals = []
+        self._next_normal = 0
+
+    def random(self):
+        """Uniform in [0, 1)."""
+        if self._next_uniform == len(self._uniforms):
+            self._uniforms = self.generator.random(self.block_size).tolist()
+            self._next_uniform = 0
+        value = self._uniforms[self._next_uniform]
+        self._next_uniform += 1
+        return value
+
+    def gauss(self, mu=0.0, sigma=1.0):
+        """Normal with mean mu and standard deviation sigma."""
+        if self._next_normal == len(self._normals):
+            self._normals = self.generator.standard_normal(self.block_size).tolist()
+            self._next_normal = 0
+        value = self._normals[self._next_normal]
+        self._next_normal += 1
+        return mu + value * sigma
+
+    def choice(self, population):
+        """One element of a non-empty sequence."""
+        return population[int(self.random() * len(population))]
+
+    def choices(self, population, weights):
+        """One element of `population`, drawn with the given weights."""
+        cumulative = list(accumulate(weights))
+        return population[bisect_right(cumulative, self.random() * cumulative[-1], 0, len(cumulative) - 1)]
+
+    def sample(self, population, k):
+        """k distinct elements of `population`, in random order."""
+        return [population[i] for i in self.generator.choice(len(population), k, replace=False)]
+
+
+class SimulationRNG:
+    """
+    The random numbers of one simulation: a SeedSequence spawns one Generator per entry of
+    STREAMS, each wrapped in a RandomStream available as an attribute (rng.arrivals, ...).
+    The same seed gives the same draws, independent of the global random and np.random state.
+
+    Common random numbers: simulations of different scenarios given the same seed and each its
+    own behaviour_key get the same COMMON_STREAMS (arrivals, patient values, ward-bed releases)
+    but independent behaviour streams (physician choices, assignment, ward selection).
+
+    Parameters:
+    - seed: int, SeedSequence or None (fresh entropy)
+    - block_size: number of scalar values drawn ahead per stream
+    - behaviour_key: string naming the scenario, or None to derive all streams from the seed alone
+    """
+
+    def __init__(self, seed=None, block_size=4096, behaviour_key=None):
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.block_size = block_size
+        self.behaviour_key = behaviour_key
+        children = dict(zip(STREAMS, self.seed_sequence.spawn(len(STREAMS))))
+        if behaviour_key is not None:
+            entropy = self.seed_sequence.entropy
+            entropy = list(entropy) if isinstance(entropy, (list, tuple)) else [entropy]
+            key = int.from_bytes(hashlib.sha256(str(behaviour_key).encode()).digest()[:16], 'little')
+            behaviour_streams = [name for name in STREAMS if name not in COMMON_STREAMS]
+            children.update(zip(behaviour_streams, np.random.SeedSequence(entropy + [key]).spawn(len(behaviour_streams))))
+        for name, child in children.items():
+            setattr(self, name, RandomStream(np.random.Generator(np.random.PCG64(child)), block_size))
+
+    @property
+    def seed(self):
+        """The entropy the streams were derived from (the seed, if one was given)."""
+        return self.seed_sequence.entropy
+
+
+_default_rng = None
+
+
+def default_rng():
+    """Unseeded SimulationRNG for patients and physicians created outside a simulation."""
+    global _default_rng
+    if _default_rng is None:
+        _default_rng = SimulationRNG()
+    return _default_rng
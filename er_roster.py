@@ -0,0 +1,189 @@
+from datetime import timedelta
+import numpy as np
+
+from er_state import PATIENT_TYPES
+
+
+class RosterTimeline:
+    """
+    The working schedule compiled against the simulation clock.
+
+    Minute m is start_datetime + m minutes. For every minute of the horizon the compiled roster
+    holds the physician (index in ERSimulation.physicians, -1 if none) scheduled for each shift,
+    following the same lookup-date rule as ERSimulation.get_shift_physician, and an index into
+    the distinct on-duty physician lists, so the per-minute roster questions of the simulation
+    are array lookups. Which shifts run, start, end or take new patients only depends on the
+    minute of the day and is tabulated once for the 1440 minutes of a day.
+
+    Parameters:
+    - shift_types: the simulation's ShiftTypes (their position is the shift index)
+    - physicians: the simulation's Physicians (their position is the physician index)
+    - working_schedule: {date: {shift name: physician name}}
+    - start_datetime, end_datetime: the simulated horizon
+    """
+
+    def __init__(self, shift_types, physicians, working_schedule, start_datetime, end_datetime):
+        self.shift_types = list(shift_types)
+        self.physicians = list(physicians)
+        self.working_schedule = working_schedule
+        self.start_datetime = start_datetime
+        self.start_date = start_datetime.date()
+        self.n_minutes = int((end_datetime - start_datetime).total_seconds() // 60)
+        self.start_minute_of_day = start_datetime.hour * 60 + start_datetime.minute
+        self.problems = []
+
+        self._compile_day_tables()
+        self._compile_timeline()
+        self._compile_minute_roster()
+
+    # Time-of-day tables ----------------------------------------------------------------------
+
+    def _compile_day_tables(self):
+        n_shifts = len(self.shift_types)
+        self.shift_start_minute = np.array([shift.start_time.hour * 60 + shift.start_time.minute for shift in self.shift_types], dtype=np.int32)
+        self.shift_end_minute = np.array([shift.end_time.hour * 60 + shift.end_time.minute for shift in self.shift_types], dtype=np.int32)
+        self.shift_end_offset = np.array([shift.end_day_offset for shift in self.shift_types], dtype=np.int32)
+
+        # within[mod, s]: same (inclusive) bounds as ShiftType.is_time_within_shift
+        minute_of_day = np.arange(1440)[:, None]
+        same_day = (self.shift_start_minute <= minute_of_day) & (minute_of_day <= self.shift_end_minute)
+        overnight = (minute_of_day >= self.shift_start_minute) | (minute_of_day <= self.shift_end_minute)
+        self.within = np.where(self.shift_end_offset == 1, overnight, same_day)
+
+        new_patient = np.array([shift.new_patient for shift in self.shift_types], dtype=bool)
+        self.new_patient_shifts = []    # new-patient shifts running at each minute of the day
+        self.starting_new_shifts = []   # new-patient shifts starting at each minute of the day
+        self.arrival_shifts = []        # {patient type: new-patient shifts taking it} at each minute of the day
+        self.ending_shifts = []         # shifts ending at each minute of the day
+        for mod in range(1440):
+            running = [shift for s, shift in enumerate(self.shift_types) if self.within[mod, s] and new_patient[s]]
+            self.new_patient_shifts.append(running)
+            self.starting_new_shifts.append([shift for shift in running if self.shift_start_minute[shift.index] == mod])
+            self.arrival_shifts.append({patient_type: [shift for shift in running if patient_type in shift.recieve_patient_type]
+                                        for patient_type in PATIENT_TYPES})
+            self.ending_shifts.append([shift for s, shift in enumerate(self.shift_types) if self.shift_end_minute[s] == mod])
+        self.shift_start_mask = np.array([bool(shifts) for shifts in self.starting_new_shifts])
+        self.shift_end_mask = np.array([bool(shifts) for shifts in self.ending_shifts])
+        self.n_shifts = n_shifts
+
+    def minute_of_day(self, minute):
+        return (self.start_minute_of_day + minute) % 1440
+
+    # Timeline of shift instances -------------------------------------------------------------
+
+    def _compile_timeline(self):
+        physician_ids = {physician.name: i for i, physician in enumerate(self.physicians)}
+        shift_ids = {shift.name: s for s, shift in enumerate(self.shift_types)}
+        self.timeline = []  # (start minute, end minute, ShiftType, Physician or None), sorted
+        self.day_roster = {}  # (day offset from start date, shift index) -> physician index
+
+        for date, daily_schedule in self.working_schedule.items():
+            day = (date - self.start_date).days
+            for shift_name, physician_name in daily_schedule.items():
+                s = shift_ids.get(shift_name)
+                if s is None:
+                    self.problems.append(f"Unknown shift '{shift_name}' on {date}.")
+                    continue
+                if physician_name in physician_ids:
+                    self.day_roster[(day, s)] = physician_ids[physician_name]
+                start = day * 1440 + int(self.shift_start_minute[s]) - self.start_minute_of_day
+                end = (day + int(self.shift_end_offset[s])) * 1440 + int(self.shift_end_minute[s]) - self.start_minute_of_day
+                if end < 1 or start > self.n_minutes:
+                    continue  # outside the simulated horizon
+                if not physician_name:
+                    self.problems.append(f"No physician assigned to {shift_name} on {date}.")
+                    self.timeline.append((start, end, self.shift_types[s], None))
+                    continue
+                if physician_name not in physician_ids:
+                    self.problems.append(f"Unknown physician '{physician_name}' assigned to {shift_name} on {date}.")
+                    self.timeline.append((start, end, self.shift_types[s], None))
+                    continue
+                self.timeline.append((start, end, self.shift_types[s], self.physicians[physician_ids[physician_name]]))
+        self.timeline.sort(key=lambda interval: (interval[0], interval[2].index))
+
+        # The same physician on two shifts at once (sharing only the boundary minute is allowed, e.g. bn0 -> bn1)
+        by_physician = {}
+        for start, end, shift, physician in self.timeline:
+            if physician is not None:
+                by_physician.setdefault(physician.name, []).append((start, end, shift))
+        for name, intervals in by_physician.items():
+            latest_end, latest_shift = None, None
+            for start, end, shift in intervals:
+                if latest_end is not None and start < latest_end:
+                    self.problems.append(f"{name} is double-booked on {latest_shift.name} and {shift.name} at {self.to_datetime(start)}.")
+                if latest_end is None or end > latest_end:
+                    latest_end, latest_shift = end, shift
+
+    def to_datetime(self, minute):
+        return self.start_datetime + timedelta(minutes=int(minute))
+
+    # Minute-indexed roster -------------------------------------------------------------------
+
+    def _compile_minute_roster(self):
+        minutes = np.arange(self.n_minutes + 1)
+        absolute = self.start_minute_of_day + minutes
+        day = absolute // 1440
+        mod = absolute % 1440
+
+        # Date of the schedule row each shift is looked up under (overnight shifts: the day they started)
+        first_day = -1
+        last_day = int(day[-1]) + 1
+        day_table = np.full((last_day - first_day + 1, self.n_shifts), -1, dtype=np.int16)
+        for (d, s), physician_id in self.day_roster.items():
+            if first_day <= d <= last_day:
+                day_table[d - first_day, s] = physician_id
+        lookup_day = day[:, None] - ((self.shift_end_offset == 1) & (mod[:, None] < self.shift_start_minute))
+        self.physician_ids = day_table[lookup_day - first_day, np.arange(self.n_shifts)]
+
+        # Distinct on-duty lists, and which one applies at each minute
+        on_duty = np.where(self.within[mod], self.physician_ids, -1)
+        rosters, self.on_duty_ids = np.unique(on_duty, axis=0, return_inverse=True)
+        self.on_duty_ids = self.on_duty_ids.reshape(-1)
+        self.on_duty_lists = [[self.physicians[i] for i in sorted(set(row.tolist()) - {-1})] for row in rosters]
+
+        # Gaps: a running shift with nobody scheduled, or a patient type no new-patient shift can take
+        gaps = self.within[mod] & (self.physician_ids < 0)
+        gaps[0] = False  # minute 0 is the starting state, never simulated
+        for s, shift in enumerate(self.shift_types):
+            for start, end in self._runs(gaps[:, s]):
+                self.problems.append(f"Shift {shift.name} has no physician from {self.to_datetime(start)} to {self.to_datetime(end)}.")
+        for patient_type in PATIENT_TYPES:
+            takes_type = np.array([shift.new_patient and patient_type in shift.recieve_patient_type for shift in self.shift_types], dtype=bool)
+            covered = (on_duty >= 0)[:, takes_type].any(axis=1)
+            covered[0] = True
+            for start, end in self._runs(~covered):
+                self.problems.append(f"No physician takes new {patient_type} patients from {self.to_datetime(start)} to {self.to_datetime(end)}.")
+
+    @staticmethod
+    def _runs(mask):
+        """(first, last) minute of each run of True in a boolean array."""
+        edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+        return list(zip(np.nonzero(edges == 1)[0], np.nonzero(edges == -1)[0] - 1))
+
+    # Lookups ---------------------------------------------------------------------------------
+
+    def covers(self, minute):
+        return 0 <= minute <= self.n_minutes
+
+    def on_duty(self, minute):
+        """Physicians on duty at `minute`, in the order of ERSimulation.physicians."""
+        return self.on_duty_lists[self.on_duty_ids[minute]]
+
+    def on_duty_count(self, first, last):
+        """Total number of on-duty physicians over the minutes first..last."""
+        sizes = np.array([len(physicians) for physicians in self.on_duty_lists])
+        return int(sizes[self.on_duty_ids[max(first, 0):last + 1]].sum())
+
+    def shift_physician(self, minute, shift):
+        """Physician scheduled for `shift` at `minute` (same lookup-date rule as get_shift_physician)."""
+        physician_id = self.physician_ids[minute, shift.index]
+        return self.physicians[physician_id] if physician_id >= 0 else None
+
+    def minutes_where(self, day_mask, first, last):
+        """Minutes first..last whose minute of the day is set in the 1440-long `day_mask`."""
+        minutes = np.arange(first, last + 1)
+        return minutes[day_mask[self.minute_of_day(minutes)]].tolist()
+
+    def roster_change_minutes(self):
+        """Minutes (after 0) at which the on-duty physicians differ from the minute before."""
+        return (np.nonzero(np.diff(self.on_duty_ids))[0] + 1).tolist()
@@ -0,0 +1,171 @@
+import csv, os
+from datetime import date, datetime, timedelta
+import numpy as np
+
+# Shifts worked by the physician of another shift of the same date, right after it
+LINKED_SHIFTS = {'bn1': 'bn0'}
+
+
+def parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        return datetime.strptime(value, "%Y/%m/%d").date()
+
+
+def horizon_dates(start_datetime, end_datetime):
+    """The dates from the start to the end of a simulated horizon (datetimes or "%Y-%m-%d %H:%M:%S" strings)."""
+    first, last = [parse_date(datetime.strptime(value, "%Y-%m-%d %H:%M:%S") if isinstance(value, str) else value)
+                   for value in (start_datetime, end_datetime)]
+    return [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+
+
+def shift_definitions(shift_types):
+    """(name, start minute of day, duration in minutes) of ShiftTypes or of scenario shift dicts."""
+    definitions = []
+    for shift in shift_types:
+        if isinstance(shift, dict):
+            name = shift['name']
+            start, end = [datetime.strptime(shift[key], "%H:%M").time() for key in ('start_time', 'end_time')]
+        else:
+            name, start, end = shift.name, shift.start_time, shift.end_time
+        start_minute, end_minute = start.hour * 60 + start.minute, end.hour * 60 + end.minute
+        definitions.append((name, start_minute, (end_minute - start_minute) % 1440 or 1440))
+    return definitions
+
+
+class RosterGenerator:
+    """
+    Random working schedules that satisfy the hard rostering constraints, for optimization studies.
+
+    Every (date, shift) is turned into a block of integer minutes from midnight of the first date;
+    a linked shift (bn1 after bn0) joins the block of its leader, so both get the same physician.
+    Blocks are filled in order of their start: a physician can take a block if the block's date is
+    set in their availability bitmap and their previous block ended at least min_rest_hours before
+    (which also rules out double-booking). Among those, the physician with the fewest worked
+    minutes is chosen, with a random tolerance of `balance` minutes, so rosters vary but stay fair.
+    If no physician can take a block, a ValueError names it; there is no retry loop.
+
+    Parameters:
+    - shift_types: ShiftTypes, or scenario shift definitions ({'name', 'start_time', 'end_time'})
+    - physicians: physician names
+    - dates: dates to schedule (date objects or "%Y-%m-%d" strings), e.g. from horizon_dates
+    - min_rest_hours: minimum time off between two blocks of a physician
+    - linked_shifts: {follower shift: leader shift}, see LINKED_SHIFTS
+    - days_off: {physician name: dates on which the physician starts no shift}
+    - balance: workload difference, in minutes, treated as equal when choosing a physician
+    """
+
+    def __init__(self, shift_types, physicians, dates, min_rest_hours=8, linked_shifts=LINKED_SHIFTS, days_off=None, balance=720):
+        self.physicians = [getattr(physician, 'name', physician) for physician in physicians]
+        self.dates = sorted(parse_date(day) for day in dates)
+        self.min_rest = int(min_rest_hours * 60)
+        self.balance = balance
+        definitions = shift_definitions(shift_types)
+        self.shift_names = [name for name, _, _ in definitions]
+        linked_shifts = {follower: leader for follower, leader in (linked_shifts or {}).items()
+                         if follower in self.shift_names and leader in self.shift_names}
+
+        # Blocks: leader shifts of every date, with the shifts linked to them
+        shifts = {name: (start, duration) for name, start, duration in definitions}
+        blocks = []
+        for day_index in range(len(self.dates)):
+            day_minute = (self.dates[day_index] - self.dates[0]).days * 1440
+            for name, start, duration in definitions:
+                if name in linked_shifts:
+                    continue
+                names = [name] + [follower for follower, leader in linked_shifts.items() if leader == name]
+                end = max(day_minute + shifts[shift][0] + shifts[shift][1] for shift in names)
+                blocks.append((day_minute + start, end, day_index, names))
+        blocks.sort(key=lambda block: block[0])
+        self.block_start = np.array([block[0] for block in blocks], dtype=np.int64)
+        self.block_end = np.array([block[1] for block in blocks], dtype=np.int64)
+        self.block_day = np.array([block[2] for block in blocks], dtype=np.int64)
+        self.block_shifts = [block[3] for block in blocks]
+
+        # available[p, d]: physician p may start a block on date d
+        self.available = np.ones((len(self.physicians), len(self.dates)), dtype=bool)
+        day_index = {day: index for index, day in enumerate(self.dates)}
+        physician_index = {name: index for index, name in enumerate(self.physicians)}
+        for name, off_dates in (days_off or {}).items():
+            for day in off_dates:
+                if name in physician_index and parse_date(day) in day_index:
+                    self.available[physician_index[name], day_index[parse_date(day)]] = False
+
+    @classmethod
+    def from_simulation(cls, er, **kwargs):
+        """Generator for the shift types, physicians and horizon of a simulation."""
+        return cls(er.shift_types, er.physicians, horizon_dates(er.start_datetime, er.end_datetime), **kwargs)
+
+    def generate_assignment(self, rng=None):
+        """
+        One random feasible roster, as the physician index of every block.
+
+        Parameters:
+        - rng: numpy Generator or seed
+        """
+        rng = rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng)
+        n_blocks, n_physicians = len(self.block_start), len(self.physicians)
+        tolerance = rng.random((n_blocks, n_physicians)) * self.balance
+        free_from = np.full(n_physicians, np.iinfo(np.int64).min // 2, dtype=np.int64)
+        load = np.zeros(n_physicians)
+        assignment = np.empty(n_blocks, dtype=np.int64)
+        for block in range(n_blocks):
+            start = self.block_start[block]
+            eligible = self.available[:, self.block_day[block]] & (free_from <= start)
+            physician = int(np.argmin(np.where(eligible, load + tolerance[block], np.inf)))
+            if not eligible[physician]:
+                raise ValueError(f"No physician can work {'/'.join(self.block_shifts[block])} on "
+                                 f"{self.dates[self.block_day[block]]}: all are off or resting.")
+            assignment[block] = physician
+            free_from[physician] = self.block_end[block] + self.min_rest
+            load[physician] += self.block_end[block] - start
+        return assignment
+
+    def violations(self, assignment):
+        """
+        Hard-constraint violations of a roster (as from generate_assignment):
+        blocks on a day off, and pairs of consecutive blocks of a physician with too little rest.
+        """
+        assignment = np.asarray(assignment)
+        off = ~self.available[assignment, self.block_day]
+        order = np.lexsort((self.block_start, assignment))
+        same = assignment[order][1:] == assignment[order][:-1]
+        short_rest = self.block_start[order][1:] < self.block_end[order][:-1] + self.min_rest
+        return int(off.sum() + (same & short_rest).sum())
+
+    def workload(self, assignment):
+        """Worked minutes of every physician in a roster."""
+        return np.bincount(np.asarray(assignment), weights=self.block_end - self.block_start, minlength=len(self.physicians))
+
+    def to_schedule(self, assignment):
+        """A roster as a working schedule {date: {shift name: physician name}}."""
+        schedule = {day: {} for day in self.dates}
+        for block, physician in enumerate(np.asarray(assignment).tolist()):
+            daily_schedule = schedule[self.dates[self.block_day[block]]]
+            for shift_name in self.block_shifts[block]:
+                daily_schedule[shift_name] = self.physicians[physician]
+        return {day: {name: daily_schedule[name] for name in self.shift_names if name in daily_schedule}
+                for day, daily_schedule in schedule.items()}
+
+    def generate(self, seed=None):
+        """One random feasible working schedule, see generate_assignment and to_schedule."""
+        return self.to_schedule(self.generate_assignment(seed))
+
+
+def write_working_schedule(schedule, csv_file_path, shift_names=None):
+    """Write a working schedule as a CSV readable by ERSimulation.load_working_schedule_from_csv."""
+    if shift_names is None:
+        shift_names = list(dict.fromkeys(name for daily_schedule in schedule.values() for name in daily_schedule))
+    directory = os.path.dirname(csv_file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(csv_file_path, mode='w', newline='') as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(['Date'] + shift_names)
+        for day in sorted(schedule):
+            writer.writerow([day.strftime("%Y-%m-%d")] + [schedule[day].get(name) or '' for name in shift_names])
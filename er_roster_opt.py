@@ -0,0 +1,268 @@
+import contextlib, hashlib, json, math, os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from er_replication import build_simulation, read_definition
+from er_roster_gen import RosterGenerator, write_working_schedule
+from er_sweep import cache_key
+
+# Weights of the roster score (lower is better); workload_std_hours measures fairness
+DEFAULT_WEIGHTS = {'peak_on-board': 1.0, 'mean_on-board': 1.0, 'handoffs': 0.01, 'workload_std_hours': 0.5}
+
+
+def roster_metrics(er):
+    """ED flow metrics of a finished run that a roster influences."""
+    on_board = er.total_er_records.column('on-board')
+    handoffs = sum(row['Handoff Patients Given'] for row in er.generate_summary() if row['Type'] == 'total')
+    return {
+        'peak_on-board': int(on_board.max()) if len(on_board) else 0,
+        'mean_on-board': float(on_board.mean()) if len(on_board) else 0.0,
+        'handoffs': int(handoffs),
+    }
+
+
+def simulate_roster(scenario, schedule, seed):
+    """Run the scenario with a working schedule (see ERSimulation.set_working_schedule); return roster_metrics."""
+    er = build_simulation(scenario, seed)
+    er.set_working_schedule(schedule)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        er.start()
+    return roster_metrics(er)
+
+
+def roster_key(schedule, context=''):
+    """Hash of a working schedule (and of what its evaluation depends on, `context`)."""
+    content = json.dumps({str(day): daily_schedule for day, daily_schedule in schedule.items()}, sort_keys=True)
+    return hashlib.sha256((context + content).encode()).hexdigest()
+
+
+def roster_features(generator, assignment, mojo):
+    """
+    Cheap descriptors of a roster for the surrogate: per shift, the mean mojo of the physicians
+    working it, and the workload spread (std of worked hours).
+
+    Parameters:
+    - generator: the RosterGenerator of the roster
+    - assignment: physician index of every block
+    - mojo: mean mojo of every physician, in generator.physicians order
+    """
+    assignment = np.asarray(assignment)
+    shift_of_block = np.array([generator.shift_names.index(shifts[0]) for shifts in generator.block_shifts])
+    block_mojo = mojo[assignment]
+    sums = np.bincount(shift_of_block, weights=block_mojo, minlength=len(generator.shift_names))
+    counts = np.bincount(shift_of_block, minlength=len(generator.shift_names))
+    per_shift = np.divide(sums, counts, out=np.zeros(len(sums)), where=counts > 0)
+    return np.append(per_shift, generator.workload(assignment).std() / 60)
+
+
+class RidgeSurrogate:
+    """
+    Ridge regression of the roster score on roster_features, refitted after every batch of
+    simulations; used to screen candidate rosters before simulating the promising ones.
+    """
+
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.coefficients = None
+
+    def fit(self, features, scores):
+        features, scores = np.asarray(features, dtype=float), np.asarray(scores, dtype=float)
+        self.mean, self.scale = features.mean(axis=0), features.std(axis=0) + 1e-9
+        X = np.column_stack([np.ones(len(features)), (features - self.mean) / self.scale])
+        penalty = self.alpha * np.eye(X.shape[1])
+        penalty[0, 0] = 0  # the intercept is not shrunk
+        self.coefficients = np.linalg.solve(X.T @ X + penalty, X.T @ scores)
+
+    def predict(self, features):
+        features = np.asarray(features, dtype=float)
+        X = np.column_stack([np.ones(len(features)), (features - self.mean) / self.scale])
+        return X @ self.coefficients
+
+
+class RosterMemo:
+    """
+    Evaluated rosters by roster_key, optionally kept in a JSON-lines file that every evaluation is
+    appended to, so an interrupted optimization resumes without simulating any roster twice.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        if path and os.path.isfile(path):
+            with open(path, mode='r') as file:
+                for line in file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry['key']] = entry
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def add(self, key, score, metrics, features):
+        entry = {'key': key, 'score': score, 'metrics': metrics, 'features': list(map(float, features))}
+        self.entries[key] = entry
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, mode='a') as file:
+                file.write(json.dumps(entry) + "\n")
+        return entry
+
+
+def neighbour(generator, assignment, rng, max_spread_hours=None, attempts=100):
+    """
+    A feasible roster one move away: two blocks swap their physicians, or one block gets another
+    physician. Moves breaking the hard constraints (or the workload spread limit) are drawn again.
+
+    Returns:
+    - the new assignment, or None if no feasible move was found
+    """
+    n_blocks, n_physicians = len(assignment), len(generator.physicians)
+    for _ in range(attempts):
+        candidate = assignment.copy()
+        first = rng.integers(n_blocks)
+        if rng.random() < 0.5:
+            second = rng.integers(n_blocks)
+            candidate[first], candidate[second] = candidate[second], candidate[first]
+        else:
+            candidate[first] = rng.integers(n_physicians)
+        if np.array_equal(candidate, assignment) or generator.violations(candidate):
+            continue
+        if max_spread_hours is not None and np.ptp(generator.workload(candidate)) / 60 > max_spread_hours:
+            continue
+        return candidate
+    return None
+
+
+def optimize_roster(scenario, seeds=(0,), iterations=50, candidates_per_iteration=32, evaluations_per_iteration=None,
+                    temperature=1.0, cooling=0.95, weights=None, min_rest_hours=8, max_spread_hours=None,
+                    min_training=16, memo_path=None, output_csv=None, max_workers=None, seed=0, verbose=True):
+    """
+    Simulated annealing over roster moves, with every candidate evaluated by simulation.
+
+    Each iteration draws candidates_per_iteration feasible neighbours of the current roster (see
+    neighbour), drops those already evaluated, screens the rest with the RidgeSurrogate (once
+    min_training rosters were simulated) and simulates the evaluations_per_iteration most
+    promising ones for every seed in a process pool. The best of them replaces the current roster
+    if it scores better, or with the Metropolis probability exp(-increase / temperature).
+    The score is the weighted sum of roster_metrics (averaged over the seeds) and the workload
+    std, see DEFAULT_WEIGHTS. All candidates use the same seeds, so they are compared under
+    common random numbers.
+
+    Parameters:
+    - scenario: scenario definition (or file); its horizon is the horizon of the rosters, so
+      short runs make for fast evaluations
+    - seeds: seeds of the simulations of each roster
+    - iterations: annealing iterations
+    - candidates_per_iteration: neighbours drawn per iteration
+    - evaluations_per_iteration: neighbours simulated per iteration (default: max_workers or the CPU count)
+    - temperature, cooling: initial temperature and its factor per iteration
+    - weights: {metric: weight} of the score
+    - min_rest_hours: see RosterGenerator
+    - max_spread_hours: largest allowed difference of worked hours between physicians (fairness), or None
+    - min_training: number of simulated rosters before the surrogate is used
+    - memo_path: JSON-lines file of evaluated rosters, reused by later runs
+    - output_csv: the best working schedule is written there whenever it improves
+    - max_workers: number of worker processes (default: number of CPUs)
+    - seed: seed of the search
+    - verbose: print the progress
+
+    Returns:
+    - {'schedule', 'score', 'metrics', 'rosters_simulated', 'simulation_runs', 'history'}, history
+      holding per iteration the current and best score and the numbers of simulated rosters and of
+      simulation runs (one per roster and seed) so far
+    """
+    if isinstance(scenario, str):
+        scenario = read_definition(scenario)
+    weights = weights or DEFAULT_WEIGHTS
+    seeds = list(seeds)
+    evaluations_per_iteration = evaluations_per_iteration or max_workers or os.cpu_count() or 1
+    rng = np.random.default_rng(seed)
+
+    er = build_simulation(scenario)
+    generator = RosterGenerator.from_simulation(er, min_rest_hours=min_rest_hours)
+    mojo = er.build_mojo_table().mean(axis=(1, 2))
+    # The memo keys cover the contents of the settings files the scenario reads (not only their paths) and the source code
+    context = cache_key(scenario, seeds) + json.dumps(weights, sort_keys=True)
+    memo = RosterMemo(memo_path)
+    surrogate = RidgeSurrogate()
+    rosters_simulated = 0
+
+    def evaluate(executor, assignments):
+        """Entries of the rosters, simulating those not in the memo."""
+        nonlocal rosters_simulated
+        schedules = [generator.to_schedule(assignment) for assignment in assignments]
+        keys = [roster_key(schedule, context) for schedule in schedules]
+        new = [i for i, key in enumerate(keys) if key not in memo]
+        futures = {(i, s): executor.submit(simulate_roster, scenario, schedules[i], s) for i in new for s in seeds}
+        for i in new:
+            runs = [futures[(i, s)].result() for s in seeds]
+            metrics = {key: float(np.mean([run[key] for run in runs])) for key in runs[0]}
+            features = roster_features(generator, assignments[i], mojo)
+            metrics['workload_std_hours'] = float(features[-1])
+            score = sum(weight * metrics.get(key, 0.0) for key, weight in weights.items())
+            memo.add(keys[i], score, metrics, features)
+            rosters_simulated += 1
+        return [memo.get(key) for key in keys]
+
+    history = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        current = generator.generate_assignment(rng)
+        current_entry = evaluate(executor, [current])[0]
+        best, best_entry = current, current_entry
+        if output_csv:
+            write_working_schedule(generator.to_schedule(best), output_csv, generator.shift_names)
+
+        for iteration in range(iterations):
+            candidates, keys = [], set()
+            for _ in range(candidates_per_iteration):
+                candidate = neighbour(generator, current, rng, max_spread_hours)
+                if candidate is None:
+                    continue
+                key = roster_key(generator.to_schedule(candidate), context)
+                if key not in keys and key not in memo:
+                    keys.add(key)
+                    candidates.append(candidate)
+            if candidates and len(memo) >= min_training:
+                entries = list(memo.entries.values())
+                surrogate.fit([entry['features'] for entry in entries], [entry['score'] for entry in entries])
+                predicted = surrogate.predict([roster_features(generator, candidate, mojo) for candidate in candidates])
+                candidates = [candidates[i] for i in np.argsort(predicted)]
+            candidates = candidates[:evaluations_per_iteration]
+
+            if candidates:
+                entries = evaluate(executor, candidates)
+                chosen = int(np.argmin([entry['score'] for entry in entries]))
+                increase = entries[chosen]['score'] - current_entry['score']
+                if increase <= 0 or rng.random() < math.exp(-increase / max(temperature, 1e-12)):
+                    current, current_entry = candidates[chosen], entries[chosen]
+                if current_entry['score'] < best_entry['score']:
+                    best, best_entry = current, current_entry
+                    if output_csv:
+                        write_working_schedule(generator.to_schedule(best), output_csv, generator.shift_names)
+            temperature *= cooling
+            history.append({'iteration': iteration, 'current': current_entry['score'], 'best': best_entry['score'],
+                            'rosters_simulated': rosters_simulated, 'simulation_runs': rosters_simulated * len(seeds)})
+            if verbose:
+                print(f"Iteration {iteration}: current {current_entry['score']:.3f}, best {best_entry['score']:.3f}, "
+                      f"{rosters_simulated} rosters simulated ({rosters_simulated * len(seeds)} runs), {len(memo)} known.")
+
+    return {'schedule': generator.to_schedule(best), 'score': best_entry['score'], 'metrics': best_entry['metrics'],
+            'rosters_simulated': rosters_simulated, 'simulation_runs': rosters_simulated * len(seeds), 'history': history}
+
+
+if __name__ == '__main__':
+    import sys
+    from er_replication import load_scenario
+    scenario = load_scenario(sys.argv[1] if len(sys.argv) > 1 else "settings/scenario_default.json")
+    scenario['simulation'] = dict(scenario['simulation'], end_datetime="2023-03-08 07:59:00")
+    result = optimize_roster(scenario, seeds=[0, 1], iterations=20, memo_path="./results/roster_memo.jsonl",
+                             output_csv="./results/working_schedule_optimized.csv")
+    print(f"Best score {result['score']:.3f}: {result['metrics']}")
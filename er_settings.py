@@ -0,0 +1,91 @@
+import os, csv, logging
+
+SETTINGS_DIR = "settings"
+
+
+def generate_patient_default_csv(filename="patient_default.csv"):
+    # Check if directory exists, if not create it
+    directory = os.path.dirname(filename)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # Check if the file already exists
+    if os.path.isfile(filename):
+        logging.info(f"{filename} already exists. Skipping...")
+        return
+
+    with open(filename, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["day", "hour", "patient_type", "boarding_blood", "disease_blood", "departure_blood", "increase_rate"])
+        days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+        hours = ["{:02d}:00-{:02d}:59".format(i, i) for i in range(24)]
+        for day in days:
+            for hour in hours:
+                writer.writerow([day, hour, "med", 30, 100, 10, 1])
+                writer.writerow([day, hour, "trauma", 50, 150, 15, 2])
+
+def generate_physician_default_csv(filename="physician_default.csv"):
+    # Check if directory exists, if not create it
+    directory = os.path.dirname(filename)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # Check if the file already exists
+    if os.path.isfile(filename):
+        logging.info(f"{filename} already exists. Skipping...")
+        return
+    
+    with open(filename, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["hour", "med", "trauma"])
+        hours = ["{:02d}:00-{:02d}:59".format(i, i) for i in range(24)]
+        for hour in hours:
+            writer.writerow([hour, 5, 7])
+
+
+def generate_ersimulation_default_csv(filename="ersimulation_default.csv"):
+    # Check if directory exists, if not create it
+    directory = os.path.dirname(filename)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # Check if the file already exists
+    if os.path.isfile(filename):
+        logging.info(f"{filename} already exists. Skipping...")
+        return
+    
+    with open(filename, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["hour", "min_patients", "max_patients"])
+        hours = ["{:02d}:00-{:02d}:59".format(i, i) for i in range(24)]
+        for hour in hours:
+            writer.writerow([hour, 5, 10])
+
+
+DEFAULT_SETTINGS = {
+    "patient_default.csv": generate_patient_default_csv,
+    "physician_default.csv": generate_physician_default_csv,
+    "ersimulation_default.csv": generate_ersimulation_default_csv,
+}
+
+
+def ensure_default_settings(directory=SETTINGS_DIR):
+    """
+    Write the default settings files that do not exist yet in `directory`.
+
+    Importing the simulation modules no longer touches the file system; scripts that rely on the
+    default settings call this once before loading them. Existing files are left untouched.
+
+    Parameters:
+    - directory: the settings directory
+
+    Returns:
+    - {file name: path} of all default settings files
+    """
+    paths = {}
+    for file_name, generate in DEFAULT_SETTINGS.items():
+        path = os.path.join(directory, file_name)
+        if not os.path.isfile(path):
+            generate(path)
+        paths[file_name] = path
+    return paths
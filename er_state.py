@@ -0,0 +1,454 @@
+import numpy as np
+
+STATUS_NAMES = ['triage', 'on-board', 'wait-depart', 'discharge', 'admission']
+STATUS_CODES = {name: code for code, name in enumerate(STATUS_NAMES)}
+TRIAGE, ON_BOARD, WAIT_DEPART, DISCHARGE, ADMISSION = range(len(STATUS_NAMES))
+
+PATIENT_TYPES = ['med', 'trauma']
+PATIENT_TYPE_CODES = {name: code for code, name in enumerate(PATIENT_TYPES)}
+
+# Clock indices used by the compiled settings tables: weekday (datetime.weekday()) and hour of day
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+HOUR_LABELS = ["{:02d}:00-{:02d}:59".format(hour, hour) for hour in range(24)]  # hour keys of the settings files
+HOUR_CODES = {label: hour for hour, label in enumerate(HOUR_LABELS)}
+
+
+class PatientTable:
+    """
+    Structure-of-arrays store for the state of the patients in the ER.
+
+    Each Patient owns one row; its blood values, underTreat, status and assigned physician are
+    read and written through properties, so the per-object API keeps working, while update()
+    applies one simulated minute to every active patient in a single vectorized pass.
+    Rows of patients who left are reused, so the arrays stay about as long as the peak census.
+    """
+    COLUMNS = {
+        'boarding_blood': np.float64,
+        'disease_blood': np.float64,
+        'departure_blood': np.float64,
+        'increase_rate': np.float64,
+        'under_treat': np.int64,
+        'status': np.int8,
+        'patient_type': np.int8,
+        'physician': np.int32,   # index of the assigned physician in ERSimulation.physicians, -1 if none
+        'need_admission': np.bool_,
+        'discharged': np.bool_,
+        'bedside_visit': np.int8,
+        'active': np.bool_,
+    }
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        for name, dtype in PatientTable.COLUMNS.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self.physician[:] = -1
+        self.patients = [None] * capacity  # Patient object of each row
+        self.physician_objects = [None] * capacity
+        self.size = 0  # rows in use are all below this high-water mark
+        self.free_rows = []
+
+    def add(self, patient):
+        """Reserve a row for `patient` and return its index."""
+        if self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            if self.size == self.capacity:
+                self._grow()
+            row = self.size
+            self.size += 1
+        for name in PatientTable.COLUMNS:
+            getattr(self, name)[row] = 0
+        self.physician[row] = -1
+        self.active[row] = True
+        self.patients[row] = patient
+        self.physician_objects[row] = None
+        return row
+
+    def release(self, patient):
+        """Free the row of a patient who left the ER; the patient keeps its values as a plain dict (see detached_values)."""
+        table, row = patient._table, patient._row
+        values = {name: getattr(table, name).item(row) for name in PatientTable.COLUMNS}
+        values['physician_object'] = table.physician_objects[row]
+        patient._table, patient._row, patient._values = None, None, values
+
+        table.active[row] = False
+        table.patients[row] = None
+        table.physician_objects[row] = None
+        table.free_rows.append(row)
+
+    @staticmethod
+    def detached_values():
+        """
+        Values of a patient outside any table (standalone, or after leaving the ER): column name -> Python value,
+        and 'physician_object'. Patient properties read and write this dict while the patient has no table.
+        """
+        values = {name: np.dtype(dtype).type(0).item() for name, dtype in PatientTable.COLUMNS.items()}
+        values['physician'] = -1
+        values['physician_object'] = None
+        return values
+
+    def _grow(self):
+        new_capacity = 2 * self.capacity
+        for name in PatientTable.COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros(new_capacity, dtype=column.dtype)
+            grown[:self.capacity] = column
+            setattr(self, name, grown)
+        self.physician[self.capacity:] = -1
+        self.patients.extend([None] * (new_capacity - self.capacity))
+        self.physician_objects.extend([None] * (new_capacity - self.capacity))
+        self.capacity = new_capacity
+
+    def update(self, elapsed_time, hour, mojo_table):
+        """
+        Advance the blood values and status of every active patient, in one vectorized pass:
+        disease blood grows, underTreat counts down, the assigned physician's mojo is taken off
+        while the patient is under treatment, and the status follows the blood values.
+
+        Parameters:
+        - elapsed_time: minutes to advance (the simulation uses 1)
+        - hour: hour of day of the current time, 0-23
+        - mojo_table: array (physician, hour, patient type) of blood reduction per minute
+
+        Returns:
+        - rows whose disease blood was reduced by their physician's mojo, with the reduction
+        - rows whose status changed or whose underTreat ran out
+        """
+        n = self.size
+        active = self.active[:n]
+        disease = self.disease_blood[:n]
+        under_treat = self.under_treat[:n]
+        status = self.status[:n]
+
+        # Disease blood keeps growing while it is positive
+        grow = active & (disease > 0)
+        disease[grow] += self.increase_rate[:n][grow] * elapsed_time
+
+        # Decrement underTreat, but not below 0
+        was_under_treat = under_treat > 0
+        np.subtract(under_treat, elapsed_time, out=under_treat, where=active & (under_treat > 0))
+        np.maximum(under_treat, 0, out=under_treat)
+
+        # The assigned physician's mojo reduces the disease blood while the patient is under treatment
+        physician = self.physician[:n]
+        reduced_rows = np.nonzero(active & (physician >= 0) & (under_treat > 0) & (disease > 0))[0]
+        blood_reduction = mojo_table[physician[reduced_rows], hour, self.patient_type[reduced_rows]] * elapsed_time
+        disease[reduced_rows] = np.maximum(0, disease[reduced_rows] - blood_reduction)
+
+        # Update the status based on blood values
+        old_status = status.copy()
+        live = active & (status != ADMISSION)
+        status[live & (self.boarding_blood[:n] <= 0)] = ON_BOARD
+        done = live & (disease <= 0)
+        status[done] = WAIT_DEPART
+        self.need_admission[:n][done] = False
+        leave = live & (self.departure_blood[:n] <= 0)
+        status[leave] = DISCHARGE
+        self.discharged[:n][leave] = True
+        self.need_admission[:n][leave] = False
+
+        changed_rows = np.nonzero((status != old_status) | (was_under_treat & (under_treat == 0)))[0]
+        return (reduced_rows, blood_reduction), changed_rows
+
+    def discharged_rows(self):
+        """Rows of active patients flagged as discharged (or admitted)."""
+        n = self.size
+        return np.nonzero(self.active[:n] & self.discharged[:n])[0]
+
+
+def table_column(name, cast):
+    """Property reading and writing one PatientTable column for the row of a Patient (or its detached values)."""
+    def fget(self):
+        table = self._table
+        if table is None:
+            return self._values[name]
+        return cast(getattr(table, name)[self._row])
+
+    def fset(self, value):
+        table = self._table
+        if table is None:
+            self._values[name] = cast(value)
+        else:
+            getattr(table, name)[self._row] = value
+    return property(fget, fset)
+
+
+class PhysicianRegistry:
+    """
+    The physicians of one simulation, with integer ids and structure-of-arrays state.
+
+    A physician's id is its position in the order of joining (Physician.index); a name -> id dict
+    makes lookups by name O(1) and keeps names unique per registry, so several simulations can
+    hold physicians of the same name in one process. Energy, fatigue, rest_tendency and the
+    current shift live in one row per physician and are read and written through properties of
+    the Physician, as PatientTable does for patients; the shift is kept as a code column and, for
+    fast reads, as a list of names. Iterating, len() and [id] give the Physicians.
+    """
+    COLUMNS = {
+        'energy': np.int64,
+        'fatigue': np.int64,
+        'rest_tendency': np.float64,
+        'shift': np.int32,  # code of the shift the physician is working (see shift_code), -1 if none
+    }
+
+    def __init__(self, capacity=16):
+        self.capacity = capacity
+        for name, dtype in PhysicianRegistry.COLUMNS.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self.shift[:] = -1
+        self.shift_types = []  # name of the current shift (or None) by id
+        self.physicians = []
+        self.ids = {}  # name -> id
+        self.shift_names = []  # shift code -> shift name
+        self.shift_codes = {}  # shift name -> shift code
+
+    def add(self, physician):
+        """Give `physician` the next id and move its state (from its previous registry) into this one."""
+        if physician.name in self.ids:
+            raise ValueError(f"The name '{physician.name}' is already in use. Please choose a different name.")
+        row = len(self.physicians)
+        if row == self.capacity:
+            self._grow()
+        previous = physician._registry
+        if previous is not None:
+            values = {name: getattr(previous, name).item(physician._row) for name in PhysicianRegistry.COLUMNS}
+            shift_type = previous.shift_types[physician._row]
+        else:
+            values, shift_type = physician._values, physician._values['shift_type']
+        for name in ['energy', 'fatigue', 'rest_tendency']:
+            getattr(self, name)[row] = values[name]
+        self.shift[row] = self.shift_code(shift_type)
+        self.shift_types.append(shift_type)
+        self.physicians.append(physician)
+        self.ids[physician.name] = row
+        physician._registry, physician._row, physician._values = self, row, None
+        return row
+
+    def _grow(self):
+        new_capacity = 2 * self.capacity
+        for name in PhysicianRegistry.COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros(new_capacity, dtype=column.dtype)
+            grown[:self.capacity] = column
+            setattr(self, name, grown)
+        self.shift[self.capacity:] = -1
+        self.capacity = new_capacity
+
+    def shift_code(self, shift_name):
+        """Code of a shift name (-1 for None), assigned on first use."""
+        if shift_name is None:
+            return -1
+        code = self.shift_codes.get(shift_name)
+        if code is None:
+            code = self.shift_codes[shift_name] = len(self.shift_names)
+            self.shift_names.append(shift_name)
+        return code
+
+    def set_shift(self, row, shift_name):
+        self.shift[row] = self.shift_code(shift_name)
+        self.shift_types[row] = shift_name
+
+    def get(self, name, default=None):
+        """The physician called `name`, or default."""
+        physician_id = self.ids.get(name)
+        return self.physicians[physician_id] if physician_id is not None else default
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def __iter__(self):
+        return iter(self.physicians)
+
+    def __len__(self):
+        return len(self.physicians)
+
+    def __getitem__(self, physician_id):
+        return self.physicians[physician_id]
+
+
+def registry_column(name, cast):
+    """
+    Property reading (as a Python number) and writing one PhysicianRegistry column for the row of a Physician,
+    or its detached values before it joins a registry.
+    """
+    def fget(self):
+        registry = self._registry
+        if registry is None:
+            return self._values[name]
+        return getattr(registry, name).item(self._row)
+
+    def fset(self, value):
+        registry = self._registry
+        if registry is None:
+            self._values[name] = cast(value)
+        else:
+            getattr(registry, name)[self._row] = value
+    return property(fget, fset)
+
+
+COUNT_KEYS = ['triage', 'on-board', 'wait-depart', 'underTreat', 'wait-admission']
+
+
+class AdmissionPool:
+    """
+    The patients waiting for a ward bed, with O(1) add and remove and O(k) random selection.
+
+    Patients are kept in a list with their positions in a dict: removal swaps the last patient
+    into the freed slot, and sample() is a partial Fisher-Yates shuffle of the first k slots.
+    The minute each patient joined is kept to measure the boarding time.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.positions = {}  # patient -> index in items
+        self.since = {}      # patient -> minute it joined the pool
+
+    def add(self, patient, minute):
+        if patient not in self.positions:
+            self.positions[patient] = len(self.items)
+            self.items.append(patient)
+            self.since[patient] = minute
+
+    def discard(self, patient):
+        position = self.positions.pop(patient, None)
+        if position is None:
+            return
+        del self.since[patient]
+        last = self.items.pop()
+        if last is not patient:
+            self.items[position] = last
+            self.positions[last] = position
+
+    def sample(self, k, stream):
+        """k distinct waiting patients drawn with the RandomStream `stream` (all of them if k >= len)."""
+        items, positions = self.items, self.positions
+        n = len(items)
+        k = min(k, n)
+        for i in range(k):
+            j = i + int(stream.random() * (n - i))
+            if j != i:
+                items[i], items[j] = items[j], items[i]
+                positions[items[i]], positions[items[j]] = i, j
+        return items[:k]
+
+    def __contains__(self, patient):
+        return patient in self.positions
+
+    def __iter__(self):
+        return iter(list(self.items))
+
+    def __len__(self):
+        return len(self.items)
+
+
+class PatientIndex:
+    """
+    Patients of each physician, with running per-status, underTreat and need_admission counters,
+    and the AdmissionPool of the patients waiting for a ward bed.
+
+    The simulation calls update() whenever it assigns, hands off, treats, admits or discharges a
+    patient, or when a patient's status or underTreat changes on its own, so per-physician
+    bookkeeping and the admission queue never need a scan over all patients. Unassigned patients
+    are kept under None.
+    """
+
+    def __init__(self):
+        self.patients = {}   # physician -> {patient: None}, in assignment order
+        self.by_status = {}  # physician -> {status: {patient: None}}, in assignment order
+        self.counts = {}     # physician -> {count key: number of patients}
+        self.counted = {}    # patient -> (physician, status, under_treat, need_admission) it is counted as
+        self.admission_pool = AdmissionPool()
+        self.minute = 0      # simulation minute, set by ERSimulation.set_clock (joining time of the admission pool)
+        self.changes = 0     # number of times a patient was counted differently, see patient_counts
+        self._patient_counts = None  # (changes, shift_rows, physicians' shifts, result) of the last patient_counts
+
+    def __contains__(self, patient):
+        return patient in self.counted
+
+    def patients_of(self, physician):
+        return self.patients.get(physician, {})
+
+    def update(self, patient, under_treat=None):
+        """
+        Re-count a patient after its state changed; patients who left the ER are dropped.
+
+        Parameters:
+        - patient: the Patient
+        - under_treat: whether to count the patient as under treatment (default: patient.underTreat > 0)
+        """
+        previous, changes = self.counted.get(patient), self.changes
+        self.remove(patient)
+        if patient.discharge_status:
+            self.admission_pool.discard(patient)
+            return
+
+        physician = patient.assigned_physician
+        if under_treat is None:
+            under_treat = patient.underTreat > 0
+        under_treat = 1 if under_treat else 0
+        need_admission = 1 if patient.need_admission else 0
+        if need_admission:
+            self.admission_pool.add(patient, self.minute)
+        else:
+            self.admission_pool.discard(patient)
+        counts = self.counts.get(physician)
+        if counts is None:
+            counts = self.counts[physician] = dict.fromkeys(COUNT_KEYS, 0)
+            self.patients[physician] = {}
+            self.by_status[physician] = {status: {} for status in COUNT_KEYS[:3]}
+        status = patient.status
+        counts[status] += 1
+        counts['underTreat'] += under_treat
+        counts['wait-admission'] += need_admission
+        self.patients[physician][patient] = None
+        self.by_status[physician][status][patient] = None
+        counted = self.counted[patient] = (physician, status, under_treat, need_admission)
+        self.changes = changes if counted == previous else changes + 1
+
+    def remove(self, patient):
+        counted = self.counted.pop(patient, None)
+        if counted is None:
+            return
+        physician, status, under_treat, need_admission = counted
+        counts = self.counts[physician]
+        counts[status] -= 1
+        counts['underTreat'] -= under_treat
+        counts['wait-admission'] -= need_admission
+        del self.patients[physician][patient]
+        del self.by_status[physician][status][patient]
+        self.changes += 1
+
+    def shift_patients(self, shift_name):
+        """Patients whose physician is currently working `shift_name`, in order of patient number."""
+        return sorted((patient for physician, patients in self.patients.items()
+                       if physician is not None and physician.shift_type == shift_name
+                       for patient in patients), key=lambda patient: patient.num)
+
+    def patient_counts(self, shift_rows):
+        """
+        Per-shift and total ER counts, with patients attributed to their physician's current shift.
+
+        Parameters:
+        - shift_rows: {shift name: row of the shift in the per-shift counts}
+
+        Returns:
+        - per-shift counts, one list in COUNT_KEYS order per shift row
+        - total ER counts, a list in COUNT_KEYS order
+        The result is reused (not copied) while no patient is counted differently and no physician changed shift.
+        """
+        # Physicians without patients count nothing
+        physicians = [physician for physician, patients in self.patients.items() if patients]
+        shifts = [physician.shift_type if physician else None for physician in physicians]
+        cached = self._patient_counts
+        if cached is not None and cached[0] == self.changes and cached[1] is shift_rows and cached[2] == shifts:
+            return cached[3]
+        shift_counts = [[0] * len(COUNT_KEYS) for _ in shift_rows]
+        total_counts = [0] * len(COUNT_KEYS)
+        for physician, assigned_shift in zip(physicians, shifts):
+            values = self.counts[physician].values()  # in COUNT_KEYS order, see update
+            total_counts = [total + count for total, count in zip(total_counts, values)]
+            if assigned_shift:
+                row = shift_rows[assigned_shift]
+                shift_counts[row] = [total + count for total, count in zip(shift_counts[row], values)]
+        self._patient_counts = (self.changes, shift_rows, shifts, (shift_counts, total_counts))
+        return shift_counts, total_counts
@@ -0,0 +1,119 @@
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+from er_state import PATIENT_TYPES, PATIENT_TYPE_CODES
+
+SUMMARY_METRICS = ['new_arrivals', 'handoffs_received', 'handoffs_given', 'discharges', 'admissions']
+NEW_ARRIVALS, HANDOFFS_RECEIVED, HANDOFFS_GIVEN, DISCHARGES, ADMISSIONS = range(len(SUMMARY_METRICS))
+
+
+class ShiftSummary:
+    """
+    Streaming version of ERSimulation.generate_summary.
+
+    Every shift instance of the working schedule (a date and shift, with its physician) has a
+    window from its start to one minute after its end, both inclusive. Each patient record is
+    added once, when record_patient_process writes it, to the counters of the instances of the
+    physicians it concerns whose window holds its timestamp, found through a per-physician
+    interval index. rows() then gives the same table as the former scan over all records.
+
+    Parameters:
+    - working_schedule: {date: {shift name: physician name}}
+    - shift_types: the simulation's ShiftTypes
+    - start_datetime: the simulation start, minute 0
+    """
+
+    def __init__(self, working_schedule, shift_types, start_datetime):
+        self.start_datetime = start_datetime
+        shifts = {shift.name: shift for shift in shift_types}
+        self.instances = []  # (shift name, physician name, window start, window end)
+        self.counts = []     # per instance: [total, med, trauma] counters, each a list over SUMMARY_METRICS
+        by_physician = {}
+        for date, daily_schedule in working_schedule.items():
+            for shift_name, physician_name in daily_schedule.items():
+                shift = shifts.get(shift_name)
+                if shift is None:
+                    continue
+                window_start = datetime.combine(date, shift.start_time)
+                window_end = datetime.combine(date + timedelta(days=shift.end_day_offset), shift.end_time) + timedelta(minutes=1)
+                instance = len(self.instances)
+                self.instances.append((shift_name, physician_name, window_start, window_end))
+                self.counts.append([[0] * len(SUMMARY_METRICS) for _ in range(1 + len(PATIENT_TYPES))])
+                by_physician.setdefault(physician_name, []).append((self.to_minute(window_start), self.to_minute(window_end), instance))
+
+        # Interval index: per physician, windows sorted by start
+        self.index = {}
+        self.max_window = 0
+        for physician_name, windows in by_physician.items():
+            windows.sort()
+            self.index[physician_name] = ([start for start, _, _ in windows], windows)
+            self.max_window = max([self.max_window] + [end - start for start, end, _ in windows])
+
+    def to_minute(self, timestamp):
+        return int((timestamp - self.start_datetime).total_seconds() // 60)
+
+    def instances_at(self, physician_name, minute):
+        """Instances of `physician_name` whose window holds `minute`."""
+        entry = self.index.get(physician_name)
+        if entry is None:
+            return []
+        starts, windows = entry
+        found = []
+        i = bisect_right(starts, minute) - 1
+        while i >= 0 and starts[i] >= minute - self.max_window:
+            if windows[i][1] >= minute:
+                found.append(windows[i][2])
+            i -= 1
+        return found
+
+    def add_record(self, minute, patient_type, physician_name, status, arrival, first=True, previous_name=None):
+        """
+        Count one patient record.
+
+        Parameters:
+        - minute: minute index of the record's Timestamp
+        - patient_type, physician_name, status: the record's Patient_type, Assigned_physician and Status
+        - arrival: whether the record's Timestamp is the patient's Arrival_time
+        - first: whether this is the patient's first record
+        - previous_name: Assigned_physician of the patient's previous record
+        """
+        type_row = 1 + PATIENT_TYPE_CODES[patient_type]
+        for instance in self.instances_at(physician_name, minute):
+            for counters in (self.counts[instance][0], self.counts[instance][type_row]):
+                if arrival and status == 'triage':
+                    counters[NEW_ARRIVALS] += 1
+                if not first and previous_name != physician_name:
+                    counters[HANDOFFS_RECEIVED] += 1
+                if status == 'discharge':
+                    counters[DISCHARGES] += 1
+                elif status == 'admission':
+                    counters[ADMISSIONS] += 1
+        if not first and previous_name != physician_name:
+            for instance in self.instances_at(previous_name, minute):
+                for counters in (self.counts[instance][0], self.counts[instance][type_row]):
+                    counters[HANDOFFS_GIVEN] += 1
+
+    def add_patient_records(self, records):
+        """Count all records of one patient (e.g. when rebuilding from patient_records)."""
+        for i, record in enumerate(records):
+            self.add_record(self.to_minute(record['Timestamp']), record['Patient_type'], record['Assigned_physician'], record['Status'],
+                            record['Arrival_time'] == record['Timestamp'], first=i == 0,
+                            previous_name=records[i - 1]['Assigned_physician'] if i else None)
+
+    def rows(self):
+        summary = []
+        for (shift_name, physician_name, window_start, window_end), counts in zip(self.instances, self.counts):
+            for key, counters in zip(['total', *PATIENT_TYPES], counts):
+                summary.append({
+                    'Type': key,  # 'total' or patient type
+                    'Shift Type': shift_name,
+                    'Physician Name': physician_name,
+                    'Shift Start Timing': window_start,
+                    'Shift End Timing': window_end,
+                    'New Arrival Patients': counters[NEW_ARRIVALS],
+                    'Handoff Patients Received': counters[HANDOFFS_RECEIVED],
+                    'Handoff Patients Given': counters[HANDOFFS_GIVEN],
+                    'Discharged Patients': counters[DISCHARGES],
+                    'Admitted Patients': counters[ADMISSIONS]
+                })
+        return summary
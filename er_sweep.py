@@ -0,0 +1,205 @@
+import copy, glob, hashlib, itertools, json, os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from er_replication import DEFAULT_SCENARIO, load_scenario, read_definition, run_replication, replication_seeds, summarize_replications
+
+SOURCE_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'er_*.py')  # the simulation modules
+SCENARIO_FILES = ['simulation.csv_file_path', 'simulation.admission_csv_path', 'patient_defaults', 'working_schedule', 'arrival_trace']
+
+
+def get_path(scenario, path):
+    """Value at a dotted path; list items are addressed by their 'name' (e.g. 'shift_types.c.new_patient')."""
+    value = scenario
+    for key in path.split('.'):
+        if isinstance(value, list):
+            value = next((item for item in value if item.get('name') == key), None)
+        else:
+            value = value.get(key)
+        if value is None:
+            return None
+    return value
+
+
+def set_path(scenario, path, value):
+    """
+    Set the value at a dotted path (see get_path) in place. A value of None removes the entry;
+    a missing named list item is appended (e.g. 'shift_types.d' with the definition of shift d).
+    """
+    *parents, last = path.split('.')
+    container = scenario
+    for key in parents:
+        if isinstance(container, list):
+            container = next(item for item in container if item.get('name') == key)
+        else:
+            container = container.setdefault(key, {})
+    if isinstance(container, list):
+        index = next((i for i, item in enumerate(container) if item.get('name') == last), None)
+        if value is None:
+            if index is not None:
+                del container[index]
+        elif index is None:
+            container.append(dict(value, name=last))
+        else:
+            container[index] = dict(value, name=last)
+    elif value is None:
+        container.pop(last, None)
+    else:
+        container[last] = value
+
+
+def apply_overrides(scenario, overrides):
+    """A copy of `scenario` with {dotted path: value} overrides applied in order."""
+    scenario = copy.deepcopy(scenario)
+    for path, value in overrides.items():
+        set_path(scenario, path, value)
+    return scenario
+
+
+def expand_sweep(sweep):
+    """
+    The cells of a sweep: every variant combined with every point of the parameter grid.
+
+    Parameters:
+    - sweep: dict with
+      - 'scenario': base scenario (dict or file, default DEFAULT_SCENARIO)
+      - 'variants': {variant name: overrides} of alternative configurations (default: one 'base' variant)
+      - 'grid': {dotted path: list of values}, crossed with each other and with the variants
+
+    Returns:
+    - list of (cell, scenario), cell being {'variant': name, path: value, ...}
+    """
+    base = sweep.get('scenario', DEFAULT_SCENARIO)
+    if isinstance(base, str):
+        base = load_scenario(base)
+    variants = sweep.get('variants') or {'base': {}}
+    grid = sweep.get('grid', {})
+    cells = []
+    for variant_name, overrides in variants.items():
+        variant = apply_overrides(base, overrides)
+        for values in itertools.product(*grid.values()):
+            point = dict(zip(grid, values))
+            scenario = apply_overrides(variant, point)
+            scenario['name'] = '_'.join([variant_name] + [f"{path.split('.')[-1]}={value}" for path, value in point.items()])
+            cells.append(({'variant': variant_name, **point}, scenario))
+    return cells
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    for file_path in sorted(glob.glob(os.path.join(path, '*.csv'))) if os.path.isdir(path) else [path]:
+        with open(file_path, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+_source_digest = None
+
+
+def source_digest():
+    """Hash of the simulation's source modules (SOURCE_FILES), so that a code change makes cached results stale."""
+    global _source_digest
+    if _source_digest is None:
+        digest = hashlib.sha256()
+        for path in sorted(glob.glob(SOURCE_FILES)):
+            with open(path, 'rb') as file:
+                digest.update(os.path.basename(path).encode() + b'\0' + file.read())
+        _source_digest = digest.hexdigest()
+    return _source_digest
+
+
+def cache_key(scenario, seed):
+    """
+    Hash of everything a replication's result depends on: the scenario, the contents of the
+    settings files it reads, the seed and the simulation's source code (see source_digest).
+    """
+    paths = [get_path(scenario, path) for path in SCENARIO_FILES] + [scenario.get('physicians_dir')]
+    paths += [entry.get('csv') for entry in scenario.get('physicians') or [] if isinstance(entry, dict)]
+    files = {path: file_digest(path) for path in paths if path and os.path.exists(path)}
+    content = {'scenario': {key: value for key, value in scenario.items() if key != 'name'},
+               'files': files, 'seed': seed, 'source': source_digest()}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def cache_path(cache_dir, key):
+    return os.path.join(cache_dir, key[:2], f"{key}.json")
+
+
+def read_cached(cache_dir, key):
+    path = cache_path(cache_dir, key)
+    if not os.path.isfile(path):
+        return None
+    with open(path, mode='r') as file:
+        return json.load(file)['metrics']
+
+
+def write_cached(cache_dir, key, cell, metrics):
+    path = cache_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', mode='w') as file:
+        json.dump({'cell': cell, 'metrics': metrics}, file, default=str)
+    os.replace(path + '.tmp', path)
+
+
+def run_sweep(sweep, cache_dir="./results/sweep_cache", max_workers=None, export_dir=None, verbose=True):
+    """
+    Run every cell of a sweep for its replications in a process pool, reusing the results of
+    (scenario, seed) pairs already in the on-disk cache, so re-running a sweep only computes new cells.
+
+    Parameters:
+    - sweep: sweep definition (see expand_sweep), or a JSON/YAML file holding one, with optionally
+      'replications' (default 5) and 'base_seed' (default 0); all cells use the same seeds. With
+      'crn': true every cell also gets its name as crn_key, so the cells share the arrivals, patients
+      and ward-bed releases of a seed but not the physician behaviour (see compare_scenarios)
+    - cache_dir: directory of the cached results, one JSON file per (scenario, seed)
+    - max_workers: number of worker processes (default: number of CPUs)
+    - export_dir: if given, computed replications also export their results, see run_replication
+    - verbose: print the progress
+
+    Returns:
+    - list of {cell..., 'replication', metrics...}, in cell and replication order
+    """
+    if isinstance(sweep, str):
+        sweep = read_definition(sweep)
+    seeds = replication_seeds(sweep.get('replications', 5), sweep.get('base_seed', 0))
+    jobs = []
+    for cell, scenario in expand_sweep(sweep):
+        if sweep.get('crn'):
+            scenario['crn_key'] = scenario['name']
+        for replication, seed in enumerate(seeds):
+            jobs.append((cell, scenario, replication, seed, cache_key(scenario, seed)))
+
+    results = {job[4]: read_cached(cache_dir, job[4]) for job in jobs}
+    missing = {job[4]: job for job in jobs if results[job[4]] is None}
+    if verbose:
+        print(f"{len(jobs)} replications, {len(jobs) - len(missing)} cached, {len(missing)} to run.")
+    if missing:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(run_replication, scenario, seed, export_dir, replication): key
+                       for key, (cell, scenario, replication, seed, _) in missing.items()}
+            for done, future in enumerate(as_completed(futures), start=1):
+                key = futures[future]
+                results[key] = future.result()
+                write_cached(cache_dir, key, missing[key][0], results[key])
+                if verbose:
+                    print(f"{done}/{len(missing)} {missing[key][1]['name']} replication {missing[key][2]}")
+
+    return [{**cell, 'replication': replication, **results[key]} for cell, _, replication, _, key in jobs]
+
+
+def summarize_sweep(rows):
+    """{cell (as a tuple of (key, value) pairs): summarize_replications of its replications}"""
+    cells = {}
+    for row in rows:
+        cell = tuple((key, json.dumps(value) if isinstance(value, (list, dict)) else value)
+                     for key, value in row.items() if key == 'variant' or '.' in key)
+        cells.setdefault(cell, []).append({key: value for key, value in row.items()
+                                           if key != 'replication' and key != 'variant' and '.' not in key})
+    return {cell: summarize_replications(cell_rows) for cell, cell_rows in cells.items()}
+
+
+if __name__ == '__main__':
+    import sys
+    rows = run_sweep(sys.argv[1] if len(sys.argv) > 1 else "settings/sweep_example.json")
+    for cell, stats in summarize_sweep(rows).items():
+        print(dict(cell), {key: f"{stats[key]['mean']:.2f} ± {stats[key]['ci_half_width']:.2f}"
+                           for key in ['mean_wait_minutes', 'mean_on-board', 'admissions']})
@@ -0,0 +1,137 @@
+import os
+import numpy as np
+
+# Kinds of traced events
+TRACE_KINDS = [
+    'arrival',           # patient arrived; physician it was assigned to (-1 if none), value = patient type code
+    'visit',             # physician at the patient's bedside this minute
+    'rest',              # physician without a patient this minute
+    'treat-boarding',    # value = boarding blood reduction
+    'treat-disease',     # value = disease blood reduction
+    'treat-departure',   # value = departure blood reduction
+    'blood-reduced',     # passive disease blood reduction by the assigned physician, value = reduction
+    'handoff',           # patient handed to a physician of the next shift, value = shift index
+    'shift-end',         # value = shift index
+    'admission',         # patient admitted to the ward
+    'discharge',         # patient left the ER
+]
+TRACE_KIND_CODES = {name: code for code, name in enumerate(TRACE_KINDS)}
+
+TRACE_DTYPE = np.dtype([
+    ('minute', np.int32),     # minutes since start_datetime
+    ('kind', np.uint8),       # index in TRACE_KINDS
+    ('physician', np.int16),  # index in ERSimulation.physicians, -1 if none
+    ('patient', np.int32),    # patient number, -1 if none
+    ('value', np.float32),
+])
+
+
+class EventTrace:
+    """
+    Structured event sink for simulation runs that need a trace.
+
+    Events are fixed-size records (see TRACE_DTYPE) written into a preallocated buffer. When the
+    buffer is full it is flushed as one chunk: appended as raw records to `path`, or kept in
+    memory if no path is given. Nothing is formatted as text; load() reads a trace file back.
+
+    Parameters:
+    - path: binary file the chunks are appended to (None keeps them in memory)
+    - chunk_size: number of events buffered between flushes
+    """
+
+    def __init__(self, path=None, chunk_size=65536):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.buffer = np.zeros(chunk_size, dtype=TRACE_DTYPE)
+        self.size = 0
+        self.flushed = 0  # events written to `path`
+        self.chunks = []
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            open(path, 'wb').close()
+
+    def record(self, minute, kind, physician=-1, patient=-1, value=0.0):
+        """Add one event; `kind` is a TRACE_KIND_CODES code."""
+        if self.size == self.chunk_size:
+            self.flush()
+        self.buffer[self.size] = (minute, kind, physician, patient, value)
+        self.size += 1
+
+    def record_many(self, minute, kind, physicians, patients, values):
+        """Add events of one kind and minute from equal-length arrays."""
+        n = len(patients)
+        start = 0
+        while start < n:
+            if self.size == self.chunk_size:
+                self.flush()
+            count = min(n - start, self.chunk_size - self.size)
+            chunk = self.buffer[self.size:self.size + count]
+            chunk['minute'] = minute
+            chunk['kind'] = kind
+            chunk['physician'] = physicians[start:start + count]
+            chunk['patient'] = patients[start:start + count]
+            chunk['value'] = values[start:start + count]
+            self.size += count
+            start += count
+
+    def flush(self):
+        if not self.size:
+            return
+        if self.path:
+            with open(self.path, 'ab') as file:
+                self.buffer[:self.size].tofile(file)
+            self.flushed += self.size
+        else:
+            self.chunks.append(self.buffer[:self.size].copy())
+        self.size = 0
+
+    def close(self):
+        self.flush()
+
+    def truncate(self):
+        """Cut the trace file back to the events flushed by this object (e.g. after restoring a checkpoint)."""
+        if self.path:
+            with open(self.path, 'ab') as file:
+                file.truncate(self.flushed * TRACE_DTYPE.itemsize)
+
+    def __getstate__(self):
+        # Snapshots keep only the buffered events
+        state = self.__dict__.copy()
+        state['buffer'] = self.buffer[:self.size]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        buffer = self.buffer
+        self.buffer = np.zeros(self.chunk_size, dtype=TRACE_DTYPE)
+        self.buffer[:self.size] = buffer
+
+    def events(self):
+        """All events recorded so far, as one structured array."""
+        self.flush()
+        if self.path:
+            return EventTrace.load(self.path)
+        return np.concatenate(self.chunks) if self.chunks else np.zeros(0, dtype=TRACE_DTYPE)
+
+    @staticmethod
+    def load(path):
+        return np.fromfile(path, dtype=TRACE_DTYPE)
+
+    def to_dataframe(self, er=None):
+        """
+        Events as a DataFrame with readable kinds.
+
+        Parameters:
+        - er: the simulation, to add Timestamp and physician name columns
+        """
+        import pandas as pd
+        events = self.events()
+        df = pd.DataFrame({name: events[name] for name in TRACE_DTYPE.names})
+        df['kind'] = np.array(TRACE_KINDS)[events['kind']]
+        if er is not None:
+            df.insert(0, 'Timestamp', er.start_datetime + pd.to_timedelta(events['minute'], unit='min'))
+            names = np.array([physician.name for physician in er.physicians] + [None], dtype=object)
+            df['physician'] = names[events['physician']]
+        return df
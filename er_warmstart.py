@@ -0,0 +1,218 @@
+from datetime import timedelta
+from types import SimpleNamespace
+import numpy as np
+
+from er_class import Patient
+from er_state import COUNT_KEYS
+
+# Columns of a census: one entry per patient in the ER at the census minute
+CENSUS_COLUMNS = {
+    'patient_type': str,
+    'status': str,
+    'boarding_blood': float,
+    'disease_blood': float,
+    'departure_blood': float,
+    'increase_rate': float,
+    'under_treat': int,
+    'need_admission': bool,
+    'shift': str,           # shift the assigned physician was working, '' if none
+    'arrival_offset': int,  # minutes between arrival and the census minute
+}
+
+
+def census_from_simulation(er):
+    """
+    The patients in the ER at the simulation's current minute, as a census.
+
+    Works on a finished or stopped run and on a restored checkpoint of either engine; the event-driven
+    engine's lazily updated patients are evaluated at the current minute without changing them.
+
+    Returns:
+    - {column: array} (see CENSUS_COLUMNS), plus 'minute_of_day' of the census minute
+    """
+    minute = er.current_minute
+    lazy = getattr(er, '_events', None) is not None
+    patients = list(er._active.values()) if lazy else list(er.patients)
+    columns = {column: [] for column in CENSUS_COLUMNS}
+    for patient in patients:
+        if patient.discharge_status:
+            continue
+        status, need_admission = patient.status, patient.need_admission
+        disease_blood, under_treat = patient.disease_blood, patient.underTreat
+        if lazy:
+            disease_blood, zero_minute = er.evolve_disease_blood(patient, minute)
+            disease_blood = 0 if zero_minute is not None else disease_blood
+            under_treat = er.under_treat_at(patient, minute)
+            if disease_blood <= 0 and status != 'admission':
+                status, need_admission = 'wait-depart', False
+        physician = patient.assigned_physician
+        columns['patient_type'].append(patient.patient_type)
+        columns['status'].append(status)
+        columns['boarding_blood'].append(patient.boarding_blood)
+        columns['disease_blood'].append(disease_blood)
+        columns['departure_blood'].append(patient.departure_blood)
+        columns['increase_rate'].append(patient.disease_increase_rate)
+        columns['under_treat'].append(under_treat)
+        columns['need_admission'].append(need_admission)
+        columns['shift'].append((physician.shift_type or '') if physician is not None else '')
+        columns['arrival_offset'].append(int((er.current_time - patient.arrival_time).total_seconds() // 60))
+    census = {column: np.array(values, dtype=CENSUS_COLUMNS[column]) for column, values in columns.items()}
+    census['minute_of_day'] = (er.current_time.hour * 60 + er.current_time.minute)
+    return census
+
+
+def census_from_checkpoint(path):
+    """Census of the simulation state saved in a checkpoint file."""
+    from er_checkpoint import load_checkpoint
+    return census_from_simulation(load_checkpoint(path))
+
+
+def save_census(path, censuses):
+    """
+    Save censuses (e.g. of many checkpoints past the warm-up) as one steady-state pool (.npz).
+
+    Parameters:
+    - path: output file
+    - censuses: list of censuses, see census_from_simulation
+    """
+    sizes = [len(census['status']) for census in censuses]
+    pool = {column: np.concatenate([census[column] for census in censuses]) if censuses else np.array([], dtype=dtype)
+            for column, dtype in CENSUS_COLUMNS.items()}
+    pool['sample'] = np.repeat(np.arange(len(censuses)), sizes)
+    pool['sample_minute_of_day'] = np.array([census['minute_of_day'] for census in censuses], dtype=int)
+    np.savez_compressed(path, **pool)
+
+
+def load_census(path):
+    """The censuses of a pool saved by save_census, as a list."""
+    with np.load(path) as pool:
+        columns = {column: pool[column] for column in pool.files}
+    censuses = []
+    for sample, minute_of_day in enumerate(columns['sample_minute_of_day']):
+        rows = columns['sample'] == sample
+        census = {column: columns[column][rows] for column in CENSUS_COLUMNS}
+        census['minute_of_day'] = int(minute_of_day)
+        censuses.append(census)
+    return censuses
+
+
+def draw_census(er, censuses, match_time=True):
+    """
+    Draw one census of a pool with the simulation's census stream.
+
+    Whole censuses are drawn, so the number of patients and the mix of their states stay as observed.
+    With match_time, only censuses taken at the simulation's start time of day are drawn from (if any).
+    """
+    if match_time:
+        minute_of_day = er.current_time.hour * 60 + er.current_time.minute
+        candidates = [census for census in censuses if census['minute_of_day'] == minute_of_day]
+        censuses = candidates or censuses
+    return er.rng.census.choice(censuses)
+
+
+def seed_census(er, census):
+    """
+    Put the patients of a census into a simulation before start(), so the run begins with a
+    realistic ER instead of an empty one.
+
+    Each patient keeps its state and is assigned to the physician working its shift at the current
+    minute; if that shift is not on duty, to the physician of an on-duty shift taking its patient
+    type, or to no physician if there is none. The draws (of the shift, and of the initial values the
+    census then overwrites) come from the census stream, so the arrivals that follow are those of a
+    run without a warm start.
+    Call after the physicians, shift types and working schedule are set up.
+
+    Returns:
+    - the new Patients
+    """
+    roster = er.compile_roster()
+    minute = er.current_minute
+    shifts = {shift.name: shift for shift in er.shift_types}
+    stream = er.rng.census
+    seeded = []
+    for row in range(len(census['status'])):
+        patient_type = str(census['patient_type'][row])
+        arrival_time = er.current_time - timedelta(minutes=int(census['arrival_offset'][row]))
+        # Patient draws its initial values from rng.patients; here they come from the census stream
+        patient = Patient(arrival_time, patient_type, table=er.patient_table, num=er.next_patient_num(),
+                          rng=SimpleNamespace(patients=stream), defaults=er.patient_defaults)
+        patient.status = str(census['status'][row])
+        patient.boarding_blood = float(census['boarding_blood'][row])
+        patient.disease_blood = float(census['disease_blood'][row])
+        patient.departure_blood = float(census['departure_blood'][row])
+        patient.disease_increase_rate = float(census['increase_rate'][row])
+        patient.underTreat = int(census['under_treat'][row])
+        patient.need_admission = bool(census['need_admission'][row])
+
+        shift = shifts.get(str(census['shift'][row]))
+        physician = roster.shift_physician(minute, shift) if shift is not None else None
+        if physician is None:
+            candidates = [shift for shift in er.shift_types
+                          if patient_type in shift.recieve_patient_type and roster.shift_physician(minute, shift) is not None]
+            shift = stream.choice(candidates) if candidates else None
+            physician = roster.shift_physician(minute, shift) if shift is not None else None
+        if physician is not None:
+            physician.shift_type = shift.name
+        patient.assigned_physician = physician
+
+        er.patients.append(patient)
+        er.record_patient_process(patient)
+        er.patient_index.update(patient)
+        seeded.append(patient)
+    if er.verbose:
+        er.log(f"Seeded {len(seeded)} patients at {er.current_time}.")
+    return seeded
+
+
+def mser_truncation(values, batch_size=5, max_fraction=0.5):
+    """
+    Warm-up length by the MSER-5 rule: the number of leading observations whose removal minimizes
+    the marginal standard error of the remaining mean, searched over batch means of batch_size.
+
+    Parameters:
+    - values: output series, or an array (replications, observations) whose mean over the
+      replications is used
+    - batch_size: observations per batch (5 for MSER-5)
+    - max_fraction: largest part of the series that may be cut off (truncation points beyond
+      it are not trusted)
+
+    Returns:
+    - number of observations to discard
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim > 1:
+        values = values.mean(axis=0)
+    n_batches = len(values) // batch_size
+    if n_batches < 2:
+        return 0
+    batches = values[:n_batches * batch_size].reshape(n_batches, batch_size).mean(axis=1)
+    # Sum and sum of squares of the batches d.., for every truncation point d
+    tail_sum = np.cumsum(batches[::-1])[::-1]
+    tail_squares = np.cumsum((batches ** 2)[::-1])[::-1]
+    remaining = n_batches - np.arange(n_batches)
+    mser = np.maximum(tail_squares - tail_sum ** 2 / remaining, 0) / remaining ** 2
+    limit = max(1, int(n_batches * max_fraction))
+    return int(np.argmin(mser[:limit])) * batch_size
+
+
+def warmup_minutes(simulations, keys=COUNT_KEYS, batch_size=5):
+    """
+    Burn-in of finished runs, per count of total_er_records, by MSER (see mser_truncation).
+
+    Parameters:
+    - simulations: a finished simulation, or several replications of one scenario (averaged)
+    - keys: count keys to examine
+
+    Returns:
+    - {key: minutes since the start to discard}, with 'max' the longest of them
+    """
+    if not isinstance(simulations, (list, tuple)):
+        simulations = [simulations]
+    length = min(len(er.total_er_records) for er in simulations)
+    first_minute = int(simulations[0].total_er_records.minutes[0]) if length else 0
+    warmup = {}
+    for key in keys:
+        series = np.array([er.total_er_records.column(key)[:length] for er in simulations])
+        warmup[key] = first_minute + mser_truncation(series, batch_size) if length else 0
+    warmup['max'] = max(warmup.values()) if warmup else 0
+    return warmup
@@ -1,16 +1,69 @@
+import os
 import pandas as pd
-import numpy as np
+from er_calibration import read_chunks
 
-# Read in the data
-# df = pd.read_csv('../data_ehr548/C548_15_PATIENTTRIAGE.txt', sep='\t')
-
-df = pd.read_pickle('../data_ehr548/vs_supervise_20221019_b.pdpkl')
-
-selected = ['PERSONID2', 'ACCOUNTIDSE2', 'ACCOUNTSEQNO', 'ASSIGNAREA',  'TRIAGE', 
+SELECTED = ['PERSONID2', 'ACCOUNTIDSE2', 'ACCOUNTSEQNO', 'ASSIGNAREA',  'TRIAGE', 
             's_TRIAGEDATETIME', 's_REGISTERDATETIME',
        's_DIAGNOSISDATETIME', 's_ALLOWDISCHARGEDATETIME',
        's_DISCHARGEDATETIME', 's_HOSPITALCODE',
        's_DEPTCODE', 's_disposition',]
 
-df2 = df[selected]
-df2.to_csv('../data_ehr548/c548_T0_ERSim.csv', index=False)
\ No newline at end of file
+
+def pickle_to_parquet(source, output=None, chunksize=500000):
+    """
+    One-time conversion of a pandas pickle EHR export to Parquet, so later steps read only the
+    columns they need, chunk by chunk (see er_calibration.read_chunks).
+
+    A pickle cannot be read in parts: this step loads it whole once, then writes every column as
+    strings in row groups of chunksize rows. An output newer than the pickle is kept as is.
+
+    Returns:
+    - the Parquet path (default: the pickle's path with a .parquet extension)
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    output = output or os.path.splitext(source)[0] + '.parquet'
+    if os.path.exists(output) and os.path.getmtime(output) >= os.path.getmtime(source):
+        return output
+    frame = pd.read_pickle(source)
+    frame.columns = [str(column) for column in frame.columns]
+    schema = pa.schema([(column, pa.string()) for column in frame.columns])
+    partial = output + '.partial'
+    with pq.ParquetWriter(partial, schema) as writer:
+        for start in range(0, len(frame), chunksize):
+            chunk = frame.iloc[start:start + chunksize].astype('string')
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    os.replace(partial, output)
+    return output
+
+
+def extract_ehr_columns(source, output, columns=SELECTED, chunksize=500000, sep='\t'):
+    """
+    Copy the selected columns of an EHR export to a CSV (or Parquet, if output ends in .parquet).
+
+    Text exports (e.g. the tab-separated C548_15_PATIENTTRIAGE.txt) and Parquet files are read
+    chunk by chunk with only the selected columns; a pandas pickle is first converted to Parquet
+    next to it (see pickle_to_parquet).
+    """
+    if source.endswith('.pdpkl') or source.endswith('.pkl'):
+        source = pickle_to_parquet(source, chunksize=chunksize)
+    chunks = read_chunks(source, columns, chunksize, sep)
+
+    if output.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([(column, pa.string()) for column in columns])
+        with pq.ParquetWriter(output, schema) as writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pandas(chunk[columns].astype('string'), schema=schema, preserve_index=False))
+        return
+
+    for i, chunk in enumerate(chunks):
+        chunk[columns].to_csv(output, index=False, mode='w' if i == 0 else 'a', header=i == 0)
+
+
+if __name__ == '__main__':
+    # Read in the data
+    # extract_ehr_columns('../data_ehr548/C548_15_PATIENTTRIAGE.txt', '../data_ehr548/c548_T0_ERSim.parquet')
+    # The pickle is converted to ../data_ehr548/vs_supervise_20221019_b.parquet on the first run only
+    extract_ehr_columns('../data_ehr548/vs_supervise_20221019_b.pdpkl', '../data_ehr548/c548_T0_ERSim.parquet')
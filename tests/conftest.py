@@ -0,0 +1,22 @@
+import os, sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True, scope='session')
+def repo_root():
+    # Scenario paths (settings/, playGround/) are relative to the repository root
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    yield
+    os.chdir(cwd)
+
+
+def run_quietly(er):
+    import contextlib
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        er.start()
+    return er
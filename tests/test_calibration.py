@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from er_arrivals import build_arrival_trace, read_arrival_trace
+from er_calibration import EHR_DATETIME_FORMAT, calibrate_from_ehr
+from er_state import PATIENT_TYPE_CODES
+
+
+def synthetic_extract(path, rows=5000, seed=3, departments=('MED', 'SURG')):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2022-01-01T00:00')
+    triage = start + rng.integers(0, 60 * 24 * 90, rows).astype('timedelta64[m]')
+    discharge = triage + rng.integers(30, 60 * 24, rows).astype('timedelta64[m]')
+    extract = pd.DataFrame({
+        's_TRIAGEDATETIME': pd.to_datetime(triage).strftime(EHR_DATETIME_FORMAT),
+        's_DISCHARGEDATETIME': pd.to_datetime(discharge).strftime(EHR_DATETIME_FORMAT),
+        's_disposition': rng.choice(['admission', 'discharge', 'transfer'], rows, p=[0.2, 0.7, 0.1]),
+        's_DEPTCODE': rng.choice(list(departments), rows),
+    })
+    extract.to_csv(path, index=False)
+    return extract
+
+
+def test_streaming_calibration_matches_pandas_pivot(tmp_path):
+    extract = synthetic_extract(tmp_path / "ehr.csv")
+    ersimulation_csv, admission_csv = str(tmp_path / "ersimulation.csv"), str(tmp_path / "admission.csv")
+    calibrate_from_ehr(str(tmp_path / "ehr.csv"), ersimulation_csv, admission_csv, chunksize=700)
+
+    # The calibration as it was computed before streaming: a pivot of the whole extract
+    triage = pd.to_datetime(extract['s_TRIAGEDATETIME'])
+    pivot = extract.groupby([triage.dt.date, triage.dt.hour]).size().unstack()
+    arrivals = pd.read_csv(ersimulation_csv)
+    np.testing.assert_allclose(arrivals['mean'], pivot.mean().reindex(range(24)))
+    np.testing.assert_allclose(arrivals['std'], pivot.std().reindex(range(24)))
+
+    admitted = extract[extract['s_disposition'] == 'admission']
+    discharge = pd.to_datetime(admitted['s_DISCHARGEDATETIME'])
+    counts = admitted.groupby([discharge.dt.date, discharge.dt.dayofweek, discharge.dt.hour]).size()
+    stats = counts.groupby(level=[1, 2]).agg(['mean', 'std'])
+    admissions = pd.read_csv(admission_csv)
+    assert len(admissions) == len(stats)
+    np.testing.assert_allclose(admissions['Mean'], stats['mean'])
+    np.testing.assert_allclose(admissions['Std'], stats['std'])
+
+
+def test_arrival_trace_maps_surgery_and_trauma_departments_to_trauma(tmp_path):
+    extract = synthetic_extract(tmp_path / "ehr.csv", departments=('MED', 'SURG', 'DTRA'))
+    assert build_arrival_trace(str(tmp_path / "ehr.csv"), str(tmp_path / "arrivals.bin"), chunksize=700) == len(extract)
+
+    minutes, codes = read_arrival_trace(str(tmp_path / "arrivals.bin"))
+    triage = pd.to_datetime(extract['s_TRIAGEDATETIME']).to_numpy(dtype='datetime64[m]').astype(np.int64)
+    order = np.argsort(triage, kind='stable')
+    expected = np.where(extract['s_DEPTCODE'].isin(['SURG', 'DTRA']), PATIENT_TYPE_CODES['trauma'], PATIENT_TYPE_CODES['med'])
+    np.testing.assert_array_equal(minutes, triage[order])
+    np.testing.assert_array_equal(codes, expected[order])
@@ -0,0 +1,60 @@
+import glob
+
+import pytest
+
+from conftest import run_quietly
+from er_checkpoint import load_checkpoint
+from er_profile import INSTRUMENTED, PHASES
+from test_simulation import one_day
+
+
+def wrapped_methods(er):
+    return [name for name in INSTRUMENTED if name in er.__dict__]
+
+
+@pytest.mark.parametrize('engine', ['stepped', 'event'])
+def test_profiled_run_fills_report_and_removes_wrappers(engine):
+    er = one_day(engine, seed=9)
+    er.set_profiling()
+    run_quietly(er)
+
+    report = er.profile_report
+    assert report['minutes'] == er.current_minute and report['wall_seconds'] > 0
+    assert set(report['phases']) == set(PHASES) and sum(phase['calls'] for phase in report['phases'].values()) > 0
+    counters = report['counters']
+    assert counters['arrivals'] == er.patient_counter
+    assert counters['admissions'] == len(er.admission_records)
+    assert counters['physician_rows_recorded'] == er.physician_records.size
+    assert counters['count_rows_recorded'] == len(er.total_er_records)
+    assert wrapped_methods(er) == []
+
+
+@pytest.mark.parametrize('engine', ['stepped', 'event'])
+def test_wrappers_are_removed_when_start_raises(engine):
+    er = one_day(engine, seed=9)
+    er.set_profiling()
+    er.set_checkpoints('unused.ckpt', every=60)
+
+    def fail():
+        raise RuntimeError("stopped")
+    er.checkpoint_if_due = fail
+    with pytest.raises(RuntimeError, match="stopped"):
+        run_quietly(er)
+
+    assert er.profiler.wrapped == [] and er.profile_report is not None
+    assert [name for name in wrapped_methods(er) if name != 'checkpoint_if_due'] == []
+
+
+@pytest.mark.parametrize('engine', ['stepped', 'event'])
+def test_checkpoint_taken_while_profiling_restores(engine, tmp_path):
+    er = one_day(engine, seed=9)
+    er.set_profiling()
+    er.set_checkpoints(str(tmp_path / "er_{minute:06d}.ckpt"), every=480)
+    run_quietly(er)
+
+    resumed = load_checkpoint(sorted(glob.glob(str(tmp_path / "er_*.ckpt")))[0])
+    assert wrapped_methods(resumed) == [] and resumed.profiler.wrapped == []
+    resumed.set_checkpoints(None, None)
+    run_quietly(resumed)
+    assert resumed.current_minute == er.current_minute
+    assert resumed.profile_report['minutes'] > 0
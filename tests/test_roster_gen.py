@@ -0,0 +1,44 @@
+import copy
+
+import numpy as np
+import pytest
+
+from er_replication import DEFAULT_SCENARIO, build_simulation
+from er_roster_gen import RosterGenerator
+
+
+@pytest.fixture(scope='module')
+def generator():
+    scenario = copy.deepcopy(DEFAULT_SCENARIO)
+    scenario['simulation']['end_datetime'] = "2023-03-08 07:59:00"
+    return RosterGenerator.from_simulation(build_simulation(scenario))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_generated_rosters_have_no_violations(generator, seed):
+    assignment = generator.generate_assignment(np.random.default_rng(seed))
+    assert generator.violations(assignment) == 0
+
+
+def test_one_physician_on_every_block_violates_rest(generator):
+    assert generator.violations(np.zeros(len(generator.block_start), dtype=np.int64)) > 0
+
+
+def test_optimize_roster_memo_simulates_no_roster_twice(tmp_path):
+    import json
+    from er_roster_opt import optimize_roster
+
+    scenario = copy.deepcopy(DEFAULT_SCENARIO)
+    scenario['simulation']['end_datetime'] = "2023-03-01 11:59:00"
+    memo_path = str(tmp_path / "memo.jsonl")
+    options = dict(iterations=1, candidates_per_iteration=3, evaluations_per_iteration=3, min_training=100,
+                   memo_path=memo_path, max_workers=1, verbose=False)
+    first = optimize_roster(scenario, **options)
+    assert first['rosters_simulated'] > 1
+
+    # The same search again: the initial roster and every candidate are in the memo
+    second = optimize_roster(scenario, **options)
+    assert second['rosters_simulated'] == 0 and second['simulation_runs'] == 0
+    with open(memo_path) as file:
+        keys = [json.loads(line)['key'] for line in file]
+    assert len(keys) == len(set(keys)) == first['rosters_simulated']
@@ -0,0 +1,136 @@
+import copy, glob, hashlib, os
+
+import numpy as np
+import pytest
+
+from conftest import run_quietly
+from er_checkpoint import load_checkpoint
+from er_replication import DEFAULT_SCENARIO, build_simulation
+
+
+def one_day(engine='stepped', seed=2024, days=1):
+    scenario = copy.deepcopy(DEFAULT_SCENARIO)
+    scenario['engine'] = engine
+    scenario['simulation']['end_datetime'] = f"2023-03-{1 + days:02d} 07:59:00"
+    return build_simulation(scenario, seed)
+
+
+def counts_of(er):
+    ter = er.total_er_records
+    return np.asarray(ter.counts[:ter.size], dtype=np.int64)
+
+
+def physician_values(er):
+    return np.asarray(er.physician_records.values[:er.physician_records.size])
+
+
+def test_seeded_stepped_run_matches_reference():
+    """The stepped engine's output of a fixed seed does not drift."""
+    er = run_quietly(one_day())
+    counts = counts_of(er)
+    physicians = physician_values(er).astype(np.int64)
+    chart = sorted((record['Patient_num'], str(record['Timestamp']), record['Status'], record['Assigned_physician'])
+                   for record in er.generate_patient_chart())
+    assert len(er.patient_records) == 245
+    assert sum(status == 'admission' for _, _, status, _ in chart) == 49
+    assert counts[59::60, 3].tolist() == [5, 9, 20, 10, 6, 3, 7, 2, 10, 9, 11, 12, 7, 9, 10, 7, 9, 6, 3, 0, 2, 1, 0]
+    assert hashlib.sha256(counts.tobytes()).hexdigest() == "e4d2d1388e9f27801f22bd771db041df0804052867577d0b0acdcd6e0c8030db"
+    assert hashlib.sha256(physicians.tobytes()).hexdigest() == "e42acb88870946908286b744ba4d543c3cd965f81e2a040997eccdb7562f2aa1"
+    assert hashlib.sha256(repr(chart).encode()).hexdigest() == "8cb15b91a699b5a4c8276d4932f9080f03881314ad1b6772aa392c28b47840fb"
+
+
+
+def test_event_engine_matches_stepped_engine_over_seeds():
+    """
+    Both engines simulate the same model, but a seeded event-driven run does not replay the stepped
+    run of that seed: the stepped engine draws the next status of every on-duty physician every
+    minute, also of one without patients (who can only rest), while the event-driven engine only
+    draws when a physician chooses among its patients. The physician stream, and every visit choice
+    after the first idle minute, therefore differ. Arrivals (counts, types and blood values) and
+    ward-bed releases come from their own streams and are the same, so the patient count matches
+    per seed. Admissions and the mean census of each status are compared over seeds: their mean
+    paired difference must stay within 3 standard errors. The admission queue runs close to
+    saturation, so its length varies a lot between seeds and one-week means of a few seeds can
+    differ by 15% without any bias.
+    """
+    seeds = range(6)
+    metrics = {}
+    for engine in ['stepped', 'event']:
+        rows = []
+        for seed in seeds:
+            er = run_quietly(one_day(engine, seed=seed, days=3))
+            counts = counts_of(er)
+            rows.append([len(er.patient_records), len(er.admission_records), *counts.mean(axis=0)])
+        metrics[engine] = np.array(rows, dtype=float)
+
+    stepped, event = metrics['stepped'], metrics['event']
+    assert np.array_equal(event[:, 0], stepped[:, 0])
+    differences = event[:, 1:] - stepped[:, 1:]
+    standard_errors = differences.std(axis=0, ddof=1) / np.sqrt(len(seeds))
+    assert np.all(np.abs(differences.mean(axis=0)) <= 3 * standard_errors)
+
+
+@pytest.mark.parametrize('engine', ['stepped', 'event'])
+def test_checkpoint_resume_matches_uninterrupted_run(engine, tmp_path):
+    full = run_quietly(one_day(engine, seed=7))
+
+    er = one_day(engine, seed=7)
+    er.set_checkpoints(str(tmp_path / "er_{minute:06d}.ckpt"), every=480)
+    run_quietly(er)
+    first = sorted(glob.glob(str(tmp_path / "er_*.ckpt")))[0]
+    resumed = load_checkpoint(first)
+    resumed.set_checkpoints(None, None)
+    run_quietly(resumed)
+
+    assert list(resumed.patient_records.items()) == list(full.patient_records.items())
+    assert list(resumed.admission_records) == list(full.admission_records)
+    assert np.array_equal(counts_of(resumed), counts_of(full))
+    np.testing.assert_allclose(physician_values(resumed), physician_values(full))
+
+
+def test_spilled_history_matches_in_memory(tmp_path):
+    in_memory = run_quietly(one_day(seed=11))
+    spilled = one_day(seed=11)
+    spilled.set_history_spill(str(tmp_path / "history.bin"), chunk_size=64)
+    run_quietly(spilled)
+
+    # Spilled histories come back in the order the patients left, so the mappings are compared as dicts
+    assert dict(spilled.patient_records.items()) == dict(in_memory.patient_records.items())
+    assert len(spilled.patient_records) == len(in_memory.patient_records)
+    assert list(spilled.admission_records) == list(in_memory.admission_records)
+    assert os.path.getsize(tmp_path / "history.bin") > 0
+
+
+
+@pytest.mark.parametrize('engine', ['stepped', 'event'])
+def test_seeded_census_patients_are_counted_and_discharged(engine):
+    from er_warmstart import census_from_simulation, draw_census, seed_census
+
+    census = census_from_simulation(run_quietly(one_day(engine, seed=3)))
+    er = one_day(engine, seed=4, days=2)
+    seeded = seed_census(er, draw_census(er, [census]))
+    counts = er.patient_index.counts.values()
+    assert sum(count[status] for count in counts for status in ('triage', 'on-board', 'wait-depart')) == len(seeded) > 0
+    run_quietly(er)
+
+    assert all(patient.num in er.patient_records.finished for patient in seeded)
+    # The census stream leaves the arrivals of the run (and their initial values) as they are without a warm start
+    cold = run_quietly(one_day(engine, seed=4, days=2))
+    def initial(simulation, num):
+        return {key: value for key, value in simulation.patient_records[num][0].items() if key.startswith('Initial')}
+
+    assert len(er.patient_records) == len(cold.patient_records) + len(seeded)
+    assert [initial(er, num + len(seeded)) for num in range(1, 21)] == [initial(cold, num) for num in range(1, 21)]
+
+def test_export_writes_excel_summary(tmp_path):
+    pytest.importorskip('pyarrow')
+    pytest.importorskip('openpyxl')
+    import pandas as pd
+    from er_export import export_results
+
+    er = run_quietly(one_day(seed=5))
+    paths = export_results(er, str(tmp_path), excel_summary=True)
+
+    summary = pd.DataFrame(er.generate_summary())
+    pd.testing.assert_frame_equal(pd.read_excel(paths['summary_physician.xlsx']), summary, check_dtype=False)
+    pd.testing.assert_frame_equal(pd.read_parquet(paths['summary_physician']), summary, check_dtype=False)